@@ -0,0 +1,52 @@
+"""
+Counter tables updated in place.
+
+A counter table has a ``count`` column and ``KEY_FIELDS`` naming the
+columns that identify a row. ``add_counts`` applies many deltas with one
+UPDATE per batch of keys, creating the rows that do not exist yet.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+
+# Bounds the size of the CASE expression in one UPDATE.
+KEYS_PER_UPDATE = 500
+
+
+def add_counts(model, deltas):
+    """Add ``deltas`` (``{key tuple: delta}``) to ``model.count``.
+
+    Keys are tuples of ``model.KEY_FIELDS`` values. Existing rows are changed
+    by one UPDATE per batch of keys; rows that do not exist yet are created
+    first.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    keys = list(deltas)
+    for start in range(0, len(keys), KEYS_PER_UPDATE):
+        batch = keys[start:start + KEYS_PER_UPDATE]
+        if _update_counts(model, batch, deltas) < len(batch):
+            lookup = reduce(or_, (_matches(model, key) for key in batch))
+            existing = set(model.objects.filter(lookup).values_list(*model.KEY_FIELDS))
+            missing = [key for key in batch if key not in existing]
+            model.objects.bulk_create(
+                [model(**dict(zip(model.KEY_FIELDS, key))) for key in missing], ignore_conflicts=True
+            )
+            _update_counts(model, missing, deltas)
+
+
+def _matches(model, key):
+    return Q(**dict(zip(model.KEY_FIELDS, key)))
+
+
+def _update_counts(model, keys, deltas):
+    if not keys:
+        return 0
+    return model.objects.filter(reduce(or_, (_matches(model, key) for key in keys))).update(
+        count=F('count') + Case(
+            *[When(_matches(model, key), then=Value(deltas[key])) for key in keys],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
@@ -54,10 +54,14 @@ INSTALLED_APPS = [
     'tags',
     'comments',
     'newsletter',
+    'monitoring',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'monitoring.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'monitoring.middleware.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -202,6 +206,8 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_EXPOSE_HEADERS = ['x-profile-id']
+
 CORS_ALLOW_HEADERS = [
     'accept',
     'accept-encoding',
@@ -212,6 +218,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-profile',
 ]
 
 # Email Configuration
@@ -223,6 +230,47 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Newsletters are sent as one message per subscriber, in chunks, over this
+# many SMTP connections that stay open for the whole send.
+NEWSLETTER_SEND_CONNECTIONS = config('NEWSLETTER_SEND_CONNECTIONS', default=4, cast=int)
+NEWSLETTER_CHUNK_SIZE = config('NEWSLETTER_CHUNK_SIZE', default=100, cast=int)
+
+# Newsletter messages are interleaved by recipient domain. Each domain gets
+# at most NEWSLETTER_DOMAIN_RATE messages a second (after a burst of
+# NEWSLETTER_DOMAIN_BURST) and NEWSLETTER_DOMAIN_CONCURRENCY at a time; 0 is
+# unlimited. A domain that answers "try again later" is paused for
+# NEWSLETTER_DOMAIN_BACKOFF seconds. NEWSLETTER_DOMAIN_LIMITS overrides the
+# limits of single domains, e.g. {'gmail.com': {'rate': 50, 'concurrency': 4}}.
+NEWSLETTER_DOMAIN_RATE = config('NEWSLETTER_DOMAIN_RATE', default=20.0, cast=float)
+NEWSLETTER_DOMAIN_BURST = config('NEWSLETTER_DOMAIN_BURST', default=40, cast=int)
+NEWSLETTER_DOMAIN_CONCURRENCY = config('NEWSLETTER_DOMAIN_CONCURRENCY', default=2, cast=int)
+NEWSLETTER_DOMAIN_BACKOFF = config('NEWSLETTER_DOMAIN_BACKOFF', default=60, cast=int)
+NEWSLETTER_DOMAIN_LIMITS = {}
+
+# Public subscription checks are answered from a per-process Bloom filter of
+# active subscribers with this false positive rate, rebuilt at least every
+# NEWSLETTER_LOOKUP_MAX_AGE seconds. Answers that needed a query are cached
+# for NEWSLETTER_LOOKUP_ANSWER_TTL seconds. Processes learn of each other's
+# subscribes and unsubscribes through the default cache, so this needs a cache
+# shared by every worker (e.g. Redis); with the local-memory cache every
+# check queries the database. Set NEWSLETTER_LOOKUP_SHARED_CACHE to use the
+# filter with a local-memory cache anyway, when there is a single process.
+NEWSLETTER_LOOKUP_ERROR_RATE = config('NEWSLETTER_LOOKUP_ERROR_RATE', default=0.01, cast=float)
+NEWSLETTER_LOOKUP_MAX_AGE = config('NEWSLETTER_LOOKUP_MAX_AGE', default=3600, cast=int)
+NEWSLETTER_LOOKUP_ANSWER_TTL = config('NEWSLETTER_LOOKUP_ANSWER_TTL', default=300, cast=int)
+NEWSLETTER_LOOKUP_SHARED_CACHE = config('NEWSLETTER_LOOKUP_SHARED_CACHE', default=False, cast=bool)
+
+# Background jobs, run by `manage.py run_worker`. A running job whose worker
+# stops extending its lock for JOBS_VISIBILITY_TIMEOUT seconds is run again.
+# Failed jobs are retried after JOBS_RETRY_DELAY seconds, doubling with each
+# attempt up to JOBS_RETRY_MAX_DELAY, until JOBS_MAX_ATTEMPTS.
+JOBS_CONCURRENCY = config('JOBS_CONCURRENCY', default=4, cast=int)
+JOBS_POLL_INTERVAL = config('JOBS_POLL_INTERVAL', default=1.0, cast=float)
+JOBS_VISIBILITY_TIMEOUT = config('JOBS_VISIBILITY_TIMEOUT', default=60, cast=int)
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', default=5, cast=int)
+JOBS_RETRY_DELAY = config('JOBS_RETRY_DELAY', default=10, cast=int)
+JOBS_RETRY_MAX_DELAY = config('JOBS_RETRY_MAX_DELAY', default=3600, cast=int)
+
 # Security Settings
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
@@ -237,12 +285,80 @@ SESSION_COOKIE_SECURE = not DEBUG
 CSRF_COOKIE_HTTPONLY = True
 SESSION_COOKIE_HTTPONLY = True
 
+# Comment spam rules: a comment is spam once the weights of the rules it
+# matches add up to the threshold. Processes reload changed rules at once
+# through the cache, or after SPAM_RULES_MAX_AGE seconds at the latest.
+SPAM_SCORE_THRESHOLD = config('SPAM_SCORE_THRESHOLD', default=2.0, cast=float)
+SPAM_RULES_MAX_AGE = config('SPAM_RULES_MAX_AGE', default=60, cast=int)
+
+# Naive Bayes classifier trained from moderation decisions. It flags new
+# comments only once both classes have SPAM_CLASSIFIER_MIN_DOCUMENTS examples.
+SPAM_CLASSIFIER_THRESHOLD = config('SPAM_CLASSIFIER_THRESHOLD', default=0.99, cast=float)
+SPAM_CLASSIFIER_MIN_DOCUMENTS = config('SPAM_CLASSIFIER_MIN_DOCUMENTS', default=20, cast=int)
+SPAM_CLASSIFIER_MAX_AGE = config('SPAM_CLASSIFIER_MAX_AGE', default=300, cast=int)
+
+# Near-duplicate detection: new comments at least NEAR_DUPLICATE_SIMILARITY
+# similar (MinHash estimate of the Jaccard similarity of their word pairs) to
+# spam, or to NEAR_DUPLICATE_LIMIT recent comments, are spam.
+NEAR_DUPLICATE_WINDOW_DAYS = config('NEAR_DUPLICATE_WINDOW_DAYS', default=7, cast=int)
+NEAR_DUPLICATE_SIMILARITY = config('NEAR_DUPLICATE_SIMILARITY', default=0.7, cast=float)
+NEAR_DUPLICATE_LIMIT = config('NEAR_DUPLICATE_LIMIT', default=5, cast=int)
+# Fingerprints older than the window are pruned in the background, at most
+# this often (seconds).
+NEAR_DUPLICATE_PRUNE_INTERVAL = config('NEAR_DUPLICATE_PRUNE_INTERVAL', default=3600, cast=int)
+
+# Moderation queue: claimed comments stay with a moderator this long.
+MODERATION_LEASE_SECONDS = config('MODERATION_LEASE_SECONDS', default=300, cast=int)
+
+# Live comment streams (Server-Sent Events, served over ASGI). The local
+# broker reaches subscribers in the same process only.
+COMMENT_STREAM_BROKER = 'comments.live.LocalBroker'
+COMMENT_STREAM_HEARTBEAT = config('COMMENT_STREAM_HEARTBEAT', default=15, cast=int)
+# Streams are opened with a single-use ticket, valid this many seconds.
+COMMENT_STREAM_TICKET_SECONDS = config('COMMENT_STREAM_TICKET_SECONDS', default=30, cast=int)
+
 # Rate Limiting
 RATELIMIT_ENABLE = True
 
+# Reverse proxies in front of the app that append to X-Forwarded-For. Client
+# addresses are only read from that header when this is set; otherwise
+# REMOTE_ADDR is used and the header, which clients can forge, is ignored.
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', default=0, cast=int)
+
+# Sliding-window velocity limits on new comments, per client IP, /24 subnet,
+# user and normalized content. Over the limit, 'reject' answers 429 and
+# 'hold' stores the comment as spam for review.
+COMMENT_VELOCITY_RULES = {
+    'ip': {'limit': 20, 'window': 60, 'action': 'reject'},
+    'subnet': {'limit': 60, 'window': 60, 'action': 'hold'},
+    'user': {'limit': 30, 'window': 3600, 'action': 'hold'},
+    'content': {'limit': 3, 'window': 3600, 'action': 'hold'},
+}
+
+# Cache (the monitoring backends count hits and misses)
+CACHES = {
+    'default': {
+        'BACKEND': 'monitoring.cache.LocMemCache',
+    }
+}
+
+# Metrics: set METRICS_DIR to a directory shared by all worker processes
+# (emptied on startup) so that /api/monitoring/metrics/ covers every worker.
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=1.0, cast=float)
+# Scrapers send METRICS_TOKEN as a bearer token. Without it only Admins can
+# read the metrics.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# On-demand request profiling (triggered by Admins with X-Profile or ?profile=1)
+PROFILING_MAX_STORED = config('PROFILING_MAX_STORED', default=200, cast=int)
+
 # Frontend URL for newsletter links
 FRONTEND_URL = config('FRONTEND_URL', default='http://localhost:3000')
 
+# Public URL of this API, for one-click unsubscribe links in newsletters
+BACKEND_URL = config('BACKEND_URL', default='http://localhost:8000')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,317 @@
+"""
+Shared fixtures for the per-endpoint performance regression tests.
+
+Every app's ``tests.py`` declares a table of endpoint cases. Each case is run
+under a role against a seeded dataset and must issue exactly the expected
+number of queries. Serializer time is measured on the side and compared with
+``blog_system/perf_baseline.json``; a slowdown past ``SLOWDOWN_TOLERANCE``
+fails the case. Timings are stored relative to a fixed calibration workload so
+that the baseline carries over between machines of different speeds.
+
+Set ``PERF_UPDATE_BASELINE=1`` to rewrite the baseline entries for the cases
+that ran, or ``PERF_SKIP_TIMING=1`` on machines that are not comparable with
+the one the baseline was recorded on.
+"""
+import gc
+import json
+import os
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIClient, APITestCase
+
+User = get_user_model()
+
+BASELINE_PATH = Path(settings.BASE_DIR) / 'blog_system' / 'perf_baseline.json'
+
+# A case fails when it is more than 20% slower than its baseline. Timings
+# below NOISE_FLOOR units are dominated by noise, so their allowance is 20% of
+# the floor rather than of the timing itself.
+SLOWDOWN_TOLERANCE = 0.20
+NOISE_FLOOR = 0.25
+
+# Serializer time is the best of several rounds to keep the check stable, and
+# a case that looks slow is re-measured before it is reported.
+TIMING_ROUNDS = 7
+TIMING_RETRIES = 3
+
+ROLES = ('anonymous', 'viewer', 'editor', 'admin')
+
+SEED_PASSWORD = 'perf-pass-1234'
+
+
+class EndpointCase(namedtuple('EndpointCase', 'name method path role status queries data')):
+    """A single endpoint/role combination and its expected behaviour."""
+
+    @property
+    def key(self):
+        return f'{self.method} {self.name} [{self.role}]'
+
+
+def case(name, method, path, role, status, queries, data=None):
+    return EndpointCase(name, method, path, role, status, queries, data)
+
+
+def expand_cases(expected):
+    """One case per role from ``{name: (method, path, data, {role: (status, queries)})}``."""
+    return [
+        case(name, method, path, role, *results[role], data=data)
+        for name, (method, path, data, results) in expected.items()
+        for role in ROLES
+    ]
+
+
+def seed_performance_data():
+    """Create a small but realistic dataset shared by all endpoint cases."""
+    from blogs.models import Blog
+    from categories.models import Category
+    from comments.models import Comment
+    from newsletter.models import NewsletterSubscriber
+    from tags.models import Tag
+
+    users = {
+        'admin': User.objects.create_user(
+            email='admin@perf.test', name='Perf Admin', password=SEED_PASSWORD,
+            role='Admin', is_staff=True
+        ),
+        'editor': User.objects.create_user(
+            email='editor@perf.test', name='Perf Editor', password=SEED_PASSWORD, role='Editor'
+        ),
+        'viewer': User.objects.create_user(
+            email='viewer@perf.test', name='Perf Viewer', password=SEED_PASSWORD, role='Viewer'
+        ),
+    }
+    other_editor = User.objects.create_user(
+        email='writer@perf.test', name='Perf Writer', password=SEED_PASSWORD, role='Editor'
+    )
+
+    categories = [
+        Category.objects.create(name=name)
+        for name in ('Engineering', 'Design', 'Culture')
+    ]
+    tags = [
+        Tag.objects.create(name=name)
+        for name in ('python', 'django', 'performance', 'databases', 'frontend', 'testing')
+    ]
+
+    paragraph = (
+        '<p>Profiling a request end to end shows where the time goes: database '
+        'round trips, serialization and template rendering all add up quickly.</p>'
+    )
+    now = timezone.now()
+    blogs = []
+    for index in range(30):
+        author = users['editor'] if index % 3 == 0 else other_editor
+        blog = Blog.objects.create(
+            title=f'Performance notes part {index + 1}',
+            content=paragraph * (5 + index % 7),
+            category=categories[index % len(categories)],
+            author=author,
+            status='draft' if index % 6 == 5 else 'published',
+            meta_description='Notes from the performance working group.',
+            created_at=now - timedelta(days=index),
+        )
+        blog.tags.set([tags[index % len(tags)], tags[(index + 1) % len(tags)]])
+        blogs.append(blog)
+
+    comments = []
+    commenters = [users['viewer'], users['editor'], other_editor]
+    for index in range(40):
+        comments.append(Comment.objects.create(
+            blog=blogs[index % 4],
+            user=commenters[index % len(commenters)],
+            content=f'Thanks for sharing these measurements, comment number {index}.',
+            status=('approved', 'approved', 'pending', 'spam')[index % 4],
+            ip_address=f'10.0.0.{index % 8}',
+            user_agent='perf-suite',
+        ))
+
+    # Threads on the first blog: replies to two approved comments, one level
+    # deeper under the first reply, and a pending reply.
+    replies = []
+    for index in range(6):
+        parent = replies[0] if index == 5 else comments[(index % 2) * 4]
+        replies.append(Comment.objects.create(
+            blog=blogs[0],
+            parent=parent,
+            user=commenters[(index + 1) % len(commenters)],
+            content=f'Replying with our own numbers, reply number {index}.',
+            status='pending' if index == 4 else 'approved',
+            ip_address=f'10.0.1.{index}',
+            user_agent='perf-suite',
+        ))
+
+    subscribers = [
+        NewsletterSubscriber.objects.create(email=f'reader{index}@perf.test', is_active=index % 5 != 0)
+        for index in range(30)
+    ]
+
+    return {
+        'users': users,
+        'other_editor': other_editor,
+        'categories': categories,
+        'tags': tags,
+        'blogs': blogs,
+        'comments': comments,
+        'replies': replies,
+        'subscribers': subscribers,
+    }
+
+
+def calibration_ms(repeats=60):
+    """Time a fixed CPU-bound workload, used as the unit for stored timings."""
+    payload = [{'id': index, 'title': f'Post {index}', 'tags': ['a', 'b']} for index in range(200)]
+    best = float('inf')
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            json.loads(json.dumps(payload))
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best * 1000
+
+
+@contextmanager
+def serializer_timer():
+    """Collect the time spent producing top-level ``serializer.data``."""
+    timings = []
+    original = BaseSerializer.data
+
+    def timed(serializer):
+        start = time.perf_counter()
+        try:
+            return original.fget(serializer)
+        finally:
+            timings.append(time.perf_counter() - start)
+
+    with mock.patch.object(BaseSerializer, 'data', property(timed)):
+        yield timings
+
+
+def load_baseline():
+    if not BASELINE_PATH.exists():
+        return {}
+    with open(BASELINE_PATH) as handle:
+        return json.load(handle)
+
+
+def save_baseline(recorded):
+    baseline = load_baseline()
+    baseline.update(recorded)
+    with open(BASELINE_PATH, 'w') as handle:
+        json.dump(dict(sorted(baseline.items())), handle, indent=2)
+        handle.write('\n')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointPerformanceTestCase(APITestCase):
+    """Runs ``cases`` and checks query counts and serializer time for each."""
+
+    cases = ()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.recorded_timings = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.environ.get('PERF_UPDATE_BASELINE') and cls.recorded_timings:
+            save_baseline(cls.recorded_timings)
+        super().tearDownClass()
+
+    def get_cases(self):
+        """Return the endpoint cases; override to build paths from seeded data."""
+        return self.cases
+
+    def client_for(self, role):
+        client = APIClient()
+        if role != 'anonymous':
+            # Reload so that in-memory changes from earlier cases do not leak.
+            client.force_authenticate(User.objects.get(pk=self.data['users'][role].pk))
+        return client
+
+    def run_case(self, endpoint):
+        """Run ``endpoint`` once, rolling back any writes it makes."""
+        from comments.classifier import get_classifier
+        from comments.spam import get_spam_filter
+        from newsletter.lookup import get_lookup_filter
+
+        client = self.client_for(endpoint.role)
+        cache.clear()
+        # Per-process caches are loaded outside the measured block.
+        get_spam_filter()
+        get_classifier()
+        get_lookup_filter()
+        # Like timeit, keep garbage collection pauses out of the measurement.
+        gc.disable()
+        try:
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries, serializer_timer() as timings:
+                    response = client.generic(
+                        endpoint.method,
+                        endpoint.path,
+                        data=json.dumps(endpoint.data) if endpoint.data is not None else '',
+                        content_type='application/json',
+                    )
+                transaction.set_rollback(True)
+        finally:
+            gc.enable()
+        return response, len(queries), sum(timings) * 1000
+
+    def measure(self, endpoint, elapsed_ms):
+        """Best-of-``TIMING_ROUNDS`` serializer time in calibration units."""
+        for _ in range(TIMING_ROUNDS - 1):
+            elapsed_ms = min(elapsed_ms, self.run_case(endpoint)[2])
+        return elapsed_ms / calibration_ms()
+
+    def test_query_counts_and_serializer_time(self):
+        skip_timing = bool(os.environ.get('PERF_SKIP_TIMING'))
+        baseline = load_baseline()
+
+        for endpoint in self.get_cases():
+            with self.subTest(endpoint.key):
+                response, query_count, elapsed_ms = self.run_case(endpoint)
+                self.assertEqual(response.status_code, endpoint.status, getattr(response, 'data', None))
+                self.assertEqual(
+                    query_count, endpoint.queries,
+                    f'{endpoint.key} issued {query_count} queries, expected {endpoint.queries}'
+                )
+
+                if not elapsed_ms:
+                    continue
+                relative = self.measure(endpoint, elapsed_ms)
+                allowed = None
+                if not skip_timing and endpoint.key in baseline:
+                    allowed = baseline[endpoint.key] + max(baseline[endpoint.key], NOISE_FLOOR) * SLOWDOWN_TOLERANCE
+                    # A real regression survives re-measurement; scheduler noise does not.
+                    for _ in range(TIMING_RETRIES):
+                        if relative <= allowed:
+                            break
+                        relative = min(relative, self.measure(endpoint, elapsed_ms))
+                self.recorded_timings[endpoint.key] = round(relative, 3)
+
+                if allowed is not None:
+                    self.assertLessEqual(
+                        relative, allowed,
+                        f'{endpoint.key} serializer time {relative:.3f} units exceeds baseline '
+                        f'{baseline[endpoint.key]:.3f} by more than {SLOWDOWN_TOLERANCE:.0%}'
+                    )
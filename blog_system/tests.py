@@ -0,0 +1,7 @@
+from .testing import EndpointPerformanceTestCase, ROLES, case
+
+
+class ApiRootPerformanceTests(EndpointPerformanceTestCase):
+    """Query-count regression tests for the project-level endpoints"""
+
+    cases = [case('api-root', 'GET', '/', role, 200, 0) for role in ROLES]
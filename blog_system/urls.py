@@ -35,6 +35,7 @@ def api_root(request):
             'blogs': '/api/blogs/',
             'comments': '/api/comments/',
             'newsletter': '/api/newsletter/',
+            'monitoring': '/api/monitoring/',
         }
     })
 
@@ -49,6 +50,7 @@ urlpatterns = [
     path('api/blogs/', include('blogs.urls')),
     path('api/comments/', include('comments.urls')),
     path('api/newsletter/', include('newsletter.urls')),
+    path('api/monitoring/', include('monitoring.urls')),
 ]
 
 # Serve media files during development
@@ -10,6 +10,9 @@ import bleach
 class Blog(models.Model):
     """Blog model with SEO features and content management."""
     
+    # Maintained with F() updates by comments.signals; see save().
+    COUNTER_FIELDS = ('approved_comment_count', 'pending_comment_count')
+    
     STATUS_CHOICES = [
         ('draft', 'Draft'),
         ('published', 'Published'),
@@ -30,6 +33,10 @@ class Blog(models.Model):
     meta_description = models.CharField(max_length=160, blank=True, help_text='SEO description (max 160 chars)')
     image_alt_text = models.CharField(max_length=125, blank=True, help_text='Alt text for featured image')
     
+    # Denormalized comment counts
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    pending_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    
     # Timestamps
     published_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
@@ -83,6 +90,13 @@ class Blog(models.Model):
         if not self.meta_title:
             self.meta_title = self.title[:60]
         
+        # Never write back a possibly stale copy of the comment counters.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        
         super().save(*args, **kwargs)
     
     @property
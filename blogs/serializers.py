@@ -22,7 +22,7 @@ class BlogListSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'slug', 'content', 'featured_image',
             'author', 'category', 'tags', 'status', 'reading_time',
-            'published_at', 'created_at', 'updated_at'
+            'approved_comment_count', 'published_at', 'created_at', 'updated_at'
         ]
         read_only_fields = ['slug', 'published_at', 'created_at', 'updated_at']
 
@@ -40,8 +40,9 @@ class BlogDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'slug', 'content', 'featured_image',
             'author', 'category', 'tags', 'status', 'meta_title',
-            'meta_description', 'image_alt_text', 'reading_time',
-            'is_published', 'published_at', 'created_at', 'updated_at'
+            'meta_description', 'image_alt_text', 'reading_time', 'is_published',
+            'approved_comment_count', 'pending_comment_count',
+            'published_at', 'created_at', 'updated_at'
         ]
         read_only_fields = ['slug', 'published_at', 'created_at', 'updated_at']
 
@@ -1,3 +1,49 @@
-from django.test import TestCase
+from blog_system.testing import EndpointPerformanceTestCase, expand_cases
 
-# Create your tests here.
+
+class BlogEndpointPerformanceTests(EndpointPerformanceTestCase):
+    """Query-count and serializer-time regression tests for the blogs API"""
+
+    def get_cases(self):
+        slug = self.data['blogs'][0].slug
+        new_blog = {
+            'title': 'Measuring query counts in CI',
+            'content': 'Counting queries per endpoint catches N+1 regressions before they ship. ' * 3,
+            'category_id': self.data['categories'][0].id,
+            'tag_ids': [tag.id for tag in self.data['tags'][:2]],
+            'status': 'draft',
+        }
+        expected = {
+            # name: method, path, data, {role: (status, queries)}
+            'blogs:blog-list': ('GET', '/api/blogs/', None, {
+                'anonymous': (401, 0), 'viewer': (200, 3), 'editor': (200, 3), 'admin': (200, 3),
+            }),
+            'blogs:blog-list (search)': ('GET', '/api/blogs/?search=profiling&ordering=title', None, {
+                'anonymous': (401, 0), 'viewer': (200, 3), 'editor': (200, 3), 'admin': (200, 3),
+            }),
+            'blogs:blog-create': ('POST', '/api/blogs/create/', new_blog, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (201, 9), 'admin': (201, 9),
+            }),
+            'blogs:blog-detail': ('GET', f'/api/blogs/{slug}/', None, {
+                'anonymous': (401, 0), 'viewer': (200, 2), 'editor': (200, 2), 'admin': (200, 2),
+            }),
+            'blogs:blog-update': ('PATCH', f'/api/blogs/{slug}/update/', {'meta_title': 'Updated'}, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (200, 2), 'admin': (404, 1),
+            }),
+            'blogs:blog-delete': ('DELETE', f'/api/blogs/{slug}/delete/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (204, 12), 'admin': (404, 1),
+            }),
+            'blogs:blog-publish': ('PATCH', f'/api/blogs/{slug}/publish/', {'status': 'published'}, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (200, 2), 'admin': (404, 1),
+            }),
+            'blogs:my-blogs': ('GET', '/api/blogs/my-blogs/', None, {
+                'anonymous': (401, 0), 'viewer': (200, 1), 'editor': (200, 3), 'admin': (200, 1),
+            }),
+            'blogs:blog-stats': ('GET', '/api/blogs/stats/', None, {
+                'anonymous': (200, 3), 'viewer': (200, 3), 'editor': (200, 3), 'admin': (200, 3),
+            }),
+            'blogs:featured-blogs': ('GET', '/api/blogs/featured/', None, {
+                'anonymous': (200, 2), 'viewer': (200, 2), 'editor': (200, 2), 'admin': (200, 2),
+            }),
+        }
+        return expand_cases(expected)
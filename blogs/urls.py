@@ -7,10 +7,6 @@ urlpatterns = [
     # Blog CRUD endpoints
     path('', views.BlogListView.as_view(), name='blog-list'),
     path('create/', views.BlogCreateView.as_view(), name='blog-create'),
-    path('<slug:slug>/', views.BlogDetailView.as_view(), name='blog-detail'),
-    path('<slug:slug>/update/', views.BlogUpdateView.as_view(), name='blog-update'),
-    path('<slug:slug>/delete/', views.BlogDeleteView.as_view(), name='blog-delete'),
-    path('<slug:slug>/publish/', views.BlogPublishView.as_view(), name='blog-publish'),
     
     # User-specific endpoints
     path('my-blogs/', views.MyBlogsView.as_view(), name='my-blogs'),
@@ -18,4 +14,10 @@ urlpatterns = [
     # Statistics and featured endpoints
     path('stats/', views.blog_stats, name='blog-stats'),
     path('featured/', views.featured_blogs, name='featured-blogs'),
+    
+    # Slug routes come last so they do not shadow the fixed paths above
+    path('<slug:slug>/', views.BlogDetailView.as_view(), name='blog-detail'),
+    path('<slug:slug>/update/', views.BlogUpdateView.as_view(), name='blog-update'),
+    path('<slug:slug>/delete/', views.BlogDeleteView.as_view(), name='blog-delete'),
+    path('<slug:slug>/publish/', views.BlogPublishView.as_view(), name='blog-publish'),
 ]
\ No newline at end of file
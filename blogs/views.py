@@ -14,7 +14,8 @@ from .serializers import (
     BlogPublishSerializer
 )
 from users.permissions import BlogPermission
-from newsletter.models import NewsletterSubscriber
+from jobs.queue import enqueue
+from newsletter.tasks import send_newsletter
 
 
 class BlogListView(generics.ListAPIView):
@@ -130,13 +131,9 @@ class BlogPublishView(generics.UpdateAPIView):
     def perform_update(self, serializer):
         blog = serializer.save()
         
-        # Send newsletter if blog is being published
+        # Mail subscribers from a background worker if blog is being published
         if blog.status == 'published' and 'status' in serializer.validated_data:
-            try:
-                NewsletterSubscriber.send_newsletter(blog)
-            except Exception as e:
-                # Log error but don't fail the request
-                pass
+            enqueue(send_newsletter, blog_id=blog.id)
 
 
 class MyBlogsView(generics.ListAPIView):
@@ -150,7 +147,7 @@ class MyBlogsView(generics.ListAPIView):
     ordering = ['-created_at']
     
     def get_queryset(self):
-        return Blog.objects.filter(author=self.request.user).select_related('category').prefetch_related('tags')
+        return Blog.objects.filter(author=self.request.user).select_related('author', 'category').prefetch_related('tags')
 
 
 @api_view(['GET'])
@@ -1,3 +1,32 @@
-from django.test import TestCase
+from blog_system.testing import EndpointPerformanceTestCase, expand_cases
+from .models import Category
 
-# Create your tests here.
+
+class CategoryEndpointPerformanceTests(EndpointPerformanceTestCase):
+    """Query-count and serializer-time regression tests for the categories API"""
+
+    def get_cases(self):
+        used = self.data['categories'][0]
+        unused = Category.objects.create(name='Unused category')
+        expected = {
+            # name: method, path, data, {role: (status, queries)}
+            'categories:category-list-create': ('GET', '/api/categories/', None, {
+                'anonymous': (200, 2), 'viewer': (200, 2), 'editor': (200, 2), 'admin': (200, 2),
+            }),
+            'categories:category-list-create (create)': ('POST', '/api/categories/', {'name': 'Observability'}, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (201, 3),
+            }),
+            'categories:category-detail': ('GET', f'/api/categories/{used.slug}/', None, {
+                'anonymous': (200, 1), 'viewer': (200, 1), 'editor': (200, 1), 'admin': (200, 1),
+            }),
+            'categories:category-detail (update)': ('PATCH', f'/api/categories/{used.slug}/', {'name': 'Renamed'}, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 4),
+            }),
+            'categories:category-detail (delete in use)': ('DELETE', f'/api/categories/{used.slug}/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (400, 2),
+            }),
+            'categories:category-detail (delete)': ('DELETE', f'/api/categories/{unused.slug}/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (204, 8),
+            }),
+        }
+        return expand_cases(expected)
@@ -43,7 +43,7 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
         category = self.get_object()
         
         # Check if category has associated blogs
-        if category.blog_set.exists():
+        if category.blogs.exists():
             return Response({
                 'error': 'Cannot delete category that has associated blogs. Please reassign or delete the blogs first.'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,149 @@
+"""
+Naive Bayes spam classifier learned from moderation decisions.
+
+Token counts live in the ``SpamToken`` table and are updated with F()
+expressions each time a moderator approves a comment or marks it as spam.
+A comment keeps the tokens it was learned from, so a later decision undoes
+exactly those even when the content was edited in between. Counts never go
+below zero.
+Two reserved rows hold the per-class document and token totals; their names
+cannot be produced by the tokenizer.
+
+For scoring, the counts are turned into one log-likelihood ratio per token
+when the model is loaded, so a comment's score is a single summed lookup over
+its tokens. The loaded model is cached per process and refreshed every
+``SPAM_CLASSIFIER_MAX_AGE`` seconds.
+"""
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'_-]{1,29}")
+
+DOCUMENTS = '#documents'
+TOKENS = '#tokens'
+
+
+def tokenize(text):
+    """Distinct lower-cased words in ``text``; links count as a token too."""
+    text = text.lower()
+    tokens = set(TOKEN_RE.findall(text))
+    if 'http' in text or 'www.' in text:
+        tokens.add('#link')
+    return tokens
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes over token presence, with Laplace smoothing."""
+
+    def __init__(self, counts=None):
+        # token -> [spam count, ham count]
+        self.counts = counts if counts is not None else {}
+
+    def learn(self, tokens, is_spam, step=1):
+        column = 0 if is_spam else 1
+        for token in tokens:
+            self.counts.setdefault(token, [0, 0])[column] += step
+        for total, amount in ((DOCUMENTS, 1), (TOKENS, len(tokens))):
+            self.counts.setdefault(total, [0, 0])[column] += step * amount
+
+    def compile(self):
+        return CompiledModel(self.counts)
+
+
+class CompiledModel:
+    """Log-likelihood ratios ready for scoring."""
+
+    def __init__(self, counts):
+        spam_documents, ham_documents = (max(count, 0) for count in counts.get(DOCUMENTS, (0, 0)))
+        spam_tokens, ham_tokens = (max(count, 0) for count in counts.get(TOKENS, (0, 0)))
+        self.documents = (spam_documents, ham_documents)
+
+        vocabulary = max(sum(1 for token in counts if token not in (DOCUMENTS, TOKENS)), 1)
+        spam_norm = math.log(spam_tokens + vocabulary)
+        ham_norm = math.log(ham_tokens + vocabulary)
+        self.prior = math.log((spam_documents + 1) / (ham_documents + 1))
+        self.unseen = ham_norm - spam_norm
+        self.ratios = {
+            token: math.log(max(spam, 0) + 1) - math.log(max(ham, 0) + 1) + self.unseen
+            for token, (spam, ham) in counts.items()
+            if token not in (DOCUMENTS, TOKENS)
+        }
+
+    @property
+    def is_trained(self):
+        minimum = getattr(settings, 'SPAM_CLASSIFIER_MIN_DOCUMENTS', 20)
+        return min(self.documents) >= minimum
+
+    def log_odds(self, tokens):
+        ratios = self.ratios.get
+        unseen = self.unseen
+        return self.prior + sum(ratios(token, unseen) for token in tokens)
+
+    def probability(self, text):
+        """Probability that ``text`` is spam."""
+        log_odds = self.log_odds(tokenize(text))
+        if log_odds >= 0:
+            return 1 / (1 + math.exp(-log_odds))
+        odds = math.exp(log_odds)
+        return odds / (1 + odds)
+
+
+def learn(tokens, label, previous='', previous_tokens=()):
+    """Record a moderation decision on ``tokens``.
+
+    ``previous`` undoes an earlier label, learned from ``previous_tokens``.
+    """
+    from .models import SpamToken
+
+    if label == previous:
+        return
+    columns = {'spam': 'spam_count', 'ham': 'ham_count'}
+    changes = [(tokens, columns[label], 1)]
+    if previous:
+        changes.insert(0, (previous_tokens, columns[previous], -1))
+
+    with transaction.atomic(savepoint=False):
+        SpamToken.objects.bulk_create(
+            [SpamToken(token=token) for token in {*tokens, *previous_tokens, DOCUMENTS, TOKENS}],
+            ignore_conflicts=True,
+        )
+        for change_tokens, column, step in changes:
+            SpamToken.objects.filter(token__in=[*change_tokens, DOCUMENTS]).update(
+                **{column: Greatest(F(column) + step, 0)}
+            )
+            SpamToken.objects.filter(token=TOKENS).update(
+                **{column: Greatest(F(column) + step * len(change_tokens), 0)}
+            )
+
+
+_lock = threading.Lock()
+_cached = {'model': None, 'loaded_at': 0.0}
+
+
+def load_model():
+    from .models import SpamToken
+
+    counts = {token: [spam, ham] for token, spam, ham in
+              SpamToken.objects.values_list('token', 'spam_count', 'ham_count').iterator(chunk_size=5000)}
+    return NaiveBayes(counts).compile()
+
+
+def get_classifier():
+    """The cached model, reloaded once it is older than the configured age."""
+    max_age = getattr(settings, 'SPAM_CLASSIFIER_MAX_AGE', 300)
+    model = _cached['model']
+    if model is not None and time.monotonic() - _cached['loaded_at'] < max_age:
+        return model
+
+    with _lock:
+        model = load_model()
+        _cached.update(model=model, loaded_at=time.monotonic())
+    return model
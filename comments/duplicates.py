@@ -0,0 +1,188 @@
+"""
+Near-duplicate detection for new comments.
+
+Each comment is reduced to its set of word pairs (shingles) and summarized by
+a MinHash signature: the minimum of each of ``NUM_HASHES`` hash functions
+over the shingles. The share of positions where two signatures agree
+estimates the Jaccard similarity of the two shingle sets.
+
+For lookups the signature is cut into ``BANDS`` bands, and each band is
+hashed to one indexed key in ``CommentFingerprintBand`` (locality-sensitive
+hashing). Comments sharing any band key are candidates; with 16 bands of 4
+rows, a copy with similarity 0.8 becomes a candidate with probability
+above 0.999, one with similarity 0.3 less than 15% of the time. Candidates
+are then compared on their full signatures.
+
+A new comment counts as a near-duplicate when it is at least
+``NEAR_DUPLICATE_SIMILARITY`` similar to a comment marked as spam, or to
+``NEAR_DUPLICATE_LIMIT`` other recent comments. Only comments from the last
+``NEAR_DUPLICATE_WINDOW_DAYS`` days are considered. Fingerprints that have
+left the window are pruned by a background job, queued by ``record`` at most
+every ``NEAR_DUPLICATE_PRUNE_INTERVAL`` seconds;
+``manage.py rebuild_comment_fingerprints`` prunes them on demand or rebuilds
+the index from the comments table.
+"""
+import hashlib
+import html
+import random
+import re
+import struct
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+
+PRUNE_KEY = 'comments:fingerprints-pruned'
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+
+# Universal hash functions (a * x + b) mod p over 64-bit shingle hashes.
+PRIME = (1 << 61) - 1
+_rng = random.Random(20240611)
+HASH_PARAMS = [(_rng.randrange(1, PRIME), _rng.randrange(PRIME)) for _ in range(NUM_HASHES)]
+
+# Shorter texts ("Great post, thanks!") are too alike to tell apart.
+MIN_SHINGLES = 8
+
+# Candidates examined per lookup, most recent first.
+MAX_CANDIDATES = 500
+
+SIGNATURE_FORMAT = struct.Struct(f'>{NUM_HASHES}Q')
+
+WORD_RE = re.compile(r'\w+')
+
+
+def shingles(text):
+    """Adjacent word pairs of the text, ignoring markup and case."""
+    words = WORD_RE.findall(html.unescape(strip_tags(text)).lower())
+    return {f'{first} {second}' for first, second in zip(words, words[1:])}
+
+
+def hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def signature(text):
+    """MinHash signature of ``text``, or None when it is too short to compare."""
+    hashes = [hash64(shingle) for shingle in shingles(text)]
+    if len(hashes) < MIN_SHINGLES:
+        return None
+    return [min((a * value + b) % PRIME for value in hashes) for a, b in HASH_PARAMS]
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return sum(x == y for x, y in zip(first, second)) / NUM_HASHES
+
+
+def band_keys(values):
+    """One signed 64-bit key per band of the signature."""
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(
+            SIGNATURE_FORMAT.pack(*values)[band * ROWS * 8:(band + 1) * ROWS * 8],
+            digest_size=8, person=band.to_bytes(2, 'big'),
+        ).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+
+def pack(values):
+    return SIGNATURE_FORMAT.pack(*values)
+
+
+def unpack(data):
+    return SIGNATURE_FORMAT.unpack(bytes(data))
+
+
+def window_start():
+    return timezone.now() - timedelta(days=getattr(settings, 'NEAR_DUPLICATE_WINDOW_DAYS', 7))
+
+
+def near_duplicates(values):
+    """Statuses of recent comments at least ``NEAR_DUPLICATE_SIMILARITY`` similar."""
+    from .models import CommentFingerprint
+
+    threshold = getattr(settings, 'NEAR_DUPLICATE_SIMILARITY', 0.7)
+    candidates = (CommentFingerprint.objects
+                  .filter(bands__key__in=band_keys(values), created_at__gte=window_start())
+                  .distinct().order_by('-created_at')
+                  .values_list('signature', 'comment__status')[:MAX_CANDIDATES])
+    return [status for data, status in candidates if similarity(unpack(data), values) >= threshold]
+
+
+def is_near_duplicate(text):
+    """Whether ``text`` repeats known spam or many recent comments."""
+    values = signature(text)
+    if values is None:
+        return False
+    statuses = near_duplicates(values)
+    return 'spam' in statuses or len(statuses) >= getattr(settings, 'NEAR_DUPLICATE_LIMIT', 5)
+
+
+def index(fingerprints):
+    """Store ``(comment_id, created_at, signature)`` fingerprints with their band keys."""
+    from .models import CommentFingerprint, CommentFingerprintBand
+
+    rows, bands = [], []
+    for comment_id, created_at, values in fingerprints:
+        rows.append(CommentFingerprint(comment_id=comment_id, signature=pack(values), created_at=created_at))
+        bands.extend(CommentFingerprintBand(fingerprint_id=comment_id, key=key) for key in band_keys(values))
+    CommentFingerprint.objects.bulk_create(rows, batch_size=1000)
+    CommentFingerprintBand.objects.bulk_create(bands, batch_size=5000)
+    return len(rows)
+
+
+def record(comment):
+    """Add a new comment to the index."""
+    values = signature(comment.content)
+    if values is not None:
+        index([(comment.pk, comment.created_at, values)])
+    schedule_prune()
+
+
+def schedule_prune():
+    """Queue a prune unless one was queued in the last ``NEAR_DUPLICATE_PRUNE_INTERVAL`` seconds."""
+    from jobs.queue import enqueue
+    from .tasks import prune_fingerprints
+
+    if cache.add(PRUNE_KEY, True, getattr(settings, 'NEAR_DUPLICATE_PRUNE_INTERVAL', 3600)):
+        enqueue(prune_fingerprints)
+
+
+def rebuild(days=None):
+    """Re-index the comments of the last ``days`` days (default: the window).
+
+    Returns the number of comments indexed.
+    """
+    from .models import Comment, CommentFingerprint
+
+    since = window_start() if days is None else timezone.now() - timedelta(days=days)
+    comments = Comment.objects.filter(created_at__gte=since).values_list('id', 'created_at', 'content')
+    with transaction.atomic():
+        CommentFingerprint.objects.all().delete()
+        indexed = 0
+        batch = []
+        for comment_id, created_at, content in comments.iterator(chunk_size=2000):
+            values = signature(content)
+            if values is not None:
+                batch.append((comment_id, created_at, values))
+            if len(batch) >= 2000:
+                indexed += index(batch)
+                batch = []
+        return indexed + index(batch)
+
+
+def prune():
+    """Drop fingerprints that have left the window; returns how many."""
+    from .models import CommentFingerprint
+
+    return CommentFingerprint.objects.filter(created_at__lt=window_start()).delete()[1].get(
+        CommentFingerprint._meta.label, 0
+    )
@@ -0,0 +1,170 @@
+"""
+Live comment streams.
+
+Newly approved comments are published once per process to a broker, which
+fans them out to the Server-Sent Events streams of that blog
+(``views.comment_stream``). Streams wait on an asyncio queue, so an idle
+subscriber holds no thread and no database connection.
+
+``LocalBroker`` only reaches subscribers in the current process. With
+several workers, set ``COMMENT_STREAM_BROKER`` to a broker with the same
+``publish``/``subscribe`` interface backed by a shared pub/sub channel
+(Redis, for instance); ``is_listening`` should then always return True.
+
+EventSource cannot send headers, so a stream is opened with a ticket in its
+URL rather than the access token: ``issue_ticket`` signs one for a user, and
+it is accepted once, within ``COMMENT_STREAM_TICKET_SECONDS``. Redeemed
+tickets are remembered in the default cache, which should be shared between
+workers for them to be single-use across processes.
+"""
+import asyncio
+import secrets
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import connections
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+
+
+# Sent when nothing else was, so proxies do not time the stream out.
+HEARTBEAT = ': keepalive\n\n'
+
+TICKET_SALT = 'comments.live.ticket'
+
+
+class Subscription:
+    """One stream's queue on the event loop that serves it."""
+
+    def __init__(self, channel, max_pending):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def deliver(self, message):
+        """Runs on the subscription's loop."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The client is too slow; it reconnects and replays from Last-Event-ID.
+            self.overflowed = True
+
+
+class LocalBroker:
+    """In-process publish/subscribe; publishing is safe from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, channel):
+        """Must be called from the event loop that will read the subscription."""
+        subscription = Subscription(channel, getattr(settings, 'COMMENT_STREAM_MAX_PENDING', 100))
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.channel]
+
+    def is_listening(self, channel):
+        return channel in self._subscriptions
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:  # The subscriber's loop has closed
+                self.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'COMMENT_STREAM_BROKER', 'comments.live.LocalBroker'))()
+    return _broker
+
+
+def channel(blog_id):
+    return f'blog:{blog_id}'
+
+
+def format_event(comment_id, payload):
+    """An SSE ``comment`` event; its id lets clients resume with Last-Event-ID."""
+    return f'id: {comment_id}\nevent: comment\ndata: {payload}\n\n'
+
+
+def render(comments):
+    """SSE events for ``comments``, in the comment list's JSON format."""
+    from .serializers import CommentListSerializer
+
+    return [
+        format_event(data['id'], JSONRenderer().render(data).decode())
+        for data in CommentListSerializer(comments, many=True).data
+    ]
+
+
+def publish_approved(comments):
+    """Push newly approved ``(comment id, blog id)`` pairs to their streams.
+
+    Call after commit. Only comments of blogs that someone is listening to
+    are loaded, in one query.
+    """
+    from .models import Comment
+
+    broker = get_broker()
+    ids = [comment_id for comment_id, blog_id in comments if broker.is_listening(channel(blog_id))]
+    if not ids:
+        return
+    approved = list(Comment.objects.filter(pk__in=ids, status='approved').select_related('user').order_by('id'))
+    for comment, event in zip(approved, render(approved)):
+        broker.publish(channel(comment.blog_id), (comment.id, event))
+
+
+def release_connections():
+    """Close this thread's database connections before a long-lived stream."""
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def retry_hint():
+    """Tells EventSource how long to wait before reconnecting, in ms."""
+    return f'retry: {getattr(settings, "COMMENT_STREAM_RETRY_MS", 3000)}\n\n'
+
+
+def ticket_seconds():
+    return getattr(settings, 'COMMENT_STREAM_TICKET_SECONDS', 30)
+
+
+def issue_ticket(user):
+    """A signed, single-use ticket that opens one stream as ``user``."""
+    return signing.dumps({'user': user.pk, 'nonce': secrets.token_urlsafe(12)}, salt=TICKET_SALT)
+
+
+def redeem_ticket(ticket):
+    """The id of the user a valid ticket was issued to; None if it expired or was used."""
+    try:
+        payload = signing.loads(ticket, salt=TICKET_SALT, max_age=ticket_seconds())
+    except signing.BadSignature:
+        return None
+    if not cache.add(f'comments:stream-ticket:{payload["nonce"]}', True, ticket_seconds()):
+        return None
+    return payload['user']
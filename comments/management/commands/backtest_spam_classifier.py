@@ -0,0 +1,88 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from comments.classifier import NaiveBayes, tokenize
+from comments.models import Comment
+
+
+def log_odds(probability):
+    """Scores are compared as log-odds, which do not overflow for confident scores."""
+    if probability <= 0:
+        return float('-inf')
+    if probability >= 1:
+        return float('inf')
+    return math.log(probability / (1 - probability))
+
+
+class Command(BaseCommand):
+    help = 'Train the spam classifier on older moderated comments and report precision/recall on newer ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--train-ratio', type=float, default=0.8,
+                            help='Share of moderated comments, oldest first, used for training')
+        parser.add_argument('--thresholds', default='',
+                            help='Comma-separated spam probabilities to evaluate '
+                                 '(default: SPAM_CLASSIFIER_THRESHOLD and 0.5)')
+        parser.add_argument('--limit', type=int, default=0, help='Use only the most recent N moderated comments')
+
+    def handle(self, *args, **options):
+        if not 0 < options['train_ratio'] < 1:
+            raise CommandError('--train-ratio must be between 0 and 1.')
+        if options['thresholds']:
+            thresholds = sorted(float(value) for value in options['thresholds'].split(','))
+        else:
+            thresholds = sorted({0.5, getattr(settings, 'SPAM_CLASSIFIER_THRESHOLD', 0.99)})
+
+        comments = Comment.objects.filter(status__in=['approved', 'spam']).order_by('-created_at', '-id')
+        if options['limit']:
+            comments = comments[:options['limit']]
+        examples = [
+            (tokenize(content), status == 'spam')
+            for content, status in reversed(list(comments.values_list('content', 'status')))
+        ]
+        split = int(len(examples) * options['train_ratio'])
+        training, testing = examples[:split], examples[split:]
+        if not training or not testing:
+            raise CommandError('Not enough moderated comments to backtest.')
+
+        started = time.perf_counter()
+        model = NaiveBayes()
+        for tokens, is_spam in training:
+            model.learn(tokens, is_spam)
+        compiled = model.compile()
+        trained = time.perf_counter() - started
+
+        started = time.perf_counter()
+        scores = [compiled.log_odds(tokens) for tokens, _ in testing]
+        scored = time.perf_counter() - started
+
+        spam_in_training = sum(is_spam for _, is_spam in training)
+        self.stdout.write(
+            f'Trained on {len(training)} comments ({spam_in_training} spam) in {trained:.2f}s; '
+            f'scored {len(testing)} in {scored:.2f}s ({len(testing) / max(scored, 1e-9):,.0f}/s)'
+        )
+        self.stdout.write(f'{"threshold":>10} {"precision":>10} {"recall":>8} {"f1":>6} {"accuracy":>9}  tp/fp/fn/tn')
+        for threshold in thresholds:
+            cutoff = log_odds(threshold)
+            tp = fp = fn = tn = 0
+            for score, (_, is_spam) in zip(scores, testing):
+                flagged = score >= cutoff
+                if flagged and is_spam:
+                    tp += 1
+                elif flagged:
+                    fp += 1
+                elif is_spam:
+                    fn += 1
+                else:
+                    tn += 1
+            precision = tp / (tp + fp) if tp + fp else 0.0
+            recall = tp / (tp + fn) if tp + fn else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            accuracy = (tp + tn) / len(testing)
+            self.stdout.write(
+                f'{threshold:>10.3f} {precision:>10.3f} {recall:>8.3f} {f1:>6.3f} {accuracy:>9.3f}  '
+                f'{tp}/{fp}/{fn}/{tn}'
+            )
@@ -0,0 +1,77 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from comments.models import SpamRule
+from comments.spam import KeywordAutomaton, SpamFilter
+
+
+WORDS = (
+    'query index latency cache request response database django python server '
+    'thanks great post question answer example production deploy release '
+    'the a an of to in on for with and or but not is are was were this that'
+).split()
+
+
+def naive_is_spam(rules, threshold, text):
+    """The previous approach: one substring search per rule."""
+    text = text.lower()
+    return sum(weight for pattern, weight in rules if pattern in text) >= threshold
+
+
+class Command(BaseCommand):
+    help = 'Benchmark spam scoring over a large batch of generated comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--extra-rules', type=int, default=0,
+                            help='Add this many generated rules to the active ones')
+        parser.add_argument('--spam-ratio', type=float, default=0.1,
+                            help='Share of comments that contain rule patterns')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rules = list(SpamRule.objects.filter(is_active=True).values_list('pattern', 'weight'))
+        for index in range(options['extra_rules']):
+            rules.append((f'{rng.choice(WORDS)}x{index} {rng.choice(WORDS)}', 1.0))
+        threshold = getattr(settings, 'SPAM_SCORE_THRESHOLD', 2.0)
+        patterns = [pattern for pattern, _ in rules] or ['']
+
+        comments = []
+        for _ in range(options['comments']):
+            words = rng.choices(WORDS, k=rng.randint(5, 150))
+            if rng.random() < options['spam_ratio']:
+                for _ in range(rng.randint(1, 3)):
+                    words.insert(rng.randrange(len(words) + 1), rng.choice(patterns).upper())
+            comments.append(' '.join(words))
+        characters = sum(len(comment) for comment in comments)
+
+        started = time.perf_counter()
+        automaton = KeywordAutomaton(pattern for pattern, _ in rules)
+        build = time.perf_counter() - started
+        weights = [weight for _, weight in rules]
+        spam_filter = SpamFilter(rules, threshold)
+
+        self.stdout.write(
+            f'{len(comments)} comments ({characters / 1e6:.1f}M characters), {len(rules)} rules, '
+            f'automaton built in {build * 1000:.1f}ms'
+        )
+        results = {}
+        for name, check in (
+            ('substring search per rule', lambda text: naive_is_spam(rules, threshold, text)),
+            ('aho-corasick automaton', lambda text: sum(weights[i] for i in automaton.find(text)) >= threshold),
+            ('spam filter', spam_filter.is_spam),
+        ):
+            started = time.perf_counter()
+            results[name] = [check(comment) for comment in comments]
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'  {name}: {elapsed:.2f}s ({len(comments) / elapsed:,.0f} comments/s, '
+                f'{sum(results[name])} spam)'
+            )
+
+        if len(set(map(tuple, results.values()))) != 1:
+            self.stdout.write(self.style.ERROR('The methods disagree'))
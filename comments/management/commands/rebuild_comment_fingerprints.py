@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from comments import duplicates
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the near-duplicate fingerprint index from recent comments, or prune old fingerprints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help='Only drop fingerprints older than NEAR_DUPLICATE_WINDOW_DAYS')
+        parser.add_argument('--days', type=int, default=None,
+                            help='Index comments from this many days (default: NEAR_DUPLICATE_WINDOW_DAYS)')
+
+    def handle(self, *args, **options):
+        if options['prune']:
+            self.stdout.write(f'Pruned {duplicates.prune()} fingerprints')
+            return
+        self.stdout.write(self.style.SUCCESS(f'Indexed {duplicates.rebuild(options["days"])} comments'))
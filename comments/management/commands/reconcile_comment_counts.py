@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from blogs.models import Blog
+from comments import stats
+from comments.models import Comment, CommentDailyStats
+
+
+def counted(queryset, field):
+    """Number of rows in ``queryset`` whose ``field`` matches the outer row."""
+    counts = (queryset.filter(**{field: OuterRef('pk')}).order_by()
+              .values(field).annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(counts), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized comment counts and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        blog_counts = {
+            'approved_comment_count': counted(Comment.objects.filter(status='approved'), 'blog'),
+            'pending_comment_count': counted(Comment.objects.filter(status='pending'), 'blog'),
+        }
+        reply_counts = {
+            'reply_count': counted(Comment.objects.filter(status='approved'), 'parent'),
+        }
+        self.reconcile(Blog, blog_counts, options)
+        self.reconcile(Comment, reply_counts, options)
+        self.reconcile_stats(options)
+
+    def reconcile(self, model, counts, options):
+        # Find drifted rows first, then recompute them inside the UPDATE itself
+        # so that comments added meanwhile are not lost.
+        actual = {f'actual_{name}': expression for name, expression in counts.items()}
+        drift = Q()
+        for name in counts:
+            drift |= ~Q(**{name: F(f'actual_{name}')})
+        drifted = list(model.objects.annotate(**actual).filter(drift).values_list('pk', flat=True))
+
+        label = model._meta.verbose_name_plural.lower()
+        if options['dry_run'] or not drifted:
+            self.stdout.write(f'{label}: {len(drifted)} with drifted counts')
+            return
+
+        batch_size = options['batch_size']
+        for start in range(0, len(drifted), batch_size):
+            model.objects.filter(pk__in=drifted[start:start + batch_size]).update(**counts)
+        self.stdout.write(self.style.SUCCESS(f'{label}: fixed {len(drifted)} with drifted counts'))
+
+    def reconcile_stats(self, options):
+        actual = Comment.objects.order_by().values('status').annotate(total=Count('id'))
+        actual = {row['status']: row['total'] for row in actual}
+        stored = {status: total for status, total in stats.status_totals().items() if total}
+        daily = set(stats.daily_counts(Comment.objects.all()))
+        daily_stored = set(CommentDailyStats.objects.exclude(count=0).values_list('day', 'blog_id', 'status', 'count'))
+        drifted = actual != stored or daily != daily_stored
+
+        if options['dry_run'] or not drifted:
+            self.stdout.write(f'comment statistics: {"drifted" if drifted else "in step"}')
+            return
+
+        stats.rebuild()
+        self.stdout.write(self.style.SUCCESS('comment statistics: rebuilt'))
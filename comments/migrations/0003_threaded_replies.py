@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class PathSegment(models.Func):
+    """An id as 8 hex digits, the path segment format of this migration's time."""
+
+    output_field = models.CharField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="printf('%%%%08x', %(expressions)s)", **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="lpad(to_hex(%(expressions)s), 8, '0')", **extra_context)
+
+
+def fill_root_paths(apps, schema_editor):
+    """Existing comments become thread roots."""
+    Comment = apps.get_model('comments', 'Comment')
+    Comment.objects.update(path=PathSegment('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0002_initial'),
+        ('comments', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='comments.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_root_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['blog', 'path'], name='comments_blog_id_cdc3e8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['blog', 'status', 'path'], name='comments_blog_id_8e0431_idx'),
+        ),
+    ]
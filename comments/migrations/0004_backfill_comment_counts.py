@@ -0,0 +1,31 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def counted(queryset, field):
+    counts = (queryset.filter(**{field: OuterRef('pk')}).order_by()
+              .values(field).annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(counts), 0)
+
+
+def backfill_counts(apps, schema_editor):
+    Blog = apps.get_model('blogs', 'Blog')
+    Comment = apps.get_model('comments', 'Comment')
+    Blog.objects.update(
+        approved_comment_count=counted(Comment.objects.filter(status='approved'), 'blog'),
+        pending_comment_count=counted(Comment.objects.filter(status='pending'), 'blog'),
+    )
+    Comment.objects.update(reply_count=counted(Comment.objects.filter(status='approved'), 'parent'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0003_comment_counts'),
+        ('comments', '0003_threaded_replies'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
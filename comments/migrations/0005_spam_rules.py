@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# The keywords that used to be hard-coded in Comment.is_spam().
+DEFAULT_KEYWORDS = [
+    'viagra', 'casino', 'lottery', 'winner', 'congratulations',
+    'click here', 'free money', 'make money fast', 'work from home',
+    'buy now', 'limited time', 'act now', 'urgent', 'guaranteed',
+]
+
+
+def create_default_rules(apps, schema_editor):
+    SpamRule = apps.get_model('comments', 'SpamRule')
+    SpamRule.objects.bulk_create([SpamRule(pattern=keyword, weight=1.0) for keyword in DEFAULT_KEYWORDS])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0004_backfill_comment_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpamRule',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('pattern', models.CharField(help_text='Matched case-insensitively anywhere in the text', max_length=100, unique=True)),
+                ('weight', models.FloatField(default=1.0, help_text='Added to the score when the pattern occurs')),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Spam Rule',
+                'verbose_name_plural': 'Spam Rules',
+                'db_table': 'spam_rules',
+                'ordering': ['pattern'],
+            },
+        ),
+        migrations.RunPython(create_default_rules, migrations.RunPython.noop),
+    ]
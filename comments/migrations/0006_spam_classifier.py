@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0005_spam_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpamToken',
+            fields=[
+                ('token', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('spam_count', models.IntegerField(default=0)),
+                ('ham_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Spam Token',
+                'verbose_name_plural': 'Spam Tokens',
+                'db_table': 'spam_tokens',
+            },
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='classifier_label',
+            field=models.CharField(blank=True, editable=False, help_text='Label the classifier last learned from this comment', max_length=4),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='spam_score',
+            field=models.FloatField(blank=True, editable=False, help_text='Classifier spam probability', null=True),
+        ),
+    ]
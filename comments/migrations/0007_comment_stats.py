@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def build_stats(apps, schema_editor):
+    Comment = apps.get_model('comments', 'Comment')
+    CommentStatusCounter = apps.get_model('comments', 'CommentStatusCounter')
+    CommentDailyStats = apps.get_model('comments', 'CommentDailyStats')
+
+    totals = Comment.objects.order_by().values('status').annotate(total=Count('id'))
+    totals = {row['status']: row['total'] for row in totals}
+    CommentStatusCounter.objects.bulk_create([
+        CommentStatusCounter(status=status, shard=shard, count=totals.get(status, 0) if shard == 0 else 0)
+        for status in ('pending', 'approved', 'spam')
+        for shard in range(8)
+    ])
+    rows = (Comment.objects.order_by().annotate(day=TruncDate('created_at'))
+            .values('day', 'blog_id', 'status').annotate(total=Count('id')))
+    CommentDailyStats.objects.bulk_create(
+        [CommentDailyStats(day=row['day'], blog_id=row['blog_id'], status=row['status'], count=row['total'])
+         for row in rows],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0003_comment_counts'),
+        ('comments', '0006_spam_classifier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentStatusCounter',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('spam', 'Spam')], max_length=10)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'comment_status_counters',
+                'constraints': [models.UniqueConstraint(fields=('status', 'shard'), name='unique_comment_status_shard')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CommentDailyStats',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('spam', 'Spam')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_daily_stats', to='blogs.blog')),
+            ],
+            options={
+                'verbose_name': 'Comment Daily Stats',
+                'verbose_name_plural': 'Comment Daily Stats',
+                'db_table': 'comment_daily_stats',
+                'indexes': [models.Index(fields=['blog', 'day'], name='comment_dai_blog_id_051537_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'blog', 'status'), name='unique_comment_daily_stats')],
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:47
+
+import hashlib
+import html
+import random
+import re
+import struct
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+
+# The MinHash fingerprints of this migration's time (see comments.duplicates):
+# 64 hashes over word pairs, cut into 16 bands of 4.
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+PRIME = (1 << 61) - 1
+_rng = random.Random(20240611)
+HASH_PARAMS = [(_rng.randrange(1, PRIME), _rng.randrange(PRIME)) for _ in range(NUM_HASHES)]
+MIN_SHINGLES = 8
+SIGNATURE_FORMAT = struct.Struct(f'>{NUM_HASHES}Q')
+WORD_RE = re.compile(r'\w+')
+
+
+def signature(text):
+    words = WORD_RE.findall(html.unescape(strip_tags(text)).lower())
+    shingles = {f'{first} {second}' for first, second in zip(words, words[1:])}
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big') for shingle in shingles]
+    if len(hashes) < MIN_SHINGLES:
+        return None
+    return [min((a * value + b) % PRIME for value in hashes) for a, b in HASH_PARAMS]
+
+
+def band_keys(packed):
+    return [
+        int.from_bytes(hashlib.blake2b(
+            packed[band * ROWS * 8:(band + 1) * ROWS * 8], digest_size=8, person=band.to_bytes(2, 'big'),
+        ).digest(), 'big', signed=True)
+        for band in range(BANDS)
+    ]
+
+
+def build_fingerprints(apps, schema_editor):
+    Comment = apps.get_model('comments', 'Comment')
+    CommentFingerprint = apps.get_model('comments', 'CommentFingerprint')
+    CommentFingerprintBand = apps.get_model('comments', 'CommentFingerprintBand')
+
+    recent = Comment.objects.filter(created_at__gte=timezone.now() - timedelta(days=7))
+    fingerprints, bands = [], []
+    for comment_id, created_at, content in recent.values_list('id', 'created_at', 'content').iterator():
+        values = signature(content)
+        if values is not None:
+            packed = SIGNATURE_FORMAT.pack(*values)
+            fingerprints.append(CommentFingerprint(comment_id=comment_id, signature=packed, created_at=created_at))
+            bands.extend(CommentFingerprintBand(fingerprint_id=comment_id, key=key) for key in band_keys(packed))
+    CommentFingerprint.objects.bulk_create(fingerprints, batch_size=1000)
+    CommentFingerprintBand.objects.bulk_create(bands, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0007_comment_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentFingerprint',
+            fields=[
+                ('comment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='comments.comment')),
+                ('signature', models.BinaryField()),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'db_table': 'comment_fingerprints',
+            },
+        ),
+        migrations.CreateModel(
+            name='CommentFingerprintBand',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('key', models.BigIntegerField()),
+                ('fingerprint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='comments.commentfingerprint')),
+            ],
+            options={
+                'db_table': 'comment_fingerprint_bands',
+                'indexes': [models.Index(fields=['key', 'fingerprint'], name='comment_fin_key_e63073_idx')],
+            },
+        ),
+        migrations.RunPython(build_fingerprints, migrations.RunPython.noop),
+    ]
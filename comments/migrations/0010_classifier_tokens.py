@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comments', '0009_moderation_leases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='classifier_tokens',
+            field=models.TextField(blank=True, editable=False, help_text='Tokens the classifier learned that label from', null=True),
+        ),
+    ]
@@ -1,12 +1,41 @@
 from django.db import models
+from django.db.models import CharField, Func
 from django.utils import timezone
 from django.conf import settings
 from blogs.models import Blog
+from . import duplicates
+from .classifier import get_classifier, learn, tokenize
+from .spam import get_spam_filter
 import bleach
 
 
+class PathSegment(Func):
+    """An id formatted in SQL the way ``Comment.path_segment`` formats it."""
+    
+    output_field = CharField()
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="printf('%%%%08x', %(expressions)s)", **extra_context)
+    
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="lpad(to_hex(%(expressions)s), 8, '0')", **extra_context)
+
+
 class Comment(models.Model):
-    """Comment model for blog posts with spam detection."""
+    """Comment model for blog posts with spam detection.
+    
+    Replies are stored with a materialized path: each comment's ``path`` is
+    its parent's path followed by its own id as a fixed-width hex segment.
+    Sorting by path yields a depth-first walk of the thread, so a whole
+    subtree is a single range scan on the ``(blog, path)`` index.
+    """
+    
+    # Maintained with F() updates by comments.signals; see save().
+    COUNTER_FIELDS = ('reply_count',)
+    
+    # Ids are written as 8 hex digits, which sort correctly up to 2**32.
+    PATH_SEGMENT_LENGTH = 8
+    MAX_DEPTH = 20
     
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -17,15 +46,40 @@ class Comment(models.Model):
     id = models.AutoField(primary_key=True)
     blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='comments')
+    parent = models.ForeignKey(
+        'self', on_delete=models.CASCADE, related_name='replies', blank=True, null=True
+    )
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    reply_count = models.PositiveIntegerField(default=0, editable=False)  # Approved direct replies
     content = models.TextField(max_length=1000)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
     # Spam detection fields
+    spam_score = models.FloatField(blank=True, null=True, editable=False, help_text='Classifier spam probability')
+    classifier_label = models.CharField(
+        max_length=4, blank=True, editable=False, help_text='Label the classifier last learned from this comment'
+    )
+    classifier_tokens = models.TextField(
+        null=True, blank=True, editable=False, help_text='Tokens the classifier learned that label from'
+    )
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True)
     
+    # Moderation queue leases (see comments.queue) and the moderation record
+    claimed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, related_name='claimed_comments',
+        blank=True, null=True, editable=False,
+    )
+    claim_expires_at = models.DateTimeField(blank=True, null=True, editable=False)
+    moderated_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, related_name='moderated_comments',
+        blank=True, null=True, editable=False,
+    )
+    moderated_at = models.DateTimeField(blank=True, null=True, editable=False)
+    
     class Meta:
         db_table = 'comments'
         verbose_name = 'Comment'
@@ -33,38 +87,102 @@ class Comment(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['blog', 'status']),
+            models.Index(fields=['blog', 'path']),
+            models.Index(fields=['blog', 'status', 'path']),
             models.Index(fields=['user']),
             models.Index(fields=['status']),
+            models.Index(fields=['status', 'claim_expires_at', 'created_at']),
+            models.Index(fields=['claimed_by', 'claim_expires_at']),
+            models.Index(fields=['moderated_at', 'moderated_by']),
         ]
     
     def __str__(self):
         return f'Comment by {self.user.name} on {self.blog.title}'
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so that the signals can adjust counters.
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+    
+    @classmethod
+    def path_segment(cls, pk):
+        return format(pk, f'0{cls.PATH_SEGMENT_LENGTH}x')
+    
+    @property
+    def parent_path(self):
+        return self.path[:-self.PATH_SEGMENT_LENGTH]
+    
     def save(self, *args, **kwargs):
         # Sanitize comment content
         allowed_tags = ['p', 'br', 'strong', 'em', 'u', 'a']
         allowed_attributes = {'a': ['href']}
         self.content = bleach.clean(self.content, tags=allowed_tags, attributes=allowed_attributes)
         
-        # Basic spam detection
+        # Spam detection: keyword rules first, then the trained classifier
         if self.is_spam():
             self.status = 'spam'
+        elif self._state.adding and self.status == 'pending':
+            model = get_classifier()
+            if model.is_trained:
+                self.spam_score = model.probability(self.content)
+                if self.spam_score >= getattr(settings, 'SPAM_CLASSIFIER_THRESHOLD', 0.99):
+                    self.status = 'spam'
+        
+        creating = self._state.adding
+        if creating and self.parent_id:
+            self.depth = self.parent.depth + 1
+        
+        # Never write back a possibly stale copy of the reply counter.
+        if not creating and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        if not creating and hasattr(self, '_loaded_status') and 'status' in kwargs['update_fields']:
+            self._loaded_status = self.replace_status()
+            kwargs['update_fields'] = [name for name in kwargs['update_fields'] if name != 'status']
         
         super().save(*args, **kwargs)
-    
-    def is_spam(self):
-        """Basic spam detection using keyword matching."""
-        spam_keywords = [
-            'viagra', 'casino', 'lottery', 'winner', 'congratulations',
-            'click here', 'free money', 'make money fast', 'work from home',
-            'buy now', 'limited time', 'act now', 'urgent', 'guaranteed'
-        ]
         
-        content_lower = self.content.lower()
-        spam_count = sum(1 for keyword in spam_keywords if keyword in content_lower)
+        if creating:
+            duplicates.record(self)
+        if creating and not self.path:
+            # The path ends with the comment's own id, so it is known only now.
+            prefix = self.parent.path if self.parent_id else ''
+            self.path = prefix + self.path_segment(self.pk)
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+    
+    def replace_status(self):
+        """Store a changed ``status``; returns the status it replaced.
         
-        # Consider spam if contains 2 or more spam keywords
-        return spam_count >= 2
+        A compare-and-set UPDATE, so that concurrent moderations of the same
+        comment each move the counters from the status they actually replaced.
+        """
+        stored = self._loaded_status
+        while stored is not None and stored != self.status:
+            if Comment.objects.filter(pk=self.pk, status=stored).update(status=self.status):
+                break
+            stored = Comment.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+        return stored
+    
+    def is_spam(self):
+        """Score the content against the active spam rules."""
+        return get_spam_filter().is_spam(self.content)
+    
+    def train_classifier(self, label):
+        """Teach the spam classifier from a moderator's decision ('spam' or 'ham')."""
+        if label == self.classifier_label:
+            return
+        tokens = tokenize(self.content)
+        # Labels learned before the tokens were kept were learned from the content
+        previous_tokens = (set(self.classifier_tokens.split()) if self.classifier_tokens is not None
+                           else tokens)
+        learn(tokens, label, previous=self.classifier_label, previous_tokens=previous_tokens)
+        self.classifier_label = label
+        self.classifier_tokens = ' '.join(sorted(tokens))
+        Comment.objects.filter(pk=self.pk).update(classifier_label=label, classifier_tokens=self.classifier_tokens)
     
     def approve(self):
         """Approve the comment."""
@@ -87,3 +205,126 @@ class Comment(models.Model):
     @property
     def is_spam_status(self):
         return self.status == 'spam'
+
+
+class SpamRule(models.Model):
+    """A keyword or phrase that counts towards a comment's spam score."""
+    
+    id = models.AutoField(primary_key=True)
+    pattern = models.CharField(max_length=100, unique=True, help_text='Matched case-insensitively anywhere in the text')
+    weight = models.FloatField(default=1.0, help_text='Added to the score when the pattern occurs')
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'spam_rules'
+        verbose_name = 'Spam Rule'
+        verbose_name_plural = 'Spam Rules'
+        ordering = ['pattern']
+    
+    def __str__(self):
+        return self.pattern
+    
+    def save(self, *args, **kwargs):
+        self.pattern = self.pattern.strip().lower()
+        super().save(*args, **kwargs)
+
+
+class SpamToken(models.Model):
+    """Per-token counts for the naive Bayes spam classifier."""
+    
+    token = models.CharField(max_length=32, primary_key=True)
+    spam_count = models.IntegerField(default=0)
+    ham_count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'spam_tokens'
+        verbose_name = 'Spam Token'
+        verbose_name_plural = 'Spam Tokens'
+    
+    def __str__(self):
+        return self.token
+
+
+class CommentStatusCounter(models.Model):
+    """Number of comments per status, split over shards.
+    
+    Each write updates one randomly chosen shard, so concurrent comment writes
+    rarely wait on the same row; the total for a status is the sum of its
+    shards.
+    """
+    
+    SHARDS = 8
+    KEY_FIELDS = ('status', 'shard')
+    
+    id = models.AutoField(primary_key=True)
+    status = models.CharField(max_length=10, choices=Comment.STATUS_CHOICES)
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'comment_status_counters'
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'shard'], name='unique_comment_status_shard'),
+        ]
+    
+    def __str__(self):
+        return f'{self.status}[{self.shard}]: {self.count}'
+
+
+class CommentDailyStats(models.Model):
+    """Comments per blog, day posted and current status."""
+    
+    KEY_FIELDS = ('day', 'blog_id', 'status')
+    
+    id = models.AutoField(primary_key=True)
+    day = models.DateField()
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='comment_daily_stats')
+    status = models.CharField(max_length=10, choices=Comment.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'comment_daily_stats'
+        verbose_name = 'Comment Daily Stats'
+        verbose_name_plural = 'Comment Daily Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'blog', 'status'], name='unique_comment_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['blog', 'day']),
+        ]
+    
+    def __str__(self):
+        return f'{self.day} blog {self.blog_id} {self.status}: {self.count}'
+
+
+class CommentFingerprint(models.Model):
+    """MinHash signature of a recent comment; see ``comments.duplicates``."""
+    
+    comment = models.OneToOneField(Comment, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    signature = models.BinaryField()
+    created_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        db_table = 'comment_fingerprints'
+    
+    def __str__(self):
+        return f'Fingerprint of comment {self.comment_id}'
+
+
+class CommentFingerprintBand(models.Model):
+    """One locality-sensitive hash of a fingerprint, for candidate lookups."""
+    
+    id = models.BigAutoField(primary_key=True)
+    fingerprint = models.ForeignKey(CommentFingerprint, on_delete=models.CASCADE, related_name='bands')
+    key = models.BigIntegerField()
+    
+    class Meta:
+        db_table = 'comment_fingerprint_bands'
+        indexes = [
+            models.Index(fields=['key', 'fingerprint']),
+        ]
+    
+    def __str__(self):
+        return f'{self.key} -> {self.fingerprint_id}'
@@ -0,0 +1,94 @@
+"""
+Set-based comment moderation.
+
+``bulk_set_status`` changes the status of many comments with one UPDATE
+instead of saving each one, so content is not re-sanitized and spam checks do
+not run again. Because ``save()`` and its signals are bypassed, the blog and
+reply counters are adjusted here, one UPDATE per counter table, and so are
+the statistics tables and live streams.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from blogs.models import Blog
+from . import live, stats
+from .models import Comment
+from .signals import BLOG_COUNTERS
+
+
+# Keeps the id list of one UPDATE within every backend's parameter limit.
+UPDATE_BATCH_SIZE = 10000
+
+
+def shifted(column, deltas):
+    """``column + delta`` where the delta depends on the row's primary key."""
+    return F(column) + Case(
+        *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def apply_deltas(model, deltas_by_column):
+    """Add per-row deltas to counter columns in a single UPDATE."""
+    deltas_by_column = {
+        column: {pk: delta for pk, delta in deltas.items() if delta}
+        for column, deltas in deltas_by_column.items()
+    }
+    pks = set().union(*deltas_by_column.values())
+    if pks:
+        model.objects.filter(pk__in=pks).update(**{
+            column: shifted(column, deltas) for column, deltas in deltas_by_column.items() if deltas
+        })
+
+
+def bulk_set_status(queryset, status, moderator=None):
+    """Give every comment in ``queryset`` the status ``status``.
+
+    Changed comments are recorded as moderated by ``moderator`` and leave the
+    moderation queue. Comments leased to another moderator are left to them.
+
+    Returns ``(matched, updated, skipped)``: comments selected, comments whose
+    status actually changed, and comments skipped for another's lease.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().values_list(
+            'id', 'blog_id', 'parent_id', 'status', 'created_at', 'claimed_by_id', 'claim_expires_at',
+        ))
+        leased = {
+            comment_id for comment_id, *_, claimed_by_id, expires_at in rows
+            if claimed_by_id not in (None, getattr(moderator, 'pk', None)) and expires_at and expires_at > now
+        }
+        changed = [row[:5] for row in rows if row[3] != status and row[0] not in leased]
+
+        ids = [comment_id for comment_id, *_ in changed]
+        for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+            Comment.objects.filter(pk__in=ids[start:start + UPDATE_BATCH_SIZE]).update(
+                status=status, updated_at=now, moderated_by=moderator, moderated_at=now,
+                claimed_by=None, claim_expires_at=None,
+            )
+
+        blog_deltas = {column: Counter() for column in BLOG_COUNTERS.values()}
+        reply_deltas = Counter()
+        for _, blog_id, parent_id, old_status, _ in changed:
+            if old_status in BLOG_COUNTERS:
+                blog_deltas[BLOG_COUNTERS[old_status]][blog_id] -= 1
+            if status in BLOG_COUNTERS:
+                blog_deltas[BLOG_COUNTERS[status]][blog_id] += 1
+            if parent_id and (old_status == 'approved') != (status == 'approved'):
+                reply_deltas[parent_id] += 1 if status == 'approved' else -1
+
+        apply_deltas(Blog, blog_deltas)
+        apply_deltas(Comment, {'reply_count': reply_deltas})
+        stats.record_changes(
+            (blog_id, created_at, old_status, status) for _, blog_id, _, old_status, created_at in changed
+        )
+        if status == 'approved':
+            approved = [(comment_id, blog_id) for comment_id, blog_id, *_ in changed]
+            transaction.on_commit(lambda: live.publish_approved(approved))
+
+    return len(rows), len(changed), len(leased)
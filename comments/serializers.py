@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Comment
+from django.utils import timezone
+from .models import Comment, SpamRule
+from .queue import claimed_by_other
+from .velocity import client_ip
 from blogs.models import Blog
 from users.serializers import UserSerializer
 
@@ -14,10 +17,23 @@ class CommentListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = [
-            'id', 'user', 'content', 'status',
+            'id', 'user', 'parent', 'depth', 'reply_count', 'content', 'status',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['parent', 'depth', 'reply_count', 'created_at', 'updated_at']
+
+
+class CommentTreeSerializer(CommentListSerializer):
+    """Serializer for a comment with its nested replies"""
+    replies = serializers.SerializerMethodField()
+    
+    class Meta(CommentListSerializer.Meta):
+        fields = CommentListSerializer.Meta.fields + ['replies']
+    
+    def get_replies(self, obj):
+        """Replies attached by the view; empty past the requested depth"""
+        replies = getattr(obj, 'thread_replies', [])
+        return CommentTreeSerializer(replies, many=True, context=self.context).data
 
 
 class CommentDetailSerializer(serializers.ModelSerializer):
@@ -28,20 +44,24 @@ class CommentDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = [
-            'id', 'blog', 'blog_title', 'user', 'content',
-            'status', 'ip_address', 'user_agent',
+            'id', 'blog', 'blog_title', 'user', 'parent', 'depth', 'reply_count',
+            'content', 'status', 'spam_score', 'ip_address', 'user_agent',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = [
+            'blog', 'parent', 'depth', 'reply_count', 'spam_score', 'ip_address', 'user_agent',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['blog', 'ip_address', 'user_agent', 'created_at', 'updated_at']
 
 
 class CommentCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating comments"""
     blog_id = serializers.IntegerField(write_only=True)
+    parent_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     
     class Meta:
         model = Comment
-        fields = ['blog_id', 'content']
+        fields = ['blog_id', 'parent_id', 'content']
     
     def validate_blog_id(self, value):
         """Validate blog exists and is published"""
@@ -61,6 +81,18 @@ class CommentCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Comment cannot exceed 1000 characters.")
         return value
     
+    def validate(self, attrs):
+        """Validate that a reply targets a visible comment on the same blog"""
+        parent_id = attrs.pop('parent_id', None)
+        if parent_id is not None:
+            parent = Comment.objects.filter(id=parent_id, status='approved').first()
+            if parent is None or parent.blog_id != attrs['blog_id']:
+                raise serializers.ValidationError({'parent_id': 'Parent comment does not exist.'})
+            if parent.depth >= Comment.MAX_DEPTH:
+                raise serializers.ValidationError({'parent_id': 'Replies are nested too deeply.'})
+            attrs['parent'] = parent
+        return attrs
+    
     def create(self, validated_data):
         """Create comment with blog and user"""
         blog_id = validated_data.pop('blog_id')
@@ -76,12 +108,7 @@ class CommentCreateSerializer(serializers.ModelSerializer):
     
     def get_client_ip(self, request):
         """Get client IP address from request"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        return client_ip(request)
 
 
 class CommentUpdateSerializer(serializers.ModelSerializer):
@@ -104,16 +131,105 @@ class CommentModerationSerializer(serializers.Serializer):
     """Serializer for comment moderation (approve/spam)"""
     action = serializers.ChoiceField(choices=['approve', 'spam', 'pending'])
     
+    def validate(self, attrs):
+        """Leave comments leased to another moderator to them"""
+        if self.instance is not None and claimed_by_other(self.instance, self.context['request'].user):
+            raise serializers.ValidationError("This comment is claimed by another moderator.")
+        return attrs
+    
     def update(self, instance, validated_data):
         """Update comment status based on action"""
         action = validated_data['action']
+        instance.moderated_by = self.context['request'].user
+        instance.moderated_at = timezone.now()
+        instance.claimed_by = None
+        instance.claim_expires_at = None
         
         if action == 'approve':
             instance.approve()
+            instance.train_classifier('ham')
         elif action == 'spam':
             instance.mark_as_spam()
+            instance.train_classifier('spam')
         elif action == 'pending':
             instance.status = 'pending'
             instance.save()
         
-        return instance
\ No newline at end of file
+        return instance
+    
+    def to_representation(self, instance):
+        """Return the moderated comment rather than the submitted action"""
+        return CommentDetailSerializer(instance, context=self.context).data
+
+
+class BulkModerationSerializer(serializers.Serializer):
+    """Serializer for moderating many comments at once
+    
+    Comments are selected by ``ids`` and/or by IP address, user or blog.
+    ``status`` narrows the selection to comments currently in that status.
+    """
+    ACTION_STATUSES = {'approve': 'approved', 'spam': 'spam', 'pending': 'pending'}
+    
+    action = serializers.ChoiceField(choices=list(ACTION_STATUSES))
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=50000)
+    ip_address = serializers.IPAddressField(required=False)
+    user = serializers.IntegerField(required=False)
+    blog = serializers.IntegerField(required=False)
+    status = serializers.ChoiceField(choices=Comment.STATUS_CHOICES, required=False)
+    
+    SELECTORS = ['ids', 'ip_address', 'user', 'blog']
+    
+    def validate(self, attrs):
+        """Refuse to moderate every comment by accident"""
+        if not any(attrs.get(name) for name in self.SELECTORS):
+            raise serializers.ValidationError(
+                "Select comments with at least one of: ids, ip_address, user, blog."
+            )
+        return attrs
+    
+    def get_queryset(self):
+        """Comments matched by the validated selection"""
+        data = self.validated_data
+        queryset = Comment.objects.all()
+        if data.get('ids'):
+            queryset = queryset.filter(id__in=data['ids'])
+        if data.get('ip_address'):
+            queryset = queryset.filter(ip_address=data['ip_address'])
+        if data.get('user'):
+            queryset = queryset.filter(user_id=data['user'])
+        if data.get('blog'):
+            queryset = queryset.filter(blog_id=data['blog'])
+        if data.get('status'):
+            queryset = queryset.filter(status=data['status'])
+        return queryset
+
+
+class QueueClaimSerializer(serializers.Serializer):
+    """Serializer for claiming a batch of the moderation queue"""
+    size = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class QueueReleaseSerializer(serializers.Serializer):
+    """Serializer for releasing claimed comments (all of them when ``ids`` is omitted)"""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=100)
+
+
+class SpamRuleSerializer(serializers.ModelSerializer):
+    """Serializer for spam keyword rules"""
+    
+    class Meta:
+        model = SpamRule
+        fields = ['id', 'pattern', 'weight', 'is_active', 'created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at']
+    
+    def validate_pattern(self, value):
+        """Patterns are stored lower-cased, so compare them that way"""
+        value = value.strip().lower()
+        if len(value) < 3:
+            raise serializers.ValidationError("Pattern must be at least 3 characters long.")
+        existing = SpamRule.objects.filter(pattern=value)
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError("A rule with this pattern already exists.")
+        return value
@@ -0,0 +1,111 @@
+"""
+Keep the denormalized comment counters in step with comment changes.
+
+``Blog.approved_comment_count``/``pending_comment_count`` and
+``Comment.reply_count`` (approved direct replies) are adjusted with F()
+expressions, so concurrent changes cannot overwrite each other. Queryset
+``update()`` bypasses these signals; ``reconcile_comment_counts`` repairs
+any drift.
+
+The comment statistics tables (see ``comments.stats``) follow the same
+changes, and newly approved comments are pushed to live streams once the
+transaction commits. Spam rule changes invalidate the compiled keyword
+automaton in every process.
+"""
+import random
+import threading
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from blog_system.counters import add_counts
+from blogs.models import Blog
+from . import live, stats
+from .models import Comment, CommentStatusCounter, SpamRule
+from .spam import bump_rules_version
+
+
+# Blogs whose comments blog_deleting() already took out of the totals,
+# until their own delete finishes
+_deleting = threading.local()
+
+
+def deleting_blogs():
+    if not hasattr(_deleting, 'pks'):
+        _deleting.pks = set()
+    return _deleting.pks
+
+
+BLOG_COUNTERS = {
+    'approved': 'approved_comment_count',
+    'pending': 'pending_comment_count',
+}
+
+
+def adjust_counters(comment, old_status, new_status):
+    """Move ``comment`` from ``old_status`` to ``new_status`` in the counters."""
+    if old_status == new_status:
+        return
+
+    changes = {}
+    if old_status in BLOG_COUNTERS:
+        changes[BLOG_COUNTERS[old_status]] = F(BLOG_COUNTERS[old_status]) - 1
+    if new_status in BLOG_COUNTERS:
+        changes[BLOG_COUNTERS[new_status]] = F(BLOG_COUNTERS[new_status]) + 1
+    if changes:
+        Blog.objects.filter(pk=comment.blog_id).update(**changes)
+
+    if comment.parent_id and (old_status == 'approved') != (new_status == 'approved'):
+        step = 1 if new_status == 'approved' else -1
+        Comment.objects.filter(pk=comment.parent_id).update(reply_count=F('reply_count') + step)
+
+    stats.record_changes([(comment.blog_id, comment.created_at, old_status, new_status)])
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_status = None if created else getattr(instance, '_loaded_status', instance.status)
+    adjust_counters(instance, old_status, instance.status)
+    instance._loaded_status = instance.status
+
+    if instance.status == 'approved' and old_status != 'approved':
+        approved = [(instance.pk, instance.blog_id)]
+        transaction.on_commit(lambda: live.publish_approved(approved))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    # Deleting a blog, directly or through its author, takes its comments
+    # with it; see blog_deleting().
+    if instance.blog_id in deleting_blogs():
+        return
+    adjust_counters(instance, getattr(instance, '_loaded_status', instance.status), None)
+
+
+@receiver(pre_delete, sender=Blog)
+def blog_deleting(sender, instance, **kwargs):
+    """Take a deleted blog's comments out of the status totals in one go.
+
+    Its daily rollups are removed by the database cascade.
+    """
+    shard = random.randrange(CommentStatusCounter.SHARDS)
+    by_status = (Comment.objects.filter(blog=instance).order_by()
+                 .values('status').annotate(total=Count('id')))
+    add_counts(CommentStatusCounter, {(row['status'], shard): -row['total'] for row in by_status})
+    deleting_blogs().add(instance.pk)
+
+
+@receiver(post_delete, sender=Blog)
+def blog_deleted(sender, instance, **kwargs):
+    deleting_blogs().discard(instance.pk)
+
+
+@receiver(post_save, sender=SpamRule)
+@receiver(post_delete, sender=SpamRule)
+def spam_rules_changed(sender, **kwargs):
+    # Other processes must not reload before the change is visible to them.
+    transaction.on_commit(bump_rules_version)
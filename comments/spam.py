@@ -0,0 +1,141 @@
+"""
+Keyword-based spam scoring.
+
+Active ``SpamRule`` patterns are compiled into an Aho-Corasick automaton, so
+a comment is scanned once however many rules there are (short rule lists
+use plain substring search, which is faster there). Each rule adds its
+weight to the score at most once; a comment whose score reaches
+``SPAM_SCORE_THRESHOLD`` is spam.
+
+The automaton is cached per process. Committing a change to the rules stores
+a new random version token in the shared cache, and every process rebuilds
+when it sees a different token (an evicted token counts as different), or
+after ``SPAM_RULES_MAX_AGE`` seconds when the cache is not shared between
+processes.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+RULES_VERSION_KEY = 'comments:spam-rules-version'
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over lower-cased patterns.
+
+    Failure links are folded into the transition table when it is built, so
+    scanning costs one dict lookup per character.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [pattern.lower() for pattern in patterns]
+        transitions = [{}]
+        outputs = [set()]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                if char not in transitions[state]:
+                    transitions.append({})
+                    outputs.append(set())
+                    transitions[state][char] = len(transitions) - 1
+                state = transitions[state][char]
+            if pattern:
+                outputs[state].add(index)
+
+        # Breadth-first, so a state's failure target is complete before it.
+        fail = [0] * len(transitions)
+        queue = list(transitions[0].values())
+        for state in queue:
+            for char, target in transitions[state].items():
+                queue.append(target)
+                fallback = fail[state]
+                while fallback and char not in transitions[fallback]:
+                    fallback = fail[fallback]
+                fail[target] = transitions[fallback].get(char, 0) if state else 0
+                outputs[target] |= outputs[fail[target]]
+
+        for state in queue:
+            # Inherit the failure state's moves; it was completed earlier.
+            for char, target in transitions[fail[state]].items():
+                transitions[state].setdefault(char, target)
+
+        self.transitions = transitions
+        self.outputs = [frozenset(output) for output in outputs]
+
+    def find(self, text):
+        """Indexes of the patterns that occur in ``text``."""
+        transitions = self.transitions
+        outputs = self.outputs
+        found = set()
+        state = 0
+        for char in text.lower():
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
+
+
+class SpamFilter:
+    """Scores text against a fixed set of weighted patterns.
+
+    Python's substring search runs in C, so for a short rule list one search
+    per rule beats walking the automaton character by character; the
+    automaton wins from about ``AUTOMATON_MIN_RULES`` rules on
+    (see ``manage.py bench_spam``).
+    """
+
+    AUTOMATON_MIN_RULES = 64
+
+    def __init__(self, rules, threshold):
+        rules = list(rules)
+        self.patterns = [pattern.lower() for pattern, _ in rules]
+        self.weights = [weight for _, weight in rules]
+        self.threshold = threshold
+        self.automaton = None
+        if len(rules) >= self.AUTOMATON_MIN_RULES:
+            self.automaton = KeywordAutomaton(self.patterns)
+
+    def find(self, text):
+        """Indexes of the rules whose pattern occurs in ``text``."""
+        if self.automaton is not None:
+            return self.automaton.find(text)
+        text = text.lower()
+        return {index for index, pattern in enumerate(self.patterns) if pattern in text}
+
+    def score(self, text):
+        return sum(self.weights[index] for index in self.find(text))
+
+    def is_spam(self, text):
+        return bool(self.weights) and self.score(text) >= self.threshold
+
+
+_lock = threading.Lock()
+_cached = {'filter': None, 'version': None, 'loaded_at': 0.0}
+
+
+def bump_rules_version():
+    """Tell every process to rebuild its automaton."""
+    cache.set(RULES_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_spam_filter():
+    """The filter for the current rules, rebuilt when they change."""
+    version = cache.get(RULES_VERSION_KEY)
+    max_age = getattr(settings, 'SPAM_RULES_MAX_AGE', 60)
+    spam_filter = _cached['filter']
+    if (spam_filter is not None and _cached['version'] == version
+            and time.monotonic() - _cached['loaded_at'] < max_age):
+        return spam_filter
+
+    with _lock:
+        from .models import SpamRule
+
+        rules = SpamRule.objects.filter(is_active=True).values_list('pattern', 'weight')
+        spam_filter = SpamFilter(rules, getattr(settings, 'SPAM_SCORE_THRESHOLD', 2.0))
+        _cached.update(filter=spam_filter, version=version, loaded_at=time.monotonic())
+    return spam_filter
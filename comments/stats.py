@@ -0,0 +1,78 @@
+"""
+Comment statistics served from counter tables instead of table scans.
+
+``CommentStatusCounter`` holds sharded per-status totals (every shard row
+exists up front, so an update is a single query) and
+``CommentDailyStats`` holds per-blog, per-day rollups. Both are adjusted
+(see ``blog_system.counters``) whenever comments are created, deleted or
+change status, and rebuilt from the comments table by
+``reconcile_comment_counts``.
+"""
+import random
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from blog_system.counters import add_counts
+from .models import Comment, CommentDailyStats, CommentStatusCounter
+
+
+def comment_day(created_at):
+    return timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+
+
+def record_changes(changes):
+    """Apply ``(blog_id, created_at, old_status, new_status)`` changes to the counters."""
+    totals = Counter()
+    daily = Counter()
+    for blog_id, created_at, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        day = comment_day(created_at)
+        if old_status:
+            totals[old_status] -= 1
+            daily[(day, blog_id, old_status)] -= 1
+        if new_status:
+            totals[new_status] += 1
+            daily[(day, blog_id, new_status)] += 1
+
+    shard = random.randrange(CommentStatusCounter.SHARDS)
+    add_counts(CommentStatusCounter, {(status, shard): delta for status, delta in totals.items()})
+    add_counts(CommentDailyStats, daily)
+
+
+def status_totals():
+    """``{status: count}`` for every status, in one query."""
+    return CommentStatusCounter.objects.aggregate(**{
+        status: Coalesce(Sum('count', filter=Q(status=status)), 0)
+        for status, _ in Comment.STATUS_CHOICES
+    })
+
+
+def daily_counts(comments):
+    """``(day, blog_id, status, count)`` rows for ``comments``, grouped in the database."""
+    return (comments.order_by().annotate(day=TruncDate('created_at'))
+            .values_list('day', 'blog_id', 'status').annotate(total=Count('id')).iterator())
+
+
+def rebuild():
+    """Recompute both counter tables from the comments table."""
+    with transaction.atomic():
+        CommentStatusCounter.objects.all().delete()
+        CommentDailyStats.objects.all().delete()
+
+        totals = Comment.objects.order_by().values('status').annotate(total=Count('id'))
+        totals = {row['status']: row['total'] for row in totals}
+        CommentStatusCounter.objects.bulk_create([
+            CommentStatusCounter(status=status, shard=shard, count=totals.get(status, 0) if shard == 0 else 0)
+            for status, _ in Comment.STATUS_CHOICES
+            for shard in range(CommentStatusCounter.SHARDS)
+        ])
+        CommentDailyStats.objects.bulk_create(
+            (CommentDailyStats(day=day, blog_id=blog_id, status=status, count=total)
+             for day, blog_id, status, total in daily_counts(Comment.objects.all())),
+            batch_size=5000,
+        )
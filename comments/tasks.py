@@ -0,0 +1,8 @@
+from jobs.queue import task
+from . import duplicates
+
+
+@task
+def prune_fingerprints():
+    """Drop near-duplicate fingerprints that have left the window."""
+    duplicates.prune()
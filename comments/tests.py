@@ -1,3 +1,963 @@
-from django.test import TestCase
+import asyncio
+import json
+import random
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Q
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, RequestFactory, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from blog_system.testing import EndpointPerformanceTestCase, expand_cases, seed_performance_data
+from blogs.models import Blog
+from jobs.models import Job
+from jobs.queue import get_task
+from users.models import User
+from . import classifier, duplicates, live, queue, stats, tasks, velocity, views
+from .models import Comment, CommentDailyStats, CommentFingerprint, SpamRule, SpamToken
+from .spam import KeywordAutomaton, SpamFilter
+
+
+class CommentEndpointPerformanceTests(EndpointPerformanceTestCase):
+    """Query-count and serializer-time regression tests for the comments API"""
+
+    def get_cases(self):
+        blog = self.data['blogs'][0]
+        own_comment = self.data['comments'][0]
+        pending_comment = self.data['comments'][2]
+        spam_rule = SpamRule.objects.get(pattern='casino')
+        new_comment = {
+            'blog_id': blog.id,
+            'content': 'The flame graph in the second section was really helpful.',
+        }
+        expected = {
+            # name: method, path, data, {role: (status, queries)}
+            'comments:comment-list': ('GET', f'/api/comments/blog/{blog.slug}/', None, {
+                'anonymous': (401, 0), 'viewer': (200, 2), 'editor': (200, 2), 'admin': (200, 2),
+            }),
+            'comments:comment-list (since)': ('GET', f'/api/comments/blog/{blog.slug}/?since={own_comment.id}', None, {
+                'anonymous': (401, 0), 'viewer': (200, 1), 'editor': (200, 1), 'admin': (200, 1),
+            }),
+            'comments:comment-list (tree)': ('GET', f'/api/comments/blog/{blog.slug}/?tree=1&depth=2', None, {
+                'anonymous': (401, 0), 'viewer': (200, 3), 'editor': (200, 3), 'admin': (200, 3),
+            }),
+            'comments:stream-ticket': ('POST', '/api/comments/stream/ticket/', None, {
+                'anonymous': (401, 0), 'viewer': (200, 0), 'editor': (200, 0), 'admin': (200, 0),
+            }),
+            'comments:comment-create (reply)': ('POST', f'/api/comments/blog/{blog.slug}/create/', {
+                **new_comment, 'parent_id': own_comment.id,
+            }, {
+                'anonymous': (401, 0), 'viewer': (201, 11), 'editor': (201, 11), 'admin': (201, 11),
+            }),
+            'comments:comment-create': ('POST', f'/api/comments/blog/{blog.slug}/create/', new_comment, {
+                'anonymous': (401, 0), 'viewer': (201, 10), 'editor': (201, 10), 'admin': (201, 10),
+            }),
+            'comments:comment-detail': ('GET', f'/api/comments/{own_comment.pk}/', None, {
+                'anonymous': (401, 0), 'viewer': (200, 1), 'editor': (200, 1), 'admin': (200, 1),
+            }),
+            'comments:comment-update': ('PATCH', f'/api/comments/{own_comment.pk}/update/', {
+                'content': 'Edited: the flame graph section was the most useful part.',
+            }, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (404, 1),
+            }),
+            'comments:comment-delete': ('DELETE', f'/api/comments/{own_comment.pk}/delete/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (404, 1),
+            }),
+            'comments:comment-moderate': ('PATCH', f'/api/comments/{pending_comment.pk}/moderate/', {
+                'action': 'approve',
+            }, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 15),
+            }),
+            'comments:comment-bulk-moderate': ('POST', '/api/comments/moderate/bulk/', {
+                'action': 'approve', 'blog': self.data['blogs'][2].id, 'status': 'pending',
+            }, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 10),
+            }),
+            'comments:pending-comments': ('GET', '/api/comments/pending/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 2),
+            }),
+            'comments:my-comments': ('GET', '/api/comments/my-comments/', None, {
+                'anonymous': (401, 0), 'viewer': (200, 2), 'editor': (200, 2), 'admin': (200, 1),
+            }),
+            'comments:spam-rule-list': ('GET', '/api/comments/spam-rules/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 2),
+            }),
+            'comments:spam-rule-create': ('POST', '/api/comments/spam-rules/', {
+                'pattern': 'cheap followers', 'weight': 1.5,
+            }, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (201, 3),
+            }),
+            'comments:spam-rule-update': ('PATCH', f'/api/comments/spam-rules/{spam_rule.pk}/', {
+                'weight': 2.0,
+            }, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 2),
+            }),
+            'comments:queue-claim': ('POST', '/api/comments/queue/claim/', {'size': 5}, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 6),
+            }),
+            'comments:queue-throughput': ('GET', '/api/comments/queue/throughput/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 1),
+            }),
+            'comments:comment-stats': ('GET', '/api/comments/stats/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 1),
+            }),
+            'comments:comment-daily-stats': ('GET', f'/api/comments/stats/daily/?blog={blog.slug}', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 1),
+            }),
+            'comments:comment-blog-stats': ('GET', '/api/comments/stats/blogs/?days=7', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 1),
+            }),
+        }
+        return expand_cases(expected)
+
+
+class CommentThreadTests(APITestCase):
+    """Tests for threaded replies stored with materialized paths"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+        cls.blog = cls.data['blogs'][0]
+        cls.root = cls.data['comments'][0]
+
+    def reply(self, parent, status='approved'):
+        return Comment.objects.create(
+            blog=self.blog, parent=parent, user=self.data['users']['viewer'],
+            content='A reply that is long enough.', status=status,
+        )
+
+    def test_path_extends_parent_path(self):
+        child = self.reply(self.root)
+        grandchild = self.reply(child)
+
+        self.assertEqual(self.root.path, Comment.path_segment(self.root.pk))
+        self.assertEqual(grandchild.path, self.root.path + Comment.path_segment(child.pk)
+                         + Comment.path_segment(grandchild.pk))
+        self.assertEqual(grandchild.depth, 2)
+        self.assertEqual(grandchild.parent_path, child.path)
+
+    def test_reply_count_tracks_approved_replies(self):
+        before = Comment.objects.get(pk=self.root.pk).reply_count
+        pending = self.reply(self.root, status='pending')
+        self.assertEqual(Comment.objects.get(pk=self.root.pk).reply_count, before)
+
+        Comment.objects.get(pk=pending.pk).approve()
+        self.assertEqual(Comment.objects.get(pk=self.root.pk).reply_count, before + 1)
+
+        Comment.objects.get(pk=pending.pk).delete()
+        self.assertEqual(Comment.objects.get(pk=self.root.pk).reply_count, before)
+
+    def test_tree_is_nested_and_depth_limited(self):
+        self.client.force_authenticate(self.data['users']['viewer'])
+        url = f'/api/comments/blog/{self.blog.slug}/'
+
+        response = self.client.get(url, {'tree': 1, 'depth': 2})
+        roots = {comment['id']: comment for comment in response.data['results']}
+        self.assertTrue(all(comment['depth'] == 0 for comment in roots.values()))
+        first_reply = self.data['replies'][0]
+        replies = roots[self.root.pk]['replies']
+        self.assertIn(first_reply.pk, [reply['id'] for reply in replies])
+        nested = next(reply for reply in replies if reply['id'] == first_reply.pk)
+        self.assertEqual([reply['id'] for reply in nested['replies']], [self.data['replies'][5].pk])
+        self.assertEqual(roots[self.root.pk]['reply_count'], len(replies))
+
+        response = self.client.get(url, {'tree': 1, 'depth': 1})
+        roots = {comment['id']: comment for comment in response.data['results']}
+        self.assertTrue(all(reply['replies'] == [] for reply in roots[self.root.pk]['replies']))
+
+    def test_tree_hides_pending_replies_from_other_users(self):
+        self.client.force_authenticate(self.data['users']['editor'])
+        pending = self.data['replies'][4]
+        response = self.client.get(f'/api/comments/blog/{self.blog.slug}/?tree=1')
+
+        reply_ids = [
+            reply['id'] for comment in response.data['results'] for reply in comment['replies']
+        ]
+        self.assertNotIn(pending.pk, reply_ids)
+
+    def test_cannot_reply_to_pending_comment(self):
+        self.client.force_authenticate(self.data['users']['viewer'])
+        response = self.client.post(f'/api/comments/blog/{self.blog.slug}/create/', {
+            'blog_id': self.blog.id,
+            'parent_id': self.data['comments'][2].id,
+            'content': 'Replying to a comment awaiting moderation.',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent_id', response.data)
+
+
+class CommentCountTests(APITestCase):
+    """Tests for the denormalized comment counts on Blog"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+        cls.blog = cls.data['blogs'][1]
+
+    def counts(self):
+        blog = Blog.objects.get(pk=self.blog.pk)
+        return blog.approved_comment_count, blog.pending_comment_count
+
+    def expected_counts(self):
+        comments = Comment.objects.filter(blog=self.blog)
+        return comments.filter(status='approved').count(), comments.filter(status='pending').count()
+
+    def test_seeded_counts_match(self):
+        self.assertEqual(self.counts(), (10, 0))
+        self.assertEqual(self.counts(), self.expected_counts())
+
+    def test_create_moderate_and_delete(self):
+        comment = Comment.objects.create(
+            blog=self.blog, user=self.data['users']['viewer'], content='A new comment to moderate.'
+        )
+        self.assertEqual(self.counts(), (10, 1))
+
+        Comment.objects.get(pk=comment.pk).approve()
+        self.assertEqual(self.counts(), (11, 0))
+
+        Comment.objects.get(pk=comment.pk).mark_as_spam()
+        self.assertEqual(self.counts(), (10, 0))
+
+        Comment.objects.get(pk=self.data['comments'][1].pk).delete()
+        self.assertEqual(self.counts(), (9, 0))
+        self.assertEqual(self.counts(), self.expected_counts())
+
+    def test_moderation_endpoint_updates_counts(self):
+        comment = Comment.objects.create(
+            blog=self.blog, user=self.data['users']['viewer'], content='A new comment to moderate.'
+        )
+        self.client.force_authenticate(self.data['users']['admin'])
+        response = self.client.patch(f'/api/comments/{comment.pk}/moderate/', {'action': 'approve'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(), (11, 0))
+
+    def test_concurrent_moderations_count_once(self):
+        comment = Comment.objects.create(
+            blog=self.blog, user=self.data['users']['viewer'], content='A new comment to moderate.'
+        )
+        # Two moderators loaded the comment while it was pending
+        first, second = Comment.objects.get(pk=comment.pk), Comment.objects.get(pk=comment.pk)
+        first.approve()
+        second.mark_as_spam()
+        self.assertEqual(self.counts(), (10, 0))
+
+        # A stale copy saved without a status change does not undo the last one
+        first.content = 'Edited by the first moderator.'
+        first.save()
+        self.assertEqual(Comment.objects.get(pk=comment.pk).status, 'spam')
+        self.assertEqual(self.counts(), self.expected_counts())
+
+    def test_blog_save_does_not_overwrite_counts(self):
+        stale = Blog.objects.get(pk=self.blog.pk)
+        Comment.objects.create(blog=self.blog, user=self.data['users']['viewer'], content='Arrives meanwhile.')
+        stale.title = 'Renamed while a comment arrived'
+        stale.save()
+
+        self.assertEqual(self.counts(), (10, 1))
+
+    def test_reconcile_fixes_drift(self):
+        Blog.objects.filter(pk=self.blog.pk).update(approved_comment_count=40, pending_comment_count=0)
+        Comment.objects.filter(pk=self.data['comments'][0].pk).update(reply_count=9)
+        out = StringIO()
+
+        call_command('reconcile_comment_counts', '--dry-run', stdout=out)
+        self.assertIn('blogs: 1 with drifted counts', out.getvalue())
+        self.assertIn('comments: 1 with drifted counts', out.getvalue())
+        self.assertEqual(self.counts(), (40, 0))
+
+        call_command('reconcile_comment_counts', stdout=out)
+        self.assertEqual(self.counts(), self.expected_counts())
+        self.assertEqual(Comment.objects.get(pk=self.data['comments'][0].pk).reply_count, 2)
+
+
+class CommentStatsTests(APITestCase):
+    """Tests for the comment statistics counter tables"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def setUp(self):
+        self.client.force_authenticate(self.data['users']['admin'])
+
+    def expected_totals(self):
+        return {status: Comment.objects.filter(status=status).count() for status, _ in Comment.STATUS_CHOICES}
+
+    def test_stats_match_comments(self):
+        totals = self.expected_totals()
+        with self.assertNumQueries(1):
+            self.assertEqual(stats.status_totals(), totals)
+
+        response = self.client.get('/api/comments/stats/')
+        self.assertEqual(response.data, {
+            'total_comments': Comment.objects.count(),
+            'approved_comments': totals['approved'],
+            'pending_comments': totals['pending'],
+            'spam_comments': totals['spam'],
+        })
+
+    def test_writes_keep_totals_in_step(self):
+        blog = self.data['blogs'][1]
+        comment = Comment.objects.create(blog=blog, user=self.data['users']['viewer'], content='Counted once.')
+        Comment.objects.get(pk=comment.pk).approve()
+        Comment.objects.get(pk=self.data['comments'][2].pk).delete()
+        self.client.post('/api/comments/moderate/bulk/', {'action': 'spam', 'blog': blog.id}, format='json')
+        self.assertEqual(stats.status_totals(), self.expected_totals())
+
+        Blog.objects.get(pk=self.data['blogs'][0].pk).delete()
+        self.assertEqual(stats.status_totals(), self.expected_totals())
+        self.assertFalse(CommentDailyStats.objects.filter(blog_id=self.data['blogs'][0].pk).exists())
+    
+    def test_deleting_an_author_with_commented_blogs(self):
+        author = self.data['users']['editor']
+        blog_ids = list(author.blogs.filter(comments__isnull=False).values_list('id', flat=True).distinct())
+        self.assertTrue(blog_ids)
+        
+        User.objects.get(pk=author.pk).delete()
+        self.assertEqual(stats.status_totals(), self.expected_totals())
+        self.assertFalse(CommentDailyStats.objects.filter(blog_id__in=blog_ids).exists())
+        
+        # Later deletes of other comments are still counted
+        Comment.objects.first().delete()
+        self.assertEqual(stats.status_totals(), self.expected_totals())
+
+    def test_daily_and_blog_breakdowns(self):
+        blog = self.data['blogs'][1]
+        response = self.client.get('/api/comments/stats/daily/', {'blog': blog.slug})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(row['approved_comments'] for row in response.data), 10)
+        self.assertEqual(sum(row['pending_comments'] + row['spam_comments'] for row in response.data), 0)
+
+        response = self.client.get('/api/comments/stats/blogs/')
+        by_slug = {row['slug']: row for row in response.data}
+        self.assertEqual(by_slug[blog.slug]['approved_comments'], 10)
+        self.assertEqual(by_slug[self.data['blogs'][2].slug]['pending_comments'], 10)
+
+    def test_reconcile_rebuilds_drifted_stats(self):
+        CommentDailyStats.objects.all().delete()
+        out = StringIO()
+
+        call_command('reconcile_comment_counts', '--dry-run', stdout=out)
+        self.assertIn('comment statistics: drifted', out.getvalue())
+
+        call_command('reconcile_comment_counts', stdout=out)
+        self.assertIn('comment statistics: rebuilt', out.getvalue())
+        self.assertEqual(stats.status_totals(), self.expected_totals())
+        self.assertEqual(
+            CommentDailyStats.objects.filter(blog=self.data['blogs'][2], status='pending').get().count, 10
+        )
+
+
+class VelocityTests(APITestCase):
+    """Tests for the sliding-window velocity limits on new comments"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def setUp(self):
+        cache.clear()
+
+    def post(self, user, content, ip='203.0.113.7'):
+        self.client.force_authenticate(user)
+        return self.client.post(
+            '/api/comments/blog/x/create/',
+            {'blog_id': self.data['blogs'][0].id, 'content': content},
+            REMOTE_ADDR=ip,
+        )
+
+    def test_keys(self):
+        self.assertEqual(velocity.subnet('203.0.113.7'), '203.0.113.0/24')
+        self.assertEqual(velocity.subnet('2001:db8:1:2::1'), '2001:db8:1::/48')
+        self.assertIsNone(velocity.subnet('unknown'))
+        self.assertEqual(
+            velocity.fingerprint('Buy  NOW, cheap!'), velocity.fingerprint('buy now cheap')
+        )
+
+    def test_forwarded_for_is_only_read_behind_trusted_proxies(self):
+        request = RequestFactory().get(
+            '/', REMOTE_ADDR='10.0.0.2', HTTP_X_FORWARDED_FOR='1.2.3.4, 198.51.100.9, 10.0.0.1',
+        )
+        self.assertEqual(velocity.client_ip(request), '10.0.0.2')
+        with override_settings(TRUSTED_PROXY_COUNT=2):
+            self.assertEqual(velocity.client_ip(request), '198.51.100.9')
+        with override_settings(TRUSTED_PROXY_COUNT=5):
+            self.assertEqual(velocity.client_ip(request), '1.2.3.4')
+
+    @override_settings(COMMENT_VELOCITY_RULES={'ip': {'limit': 1, 'window': 60, 'action': 'reject'}})
+    def test_forged_forwarded_for_does_not_reset_the_ip_limit(self):
+        self.client.force_authenticate(self.data['users']['viewer'])
+        statuses = [
+            self.client.post('/api/comments/blog/x/create/', {
+                'blog_id': self.data['blogs'][0].id, 'content': f'Comment {index} with a fresh fake address.',
+            }, REMOTE_ADDR='203.0.113.7', HTTP_X_FORWARDED_FOR=f'192.0.2.{index}').status_code
+            for index in range(2)
+        ]
+        self.assertEqual(statuses, [201, 429])
+
+    def test_non_object_body_is_a_validation_error(self):
+        self.client.force_authenticate(self.data['users']['viewer'])
+        response = self.client.post('/api/comments/blog/x/create/', ['content'], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_previous_window_is_weighted_by_overlap(self):
+        rules = {'ip': {'limit': 4, 'window': 60, 'action': 'reject'}}
+        with override_settings(COMMENT_VELOCITY_RULES=rules):
+            for _ in range(4):
+                self.assertEqual(velocity.hit({'ip': '198.51.100.1'}, now=6000).action, 'allow')
+            # Halfway through the next window, half of the previous 4 still count.
+            self.assertEqual(velocity.hit({'ip': '198.51.100.1'}, now=6090).action, 'allow')
+            self.assertEqual(velocity.hit({'ip': '198.51.100.1'}, now=6090).action, 'allow')
+            decision = velocity.hit({'ip': '198.51.100.1'}, now=6090)
+            self.assertEqual((decision.action, decision.rule, decision.retry_after), ('reject', 'ip', 30))
+            # Two windows later the key has started over.
+            self.assertEqual(velocity.hit({'ip': '198.51.100.1'}, now=6240).action, 'allow')
+
+    def test_repeated_content_across_accounts_is_held(self):
+        users = [self.data['users'][role] for role in ('viewer', 'editor', 'admin')]
+        content = 'Great post! Visit my page for more tips.'
+        statuses = []
+        for index, user in enumerate(users + users[:1]):
+            response = self.post(user, content.upper() if index % 2 else content, ip=f'198.51.{index}.1')
+            self.assertEqual(response.status_code, 201)
+            statuses.append(Comment.objects.latest('id').status)
+        self.assertEqual(statuses[-1], 'spam')
+        self.assertNotIn('spam', statuses[:3])
+
+    @override_settings(COMMENT_VELOCITY_RULES={'ip': {'limit': 2, 'window': 60, 'action': 'reject'}})
+    def test_ip_burst_is_rejected_before_writing(self):
+        users = [self.data['users'][role] for role in ('viewer', 'editor', 'admin')]
+        before = Comment.objects.count()
+        responses = [self.post(user, f'Comment number {index} from a shared address.')
+                     for index, user in enumerate(users)]
+
+        self.assertEqual([response.status_code for response in responses], [201, 201, 429])
+        self.assertIn('Retry-After', responses[2])
+        self.assertEqual(Comment.objects.count(), before + 2)
+
+
+class NearDuplicateTests(APITestCase):
+    """Tests for the SimHash near-duplicate index"""
+
+    CAMPAIGN = ('Loved this article about databases! I made {} dollars last week working from home, '
+                'check out my profile to learn how you can do it too.')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.data['users']['viewer'])
+
+    def post(self, content):
+        response = self.client.post('/api/comments/blog/x/create/', {
+            'blog_id': self.data['blogs'][0].id, 'content': content,
+        }, REMOTE_ADDR='198.51.100.20')
+        self.assertEqual(response.status_code, 201)
+        return Comment.objects.latest('id')
+
+    def test_similar_texts_have_similar_signatures(self):
+        first = duplicates.signature(self.CAMPAIGN.format(500))
+        second = duplicates.signature(self.CAMPAIGN.format(900).upper())
+        unrelated = duplicates.signature(
+            'The flame graph in the second section was really helpful, especially the part about '
+            'connection pooling under load.'
+        )
+        self.assertGreaterEqual(duplicates.similarity(first, second), 0.7)
+        self.assertLess(duplicates.similarity(first, unrelated), 0.2)
+        self.assertTrue(set(duplicates.band_keys(first)) & set(duplicates.band_keys(second)))
+        self.assertIsNone(duplicates.signature('Great post, thanks!'))
+
+    def test_every_comment_is_indexed(self):
+        comment = self.post(self.CAMPAIGN.format(500))
+        fingerprint = CommentFingerprint.objects.get(comment=comment)
+        self.assertEqual(list(duplicates.unpack(fingerprint.signature)), duplicates.signature(comment.content))
+        self.assertEqual(fingerprint.bands.count(), duplicates.BANDS)
+
+    def test_copies_of_spam_are_flagged(self):
+        first = self.post(self.CAMPAIGN.format(500))
+        self.assertEqual(first.status, 'pending')
+        first.mark_as_spam()
+
+        with self.assertNumQueries(1):
+            self.assertTrue(duplicates.is_near_duplicate(self.CAMPAIGN.format(750)))
+        self.assertEqual(self.post(self.CAMPAIGN.format(750)).status, 'spam')
+
+    @override_settings(NEAR_DUPLICATE_LIMIT=3)
+    def test_floods_of_recent_copies_are_flagged(self):
+        statuses = [self.post(self.CAMPAIGN.format(amount)).status for amount in (100, 200, 300, 400)]
+        self.assertEqual(statuses, ['pending', 'pending', 'pending', 'spam'])
+
+    def test_window_bounds_the_index(self):
+        comment = self.post(self.CAMPAIGN.format(500))
+        comment.mark_as_spam()
+        CommentFingerprint.objects.filter(comment=comment).update(
+            created_at=timezone.now() - timedelta(days=30)
+        )
+        self.assertFalse(duplicates.is_near_duplicate(self.CAMPAIGN.format(750)))
+
+        out = StringIO()
+        call_command('rebuild_comment_fingerprints', '--prune', stdout=out)
+        self.assertEqual(out.getvalue(), 'Pruned 1 fingerprints\n')
+
+        long_enough = [content for content in Comment.objects.values_list('content', flat=True)
+                       if duplicates.signature(content) is not None]
+        call_command('rebuild_comment_fingerprints', stdout=out)
+        self.assertIn(f'Indexed {len(long_enough)} comments', out.getvalue())
+        self.assertEqual(CommentFingerprint.objects.count(), len(long_enough))
+        self.assertTrue(duplicates.is_near_duplicate(self.CAMPAIGN.format(750)))
+
+
+    def test_new_comments_queue_a_prune_now_and_then(self):
+        old = self.post(self.CAMPAIGN.format(500))
+        CommentFingerprint.objects.filter(comment=old).update(created_at=timezone.now() - timedelta(days=30))
+        cache.delete(duplicates.PRUNE_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post(self.CAMPAIGN.format(600))
+            self.post(self.CAMPAIGN.format(700))
+
+        job = Job.objects.get()
+        self.assertEqual(job.task, tasks.prune_fingerprints.task_name)
+        get_task(job.task)(**job.kwargs)
+        self.assertFalse(CommentFingerprint.objects.filter(comment=old).exists())
+        self.assertEqual(CommentFingerprint.objects.count(), 2)
+
+
+class CommentStreamTests(APITestCase):
+    """Tests for the live comment stream and the ?since= list mode"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+        cls.blog = cls.data['blogs'][2]  # Its comments are all pending
+        cls.token = str(RefreshToken.for_user(cls.data['users']['viewer']).access_token)
+
+    def ticket(self):
+        return live.issue_ticket(self.data['users']['viewer'])
+
+    async def next_event(self, events):
+        return await asyncio.wait_for(anext(events), timeout=5)
+
+    async def disconnect(self, events):
+        """A client disconnecting cancels the stream while it waits."""
+        waiting = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+
+    def approve(self, comment):
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.approve()
+
+    async def test_stream_pushes_approved_comments(self):
+        pending = [comment async for comment in Comment.objects.filter(blog=self.blog).order_by('id')]
+        response = await AsyncClient().get(
+            f'/api/comments/blog/{self.blog.slug}/stream/', {'ticket': self.ticket()}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        # Nothing is subscribed until the response is read
+        self.assertFalse(live.get_broker().is_listening(live.channel(self.blog.id)))
+        events = aiter(response.streaming_content)
+        self.assertTrue((await self.next_event(events)).startswith(b'retry:'))
+        self.assertTrue(live.get_broker().is_listening(live.channel(self.blog.id)))
+
+        await sync_to_async(self.approve)(pending[3])
+        event = (await self.next_event(events)).decode()
+        self.assertTrue(event.startswith(f'id: {pending[3].id}\nevent: comment\n'))
+        data = json.loads(event.split('data: ', 1)[1])
+        self.assertEqual((data['id'], data['status']), (pending[3].id, 'approved'))
+
+        await self.disconnect(events)
+        self.assertFalse(live.get_broker().is_listening(live.channel(self.blog.id)))
+
+    async def test_reconnect_replays_missed_comments(self):
+        pending = [comment async for comment in Comment.objects.filter(blog=self.blog).order_by('id')]
+        for comment in pending[1:3]:
+            await sync_to_async(comment.approve)()
+        response = await AsyncClient().get(
+            f'/api/comments/blog/{self.blog.slug}/stream/',
+            headers={'Authorization': f'Bearer {self.token}', 'Last-Event-ID': str(pending[0].id)},
+        )
+        events = aiter(response.streaming_content)
+        await self.next_event(events)
+        replayed = [(await self.next_event(events)).decode() for _ in range(2)]
+        self.assertEqual([event.split('\n', 1)[0] for event in replayed],
+                         [f'id: {comment.id}' for comment in pending[1:3]])
+        await self.disconnect(events)
+
+    async def test_comments_approved_during_replay_are_not_lost(self):
+        pending = [comment async for comment in Comment.objects.filter(blog=self.blog).order_by('id')]
+        replay = views.stream_replay
+
+        def replay_then_approve(blog_id, since):
+            missed = replay(blog_id, since)
+            self.approve(pending[4])
+            return missed
+
+        with mock.patch.object(views, 'stream_replay', replay_then_approve):
+            response = await AsyncClient().get(
+                f'/api/comments/blog/{self.blog.slug}/stream/', {'ticket': self.ticket(), 'since': pending[0].id}
+            )
+            events = aiter(response.streaming_content)
+            await self.next_event(events)
+            event = (await self.next_event(events)).decode()
+        self.assertTrue(event.startswith(f'id: {pending[4].id}\n'))
+        await self.disconnect(events)
+
+    async def test_stream_requires_authentication(self):
+        url = f'/api/comments/blog/{self.blog.slug}/stream/'
+        response = await AsyncClient().get(url, {'ticket': 'bad'})
+        self.assertEqual(response.status_code, 401)
+        # An access token is not accepted in the URL
+        response = await AsyncClient().get(url, {'token': self.token})
+        self.assertEqual(response.status_code, 401)
+        response = await AsyncClient().get('/api/comments/blog/missing/stream/', {'ticket': self.ticket()})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_tickets_are_single_use(self):
+        response = await sync_to_async(self.client.post)('/api/comments/stream/ticket/')
+        self.assertEqual(response.status_code, 401)
+
+        self.client.force_authenticate(self.data['users']['viewer'])
+        response = await sync_to_async(self.client.post)('/api/comments/stream/ticket/')
+        self.assertEqual(response.status_code, 200)
+        ticket = response.data['ticket']
+        self.assertNotIn(self.token, ticket)
+
+        url = f'/api/comments/blog/{self.blog.slug}/stream/'
+        self.assertEqual((await AsyncClient().get(url, {'ticket': ticket})).status_code, 200)
+        self.assertEqual((await AsyncClient().get(url, {'ticket': ticket})).status_code, 401)
+
+    def test_since_lists_newer_comments_in_id_order(self):
+        blog = self.data['blogs'][1]
+        self.client.force_authenticate(self.data['users']['viewer'])
+        comments = list(Comment.objects.filter(blog=blog).order_by('id'))
+        url = f'/api/comments/blog/{blog.slug}/'
+
+        response = self.client.get(url, {'since': comments[6].id})
+        self.assertEqual([comment['id'] for comment in response.data['results']],
+                         [comment.id for comment in comments[7:]])
+        self.assertEqual(response.data['since'], comments[-1].id)
+
+        response = self.client.get(url, {'since': comments[-1].id})
+        self.assertEqual(response.data, {'since': comments[-1].id, 'results': []})
+        self.assertEqual(self.client.get(url, {'since': 'x'}).status_code, 400)
+
+
+class ModerationQueueTests(APITestCase):
+    """Tests for lease-based claiming of pending comments"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+        cls.admin = cls.data['users']['admin']
+        cls.other_admin = User.objects.create_user(
+            email='admin2@perf.test', name='Second Admin', password='x', role='Admin', is_staff=True
+        )
+        cls.pending = list(Comment.objects.filter(status='pending').order_by('created_at', 'id'))
+
+    def claim(self, user, size):
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/comments/queue/claim/', {'size': size}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [comment['id'] for comment in response.data['comments']]
+
+    def test_moderators_get_disjoint_oldest_first_batches(self):
+        first = self.claim(self.admin, 4)
+        second = self.claim(self.other_admin, 4)
+
+        self.assertEqual(first, [comment.id for comment in self.pending[:4]])
+        self.assertEqual(second, [comment.id for comment in self.pending[4:8]])
+
+    def test_claiming_again_renews_and_tops_up(self):
+        first = self.claim(self.admin, 3)
+        Comment.objects.get(pk=first[0]).approve()
+
+        self.assertEqual(self.claim(self.admin, 3), first[1:] + [self.pending[3].id])
+
+    def test_expired_leases_return_to_the_pool(self):
+        first = self.claim(self.admin, 2)
+        Comment.objects.filter(pk__in=first).update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.claim(self.other_admin, 2), first)
+
+    def test_release(self):
+        first = self.claim(self.admin, 3)
+        response = self.client.post('/api/comments/queue/release/', {'ids': first[:1]}, format='json')
+        self.assertEqual(response.data, {'released': 1})
+
+        self.assertEqual(self.claim(self.other_admin, 1), first[:1])
+
+    def test_moderation_respects_leases_and_records_moderator(self):
+        comment_id = self.claim(self.other_admin, 1)[0]
+        self.client.force_authenticate(self.admin)
+        response = self.client.patch(f'/api/comments/{comment_id}/moderate/', {'action': 'approve'})
+        self.assertEqual(response.status_code, 400)
+
+        self.client.force_authenticate(self.other_admin)
+        response = self.client.patch(f'/api/comments/{comment_id}/moderate/', {'action': 'approve'})
+        self.assertEqual(response.status_code, 200)
+        comment = Comment.objects.get(pk=comment_id)
+        self.assertEqual((comment.moderated_by, comment.claimed_by), (self.other_admin, None))
+
+        response = self.client.get('/api/comments/queue/throughput/', {'minutes': 10})
+        self.assertEqual(response.data['moderators'], [{
+            'moderator_id': self.other_admin.id, 'moderator': 'Second Admin', 'moderated': 1, 'per_minute': 0.1,
+        }])
+
+    def test_claim_is_a_compare_and_set(self):
+        held = self.claim(self.admin, 2)
+        # Another moderator racing for the same rows only gets the unclaimed ones.
+        taken = queue.claimable(timezone.now()).filter(id__in=held + [self.pending[2].id]).update(
+            claimed_by=self.other_admin, claim_expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        self.assertEqual(taken, 1)
+
+
+class SpamRuleTests(APITestCase):
+    """Tests for the spam keyword automaton and the rules that feed it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def test_automaton_matches_substring_search(self):
+        rng = random.Random(7)
+        for _ in range(500):
+            patterns = [''.join(rng.choices('ab c', k=rng.randint(1, 4))) for _ in range(rng.randint(1, 8))]
+            text = ''.join(rng.choices('abcd ', k=rng.randint(0, 40)))
+            expected = {index for index, pattern in enumerate(patterns) if pattern in text}
+            self.assertEqual(KeywordAutomaton(patterns).find(text), expected, (patterns, text))
+
+    def test_weights_and_threshold(self):
+        rules = [('casino', 1.0), ('free spins', 1.5), ('jackpot', 0.5)]
+        small = SpamFilter(rules, threshold=2.0)
+        self.assertEqual(small.score('Free spins at the CASINO, free spins!'), 2.5)
+        self.assertTrue(small.is_spam('Free spins at the casino'))
+        self.assertFalse(small.is_spam('A casino jackpot'))
+
+        padding = [(f'unused pattern {index}', 1.0) for index in range(SpamFilter.AUTOMATON_MIN_RULES)]
+        large = SpamFilter(rules + padding, threshold=2.0)
+        self.assertIsNotNone(large.automaton)
+        self.assertEqual(large.score('Free spins at the CASINO, free spins!'), 2.5)
+
+    def test_default_keywords_are_seeded(self):
+        comment = Comment.objects.create(
+            blog=self.data['blogs'][0], user=self.data['users']['viewer'],
+            content='Congratulations, you are a lottery winner!',
+        )
+        self.assertEqual(comment.status, 'spam')
+
+    def test_rule_changes_apply_without_restart(self):
+        def post():
+            return Comment.objects.create(
+                blog=self.data['blogs'][0], user=self.data['users']['viewer'],
+                content='Get cheap followers for your profile today.',
+            )
+
+        self.assertEqual(post().status, 'pending')
+
+        self.client.force_authenticate(self.data['users']['admin'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/comments/spam-rules/', {'pattern': 'Cheap Followers', 'weight': 2}, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['pattern'], 'cheap followers')
+        self.assertEqual(post().status, 'spam')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/comments/spam-rules/{response.data['id']}/", {'is_active': False})
+        self.assertEqual(post().status, 'pending')
+
+
+@override_settings(SPAM_CLASSIFIER_MIN_DOCUMENTS=5)
+class SpamClassifierTests(APITestCase):
+    """Tests for the naive Bayes classifier trained from moderation"""
+
+    SPAM = [
+        'Cheap pills discount pharmacy order {} today',
+        'Best crypto returns, double your bitcoin {} fast',
+        'Discount pharmacy pills shipped {} overnight',
+    ]
+    HAM = [
+        'The profiling section about query {} was useful',
+        'We saw the same cache behaviour in production {} too',
+        'Thanks, the database index advice {} saved us time',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def setUp(self):
+        classifier._cached['model'] = None
+        self.addCleanup(classifier._cached.update, model=None)
+
+    def comment(self, content, status='pending'):
+        return Comment.objects.create(
+            blog=self.data['blogs'][0], user=self.data['users']['viewer'], content=content, status=status
+        )
+
+    def train(self, count=6):
+        for index in range(count):
+            self.comment(self.SPAM[index % 3].format(index)).train_classifier('spam')
+            self.comment(self.HAM[index % 3].format(index)).train_classifier('ham')
+        classifier._cached['model'] = None
+
+    def test_moderation_updates_token_counts(self):
+        comment = self.comment('Cheap pills from our discount pharmacy')
+        self.client.force_authenticate(self.data['users']['admin'])
+
+        self.client.patch(f'/api/comments/{comment.pk}/moderate/', {'action': 'spam'})
+        self.assertEqual(SpamToken.objects.get(token='pharmacy').spam_count, 1)
+        self.assertEqual(SpamToken.objects.get(token=classifier.DOCUMENTS).spam_count, 1)
+
+        # Changing the decision moves the example to the other class.
+        self.client.patch(f'/api/comments/{comment.pk}/moderate/', {'action': 'approve'})
+        token = SpamToken.objects.get(token='pharmacy')
+        self.assertEqual((token.spam_count, token.ham_count), (0, 1))
+        self.assertEqual(Comment.objects.get(pk=comment.pk).classifier_label, 'ham')
+
+    def test_relabelling_an_edited_comment_undoes_what_was_learned(self):
+        admin = self.data['users']['admin']
+        comment = Comment.objects.create(
+            blog=self.data['blogs'][0], user=admin, content='Cheap pills from our discount pharmacy'
+        )
+        self.client.force_authenticate(admin)
+        self.client.patch(f'/api/comments/{comment.pk}/moderate/', {'action': 'approve'})
+
+        # The author edits the comment after the decision
+        response = self.client.patch(f'/api/comments/{comment.pk}/update/', {'content': 'Completely different words'})
+        self.assertEqual(response.status_code, 200)
+        self.client.patch(f'/api/comments/{comment.pk}/moderate/', {'action': 'spam'})
+
+        self.assertFalse(SpamToken.objects.filter(Q(spam_count__lt=0) | Q(ham_count__lt=0)).exists())
+        pharmacy = SpamToken.objects.get(token='pharmacy')
+        self.assertEqual((pharmacy.spam_count, pharmacy.ham_count), (0, 0))
+        different = SpamToken.objects.get(token='different')
+        self.assertEqual((different.spam_count, different.ham_count), (1, 0))
+
+        classifier._cached['model'] = None
+        self.assertEqual(self.comment('A new comment after the relabel').status, 'pending')
+
+    def test_negative_counts_do_not_break_the_model(self):
+        model = classifier.NaiveBayes({'word': [-1, 0], classifier.DOCUMENTS: [0, -1]}).compile()
+        self.assertGreater(model.probability('word'), 0)
+
+    def test_untrained_model_does_not_score(self):
+        comment = self.comment('Cheap pills from our discount pharmacy')
+        self.assertIsNone(comment.spam_score)
+        self.assertEqual(comment.status, 'pending')
+
+    def test_trained_model_flags_new_spam(self):
+        self.train()
+
+        spam = self.comment('Discount pills from the pharmacy, order now')
+        ham = self.comment('The query profiling advice was useful in production')
+        self.assertEqual(spam.status, 'spam')
+        self.assertGreater(spam.spam_score, 0.99)
+        self.assertEqual(ham.status, 'pending')
+        self.assertLess(ham.spam_score, 0.5)
+
+    def test_backtest_reports_precision_and_recall(self):
+        for index in range(30):
+            self.comment(self.SPAM[index % 3].format(index), status='spam')
+            self.comment(self.HAM[index % 3].format(index), status='approved')
+        out = StringIO()
+
+        call_command('backtest_spam_classifier', '--thresholds', '0.5', stdout=out)
+        row = out.getvalue().splitlines()[-1].split()
+        self.assertEqual(row[0], '0.500')
+        self.assertGreaterEqual(float(row[1]), 0.9)
+        self.assertGreaterEqual(float(row[2]), 0.9)
+
+
+class BulkModerationTests(APITestCase):
+    """Tests for set-based bulk moderation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def setUp(self):
+        self.client.force_authenticate(self.data['users']['admin'])
+
+    def moderate(self, **data):
+        return self.client.post('/api/comments/moderate/bulk/', data, format='json')
+
+    def assert_counts_consistent(self):
+        out = StringIO()
+        call_command('reconcile_comment_counts', '--dry-run', stdout=out)
+        self.assertEqual(
+            out.getvalue(),
+            'blogs: 0 with drifted counts\ncomments: 0 with drifted counts\ncomment statistics: in step\n',
+        )
+
+    def test_approve_by_blog(self):
+        blog = self.data['blogs'][2]
+        response = self.moderate(action='approve', blog=blog.id, status='pending')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'action': 'approve', 'matched': 10, 'updated': 10, 'skipped': 0})
+        self.assertFalse(Comment.objects.filter(blog=blog, status='pending').exists())
+        self.assertEqual(Blog.objects.get(pk=blog.pk).approved_comment_count, 10)
+        self.assert_counts_consistent()
+
+    def test_spam_by_ip_and_ids_updates_reply_counts(self):
+        replies = self.data['replies']
+        response = self.moderate(action='spam', ids=[reply.id for reply in replies])
+        self.assertEqual(response.data['updated'], 6)
+        self.assertEqual(Comment.objects.get(pk=self.data['comments'][0].pk).reply_count, 0)
+        self.assert_counts_consistent()
+
+        response = self.moderate(action='approve', ip_address='10.0.1.4')
+        self.assertEqual(response.data, {'action': 'approve', 'matched': 1, 'updated': 1, 'skipped': 0})
+        self.assert_counts_consistent()
+
+    def test_unchanged_comments_are_not_updated(self):
+        comments = Comment.objects.filter(user=self.data['users']['viewer'])
+        matched, changing = comments.count(), comments.exclude(status='approved').count()
+        response = self.moderate(action='approve', user=self.data['users']['viewer'].id)
+
+        self.assertEqual(response.data, {'action': 'approve', 'matched': matched, 'updated': changing, 'skipped': 0})
+        self.assertGreater(matched, changing)
+        self.assert_counts_consistent()
+
+    def test_comments_leased_to_another_moderator_are_skipped(self):
+        blog = self.data['blogs'][2]
+        other = User.objects.create_user(
+            email='admin2@perf.test', name='Second Admin', password='x', role='Admin', is_staff=True
+        )
+        pending = list(Comment.objects.filter(blog=blog, status='pending').order_by('id').values_list('id', flat=True))
+        expires_at = timezone.now() + timedelta(minutes=5)
+        Comment.objects.filter(id__in=pending[:3]).update(claimed_by=other, claim_expires_at=expires_at)
+        Comment.objects.filter(id__in=pending[3:5]).update(
+            claimed_by=self.data['users']['admin'], claim_expires_at=expires_at
+        )
+        Comment.objects.filter(id=pending[5]).update(claimed_by=other, claim_expires_at=timezone.now())
+
+        response = self.moderate(action='approve', blog=blog.id, status='pending')
+
+        self.assertEqual(response.data, {'action': 'approve', 'matched': 10, 'updated': 7, 'skipped': 3})
+        self.assertEqual(
+            list(Comment.objects.filter(blog=blog, status='pending').order_by('id').values_list('id', flat=True)),
+            pending[:3],
+        )
+        self.assertEqual(Comment.objects.filter(id__in=pending[:3], claimed_by=other).count(), 3)
+        self.assert_counts_consistent()
+
+    def test_selection_is_required(self):
+        response = self.moderate(action='spam', status='pending')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Comment.objects.filter(status='pending').exists())
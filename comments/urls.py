@@ -6,6 +6,8 @@ app_name = 'comments'
 urlpatterns = [
     # Comment CRUD endpoints
     path('blog/<slug:blog_slug>/', views.CommentListView.as_view(), name='comment-list'),
+    path('blog/<slug:blog_slug>/stream/', views.comment_stream, name='comment-stream'),
+    path('stream/ticket/', views.stream_ticket, name='stream-ticket'),
     path('blog/<slug:blog_slug>/create/', views.CommentCreateView.as_view(), name='comment-create'),
     path('<int:pk>/', views.CommentDetailView.as_view(), name='comment-detail'),
     path('<int:pk>/update/', views.CommentUpdateView.as_view(), name='comment-update'),
@@ -13,11 +15,19 @@ urlpatterns = [
     
     # Moderation endpoints
     path('<int:pk>/moderate/', views.CommentModerationView.as_view(), name='comment-moderate'),
+    path('moderate/bulk/', views.bulk_moderate_comments, name='comment-bulk-moderate'),
     path('pending/', views.PendingCommentsView.as_view(), name='pending-comments'),
+    path('queue/claim/', views.claim_moderation_batch, name='queue-claim'),
+    path('queue/release/', views.release_moderation_batch, name='queue-release'),
+    path('queue/throughput/', views.moderation_throughput, name='queue-throughput'),
+    path('spam-rules/', views.SpamRuleListCreateView.as_view(), name='spam-rule-list'),
+    path('spam-rules/<int:pk>/', views.SpamRuleDetailView.as_view(), name='spam-rule-detail'),
     
     # User-specific endpoints
     path('my-comments/', views.MyCommentsView.as_view(), name='my-comments'),
     
     # Statistics endpoints
     path('stats/', views.comment_stats, name='comment-stats'),
+    path('stats/daily/', views.comment_daily_stats, name='comment-daily-stats'),
+    path('stats/blogs/', views.comment_blog_stats, name='comment-blog-stats'),
 ]
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Velocity limits for new comments, checked before anything is written.
+
+Each rule counts comments per key (client IP, its /24 subnet, user, or a
+fingerprint of the normalized content) over a sliding window. The window is
+approximated from two fixed-window counters in the shared cache: the
+current window's count plus the previous window's count weighted by how
+much of it still overlaps the sliding window. That is two integers per key,
+which expire on their own, however busy the key is.
+
+A rule's ``action`` says what happens once its limit is exceeded: ``reject``
+refuses the comment (HTTP 429), ``hold`` stores it as spam for a moderator
+to review. Configure the rules with ``COMMENT_VELOCITY_RULES``.
+"""
+import hashlib
+import ipaddress
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from monitoring.metrics import COMMENT_VELOCITY
+
+
+KEY_PREFIX = 'comments:velocity'
+
+DEFAULT_RULES = {
+    'ip': {'limit': 20, 'window': 60, 'action': 'reject'},
+    'subnet': {'limit': 60, 'window': 60, 'action': 'hold'},
+    'user': {'limit': 30, 'window': 3600, 'action': 'hold'},
+    'content': {'limit': 3, 'window': 3600, 'action': 'hold'},
+}
+
+# Stronger actions win when several rules trip.
+ACTIONS = ('allow', 'hold', 'reject')
+
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def client_ip(request):
+    """Client IP address.
+
+    ``REMOTE_ADDR``, unless ``TRUSTED_PROXY_COUNT`` proxies stand in front of
+    the app: then the X-Forwarded-For entry the outermost of them added. The
+    entries left of it come from the client and may be made up.
+    """
+    proxies = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and x_forwarded_for:
+        hops = [hop.strip() for hop in x_forwarded_for.split(',')]
+        return hops[-min(proxies, len(hops))]
+    return request.META.get('REMOTE_ADDR')
+
+
+def subnet(ip):
+    """The /24 (IPv4) or /48 (IPv6) network containing ``ip``."""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    prefix = 24 if address.version == 4 else 48
+    return str(ipaddress.ip_network(f'{address}/{prefix}', strict=False))
+
+
+def fingerprint(content):
+    """Hash of the content with case, punctuation and spacing ignored."""
+    normalized = NON_WORD_RE.sub(' ', content.lower()).strip()
+    if not normalized:
+        return None
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+class Decision:
+    def __init__(self, action='allow', rule=None, retry_after=None):
+        self.action = action
+        self.rule = rule
+        self.retry_after = retry_after
+
+    def __repr__(self):
+        return f'<Decision {self.action} ({self.rule})>'
+
+
+def get_rules():
+    return getattr(settings, 'COMMENT_VELOCITY_RULES', DEFAULT_RULES)
+
+
+def hit(keys, now=None):
+    """Count one comment against every rule and decide what to do with it.
+
+    ``keys`` maps rule names to the key the comment counts under; rules
+    without a key (or not configured) are skipped.
+    """
+    now = time.time() if now is None else now
+    rules = get_rules()
+    windows = {}
+    for name, value in keys.items():
+        rule = rules.get(name)
+        if rule is None or value is None:
+            continue
+        index, elapsed = divmod(now, rule['window'])
+        base = f'{KEY_PREFIX}:{name}:{rule["window"]}:{value}'
+        windows[name] = (f'{base}:{int(index)}', f'{base}:{int(index) - 1}', elapsed / rule['window'])
+
+    previous = cache.get_many([previous_key for _, previous_key, _ in windows.values()])
+    decision = Decision()
+    for name, (current_key, previous_key, elapsed) in windows.items():
+        rule = rules[name]
+        cache.add(current_key, 0, timeout=rule['window'] * 2)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:  # Expired between add() and incr()
+            cache.set(current_key, 1, timeout=rule['window'] * 2)
+            current = 1
+        estimate = previous.get(previous_key, 0) * (1 - elapsed) + current
+        if estimate <= rule['limit']:
+            continue
+        COMMENT_VELOCITY.inc(rule=name, action=rule['action'])
+        if ACTIONS.index(rule['action']) > ACTIONS.index(decision.action):
+            retry_after = max(1, round(rule['window'] * (1 - elapsed)))
+            decision = Decision(rule['action'], name, retry_after)
+    return decision
+
+
+def check_comment(request, content):
+    """Velocity decision for a comment about to be created by ``request``."""
+    ip = client_ip(request)
+    return hit({
+        'ip': ip,
+        'subnet': subnet(ip) if ip else None,
+        'user': request.user.pk,
+        'content': fingerprint(content) if isinstance(content, str) else None,
+    })
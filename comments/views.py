@@ -1,28 +1,60 @@
+import asyncio
+from collections.abc import Mapping
+from asgiref.sync import sync_to_async
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed, Throttled
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db.models import Q
+from datetime import timedelta
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django_ratelimit.decorators import ratelimit
 from django.utils.decorators import method_decorator
-from .models import Comment
+from blogs.models import Blog
+from . import duplicates, live, queue, stats, velocity
+from .models import Comment, CommentDailyStats, SpamRule
 from .serializers import (
     CommentListSerializer,
+    CommentTreeSerializer,
     CommentDetailSerializer,
     CommentCreateSerializer,
     CommentUpdateSerializer,
-    CommentModerationSerializer
+    CommentModerationSerializer,
+    BulkModerationSerializer,
+    QueueClaimSerializer,
+    QueueReleaseSerializer,
+    SpamRuleSerializer
 )
+from .moderation import bulk_set_status
+from users.models import User
 from users.permissions import CommentPermission, IsAdminUser
 
 
+# Limits for the rollup-based statistics endpoints.
+MAX_STATS_DAYS = 366
+MAX_STATS_BLOGS = 100
+
+# Comments replayed to a reconnecting stream.
+MAX_STREAM_REPLAY = 100
+
+
 class CommentListView(generics.ListAPIView):
-    """List comments for a specific blog"""
+    """List comments for a specific blog
+    
+    With ``?tree=1`` the page holds top-level comments (or the replies to
+    ``?parent=<id>``) with their replies nested up to ``?depth=N`` levels.
+    """
     serializer_class = CommentListSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     search_fields = ['content', 'user__name']
-    filterset_fields = ['status']
+    filterset_fields = ['status', 'parent']
+    default_tree_depth = 3
     ordering_fields = ['created_at']
     ordering = ['created_at']
     
@@ -45,16 +77,198 @@ class CommentListView(generics.ListAPIView):
             queryset = queryset.filter(status='approved')
         
         return queryset
+    
+    def list(self, request, *args, **kwargs):
+        if 'since' in request.query_params:
+            return self.list_since(request)
+        if request.query_params.get('tree') not in ('1', 'true'):
+            return super().list(request, *args, **kwargs)
+        
+        try:
+            depth = min(int(request.query_params.get('depth', self.default_tree_depth)), Comment.MAX_DEPTH)
+        except ValueError:
+            depth = self.default_tree_depth
+        
+        roots = self.filter_queryset(self.get_queryset())
+        if 'parent' not in request.query_params:
+            roots = roots.filter(parent__isnull=True)
+        page = self.paginate_queryset(roots.order_by('path'))
+        comments = list(page) if page is not None else list(roots.order_by('path'))
+        self.attach_replies(comments, depth)
+        
+        serializer = CommentTreeSerializer(comments, many=True, context=self.get_serializer_context())
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
+    def list_since(self, request):
+        """Comments with ids above ``?since=``, oldest first, without a page count.
+        
+        Clients that cannot keep a stream open poll with the returned ``since``.
+        """
+        try:
+            since = int(request.query_params['since'])
+        except ValueError:
+            return Response({'since': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        limit = self.paginator.get_page_size(request)
+        comments = list(self.filter_queryset(self.get_queryset()).filter(id__gt=since).order_by('id')[:limit])
+        return Response({
+            'since': comments[-1].id if comments else since,
+            'results': self.get_serializer(comments, many=True).data,
+        })
+    
+    def attach_replies(self, roots, depth):
+        """Nest visible replies under ``roots`` using one range scan on path."""
+        for comment in roots:
+            comment.thread_replies = []
+        if not roots or depth < 1:
+            return
+        
+        # Paths sort depth-first, so every descendant of the page lies between
+        # the first root and the end of the last root's subtree.
+        replies = self.get_queryset().filter(
+            path__gt=roots[0].path,
+            path__lt=roots[-1].path + 'g',
+            depth__gt=roots[0].depth,
+            depth__lte=roots[0].depth + depth,
+        ).order_by('path')
+        
+        nodes = {comment.path: comment for comment in roots}
+        for reply in replies:
+            parent = nodes.get(reply.parent_path)
+            if parent is None:
+                continue  # Under a hidden comment or a root on another page
+            reply.thread_replies = []
+            parent.thread_replies.append(reply)
+            nodes[reply.path] = reply
 
 
 class CommentCreateView(generics.CreateAPIView):
-    """Create a new comment"""
+    """Create a new comment
+    
+    Velocity limits are checked before anything is validated or written:
+    bursts are refused with 429, or the comment is held as spam. So are
+    near-duplicates of spam or of many recent comments.
+    """
     serializer_class = CommentCreateSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     @method_decorator(ratelimit(key='user', rate='5/m', method='POST'))
     def post(self, request, *args, **kwargs):
+        # Bodies that are not objects are refused by the serializer
+        content = request.data.get('content') if isinstance(request.data, Mapping) else None
+        self.velocity = velocity.check_comment(request, content)
+        if self.velocity.action == 'reject':
+            raise Throttled(wait=self.velocity.retry_after, detail='Too many comments, please slow down.')
         return super().post(request, *args, **kwargs)
+    
+    def perform_create(self, serializer):
+        if (self.velocity.action == 'hold'
+                or duplicates.is_near_duplicate(serializer.validated_data['content'])):
+            serializer.save(status='spam')
+        else:
+            serializer.save()
+
+
+def stream_user(request):
+    """The user behind the request's ``?ticket=`` or JWT header."""
+    ticket = request.GET.get('ticket')
+    if ticket:
+        user_id = live.redeem_ticket(ticket)
+        return User.objects.filter(pk=user_id).first() if user_id is not None else None
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def stream_setup(request, blog_slug):
+    """The user and blog of a stream, or None for either."""
+    try:
+        user = stream_user(request)
+        if user is None or not user.is_active:
+            return None, None
+        return user, Blog.objects.filter(slug=blog_slug).values_list('id', flat=True).first()
+    finally:
+        live.release_connections()
+
+
+def stream_replay(blog_id, since):
+    """``(id, event)`` for the approved comments after ``since``."""
+    try:
+        missed = list(Comment.objects.filter(blog_id=blog_id, status='approved', id__gt=since)
+                      .select_related('user').order_by('id')[:MAX_STREAM_REPLAY])
+        return list(zip([comment.id for comment in missed], live.render(missed)))
+    finally:
+        live.release_connections()
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def stream_ticket(request):
+    """Issue a single-use ticket for opening a comment stream
+    
+    The ticket goes in the stream URL as ``?ticket=``, so the access token
+    never appears in URLs, logs or request profiles.
+    """
+    return Response({'ticket': live.issue_ticket(request.user), 'expires_in': live.ticket_seconds()})
+
+
+async def comment_stream(request, blog_slug):
+    """Stream newly approved comments on a blog as Server-Sent Events
+    
+    EventSource cannot send headers, so browsers authenticate with a ticket
+    from ``stream_ticket`` passed as ``?ticket=``. Approved comments after
+    ``Last-Event-ID`` (or ``?since=<id>``) are replayed first, up to
+    ``MAX_STREAM_REPLAY``; beyond that, catch up with the list endpoint's
+    ``?since=`` mode. The stream holds no database connection while it waits.
+    """
+    since = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    try:
+        since = int(since) if since is not None else None
+    except ValueError:
+        return JsonResponse({'since': ['A valid integer is required.']}, status=400)
+    
+    user, blog_id = await sync_to_async(stream_setup)(request, blog_slug)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    if blog_id is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    
+    response = StreamingHttpResponse(comment_events(blog_id, since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def comment_events(blog_id, since):
+    # Subscribing only once the response is being sent leaves nothing to clean
+    # up for a client that disconnects first. It happens before reading the
+    # missed comments, so that comments approved in between are delivered live
+    # rather than lost.
+    broker = live.get_broker()
+    subscription = broker.subscribe(live.channel(blog_id))
+    try:
+        yield live.retry_hint()
+        missed = await sync_to_async(stream_replay)(blog_id, since) if since is not None else []
+        sent = set()
+        for comment_id, event in missed:
+            sent.add(comment_id)
+            yield event
+        
+        heartbeat = getattr(settings, 'COMMENT_STREAM_HEARTBEAT', 15)
+        while not subscription.overflowed:
+            try:
+                comment_id, event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield live.HEARTBEAT
+                continue
+            if comment_id not in sent:
+                yield event
+    finally:
+        broker.unsubscribe(subscription)
 
 
 class CommentDetailView(generics.RetrieveAPIView):
@@ -109,6 +323,74 @@ class CommentModerationView(generics.UpdateAPIView):
     queryset = Comment.objects.all()
 
 
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def bulk_moderate_comments(request):
+    """Moderate many comments with one UPDATE (Admin only)
+    
+    Unlike single moderation, bulk actions do not train the spam classifier:
+    selections by IP address or user are not per-comment judgements. Comments
+    leased to another moderator are skipped.
+    """
+    serializer = BulkModerationSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    
+    action = serializer.validated_data['action']
+    matched, updated, skipped = bulk_set_status(
+        serializer.get_queryset(), BulkModerationSerializer.ACTION_STATUSES[action], moderator=request.user
+    )
+    return Response({
+        'action': action,
+        'matched': matched,
+        'updated': updated,
+        'skipped': skipped,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def claim_moderation_batch(request):
+    """Lease a batch of the oldest pending comments (Admin only)
+    
+    Comments already leased to the moderator count towards ``size`` and are
+    renewed. No other moderator gets them until the lease expires or they are
+    released or moderated.
+    """
+    serializer = QueueClaimSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    
+    comments, expires_at = queue.claim(request.user, serializer.validated_data['size'])
+    return Response({
+        'lease_expires_at': expires_at,
+        'comments': CommentDetailSerializer(comments, many=True, context={'request': request}).data,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def release_moderation_batch(request):
+    """Return claimed comments to the queue (Admin only)"""
+    serializer = QueueReleaseSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    
+    released = queue.release(request.user, serializer.validated_data.get('ids'))
+    return Response({'released': released})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def moderation_throughput(request):
+    """Comments moderated per minute per moderator (Admin only)
+    
+    Covers the last ``?minutes=`` minutes (default 60).
+    """
+    try:
+        minutes = min(max(int(request.query_params.get('minutes', 60)), 1), 7 * 24 * 60)
+    except ValueError:
+        minutes = 60
+    return Response({'minutes': minutes, 'moderators': queue.throughput(minutes)})
+
+
 class MyCommentsView(generics.ListAPIView):
     """List current user's comments"""
     serializer_class = CommentListSerializer
@@ -120,7 +402,7 @@ class MyCommentsView(generics.ListAPIView):
     ordering = ['-created_at']
     
     def get_queryset(self):
-        return Comment.objects.filter(user=self.request.user).select_related('blog')
+        return Comment.objects.filter(user=self.request.user).select_related('user')
 
 
 class PendingCommentsView(generics.ListAPIView):
@@ -136,18 +418,84 @@ class PendingCommentsView(generics.ListAPIView):
         return Comment.objects.filter(status='pending').select_related('user', 'blog')
 
 
+class SpamRuleListCreateView(generics.ListCreateAPIView):
+    """List and create spam keyword rules (Admin only)"""
+    serializer_class = SpamRuleSerializer
+    permission_classes = [IsAdminUser]
+    queryset = SpamRule.objects.all()
+    filterset_fields = ['is_active']
+    search_fields = ['pattern']
+
+
+class SpamRuleDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """Retrieve, update or delete a spam keyword rule (Admin only)"""
+    serializer_class = SpamRuleSerializer
+    permission_classes = [IsAdminUser]
+    queryset = SpamRule.objects.all()
+
+
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def comment_stats(request):
-    """Get comment statistics (Admin only)"""
-    total_comments = Comment.objects.count()
-    approved_comments = Comment.objects.filter(status='approved').count()
-    pending_comments = Comment.objects.filter(status='pending').count()
-    spam_comments = Comment.objects.filter(status='spam').count()
+    """Get comment statistics (Admin only)
+    
+    Totals come from the per-status counter table in a single query.
+    """
+    totals = stats.status_totals()
     
     return Response({
-        'total_comments': total_comments,
-        'approved_comments': approved_comments,
-        'pending_comments': pending_comments,
-        'spam_comments': spam_comments
+        'total_comments': sum(totals.values()),
+        'approved_comments': totals['approved'],
+        'pending_comments': totals['pending'],
+        'spam_comments': totals['spam']
     })
+
+
+def stats_window(request):
+    """Rollup rows for the last ``days`` days, optionally for one blog."""
+    try:
+        days = min(max(int(request.query_params.get('days', 30)), 1), MAX_STATS_DAYS)
+    except ValueError:
+        days = 30
+    rows = CommentDailyStats.objects.filter(day__gt=timezone.localdate() - timedelta(days=days))
+    blog = request.query_params.get('blog')
+    if blog:
+        rows = rows.filter(blog__slug=blog)
+    return rows.order_by()
+
+
+def status_columns():
+    return {
+        f'{status}_comments': Coalesce(Sum('count', filter=Q(status=status)), 0)
+        for status, _ in Comment.STATUS_CHOICES
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def comment_daily_stats(request):
+    """Comments per day by status, from the daily rollups (Admin only)
+    
+    Query parameters: ``days`` (default 30) and ``blog`` (a blog slug).
+    """
+    rows = stats_window(request).values('day').annotate(**status_columns()).order_by('day')
+    return Response([{**row, 'day': row['day'].isoformat()} for row in rows])
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def comment_blog_stats(request):
+    """Comments per blog by status over the last ``days`` days (Admin only)"""
+    rows = (stats_window(request)
+            .values('blog_id', 'blog__slug', 'blog__title')
+            .annotate(**status_columns())
+            .order_by('-approved_comments', 'blog_id')[:MAX_STATS_BLOGS])
+    return Response([
+        {
+            'blog_id': row.pop('blog_id'),
+            'slug': row.pop('blog__slug'),
+            'title': row.pop('blog__title'),
+            **row,
+        }
+        for row in rows
+    ])
@@ -0,0 +1,37 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from jobs import queue
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Jobs run at the same time (default: JOBS_CONCURRENCY)')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Seconds between looks for new jobs when idle (default: JOBS_POLL_INTERVAL)')
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs that are due, then exit')
+        parser.add_argument('--prune', type=int, metavar='DAYS', default=None,
+                            help='Only delete jobs that finished more than DAYS days ago')
+
+    def handle(self, *args, **options):
+        if options['prune'] is not None:
+            self.stdout.write(f'Deleted {queue.prune(options["prune"])} finished jobs')
+            return
+
+        worker = Worker(concurrency=options['concurrency'], poll_interval=options['poll_interval'])
+
+        def shutdown(signum, frame):
+            self.stdout.write('Stopping after the running jobs finish...')
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        self.stdout.write(f'Worker {worker.name} running {worker.concurrency} jobs at a time')
+        worker.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {worker.processed} jobs'))
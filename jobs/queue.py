@@ -0,0 +1,156 @@
+"""
+Database-backed background jobs.
+
+Slow side effects (mail, mostly) are queued with ``enqueue`` instead of being
+run during the request. The job row is written once the current transaction
+commits, so a worker never picks up a job for data that was rolled back, nor
+one it cannot see yet.
+
+``manage.py run_worker`` claims due jobs with a compare-and-set UPDATE, like
+the moderation queue: a claim sets ``locked_by`` and a ``locked_until``
+visibility timeout, which the worker keeps extending while the job runs. A
+job whose worker died becomes due again once the timeout passes. Failed
+jobs are retried with exponential backoff until ``max_attempts``; a task
+can therefore run more than once and should be safe to repeat.
+"""
+import json
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from monitoring.metrics import JOBS
+from .models import Job
+
+
+# Claims that lose races to other workers are retried this many times.
+CLAIM_ATTEMPTS = 3
+
+# Error messages are kept to this many characters.
+MAX_ERROR_LENGTH = 5000
+
+_tasks = {}
+
+
+def task(func=None, *, max_attempts=None):
+    """Register ``func`` as a task that can be queued with ``enqueue``."""
+    def register(func):
+        func.task_name = f'{func.__module__}.{func.__qualname__}'
+        func.max_attempts = max_attempts or getattr(settings, 'JOBS_MAX_ATTEMPTS', 5)
+        _tasks[func.task_name] = func
+        return func
+
+    return register(func) if func is not None else register
+
+
+def get_task(name):
+    """The registered task ``name``, importing its module if needed."""
+    if name not in _tasks:
+        try:
+            import_string(name)
+        except ImportError:
+            pass
+    try:
+        return _tasks[name]
+    except KeyError:
+        raise LookupError(f'{name} is not a registered task') from None
+
+
+def enqueue(func, *, delay=0, **kwargs):
+    """Run ``func(**kwargs)`` in a worker, once the current transaction commits.
+
+    ``kwargs`` must be JSON serializable: pass ids rather than objects.
+    """
+    if getattr(func, 'task_name', None) not in _tasks:
+        raise ValueError(f'{func!r} is not a registered task')
+    json.dumps(kwargs)
+
+    def insert():
+        Job.objects.create(
+            task=func.task_name, kwargs=kwargs, max_attempts=func.max_attempts,
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+    transaction.on_commit(insert)
+
+
+def visibility_timeout():
+    return timedelta(seconds=getattr(settings, 'JOBS_VISIBILITY_TIMEOUT', 60))
+
+
+def due(now):
+    """Queued jobs whose time has come, and running jobs whose worker went quiet."""
+    return Job.objects.filter(Q(status='queued', run_at__lte=now) | Q(status='running', locked_until__lte=now))
+
+
+def claim(worker, limit):
+    """Lock up to ``limit`` due jobs for ``worker``, oldest first."""
+    now = timezone.now()
+    locked_until = now + visibility_timeout()
+    # Jobs that were still running on their last attempt when their worker stopped
+    due(now).filter(status='running', attempts__gte=F('max_attempts')).update(
+        status='failed', locked_by='', locked_until=None, finished_at=now,
+        last_error='The worker stopped responding while running the job.',
+    )
+    claimed = 0
+    with transaction.atomic():
+        for _ in range(CLAIM_ATTEMPTS):
+            if claimed >= limit:
+                break
+            candidates = due(now).order_by('run_at', 'id')
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            ids = list(candidates.values_list('id', flat=True)[:limit - claimed])
+            if not ids:
+                break
+            claimed += due(now).filter(id__in=ids).update(
+                status='running', locked_by=worker, locked_until=locked_until, attempts=F('attempts') + 1,
+            )
+    if not claimed:
+        return []
+    return list(Job.objects.filter(status='running', locked_by=worker, locked_until=locked_until).order_by('run_at', 'id'))
+
+
+def extend(worker, ids):
+    """Push back the visibility timeout of the ``worker``'s running jobs."""
+    return Job.objects.filter(id__in=ids, status='running', locked_by=worker).update(
+        locked_until=timezone.now() + visibility_timeout()
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait before attempt ``attempts + 1``: doubling, capped, with jitter."""
+    base = getattr(settings, 'JOBS_RETRY_DELAY', 10)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'JOBS_RETRY_MAX_DELAY', 3600))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def finish(job, worker, error=None):
+    """Record the outcome of ``job``; returns its new status.
+
+    Nothing is recorded when the worker lost the job to another one.
+    """
+    now = timezone.now()
+    mine = Job.objects.filter(pk=job.pk, status='running', locked_by=worker)
+    if error is None:
+        status, changes = 'done', {'finished_at': now, 'last_error': ''}
+    elif job.attempts < job.max_attempts:
+        status, changes = 'queued', {'run_at': now + timedelta(seconds=retry_delay(job.attempts))}
+    else:
+        status, changes = 'failed', {'finished_at': now}
+    if error is not None:
+        changes['last_error'] = error[-MAX_ERROR_LENGTH:]
+    if not mine.update(status=status, locked_by='', locked_until=None, **changes):
+        return None
+    JOBS.inc(task=job.task, result='retried' if status == 'queued' else status)
+    return status
+
+
+def prune(days):
+    """Delete jobs that finished more than ``days`` days ago; returns how many."""
+    since = timezone.now() - timedelta(days=days)
+    return Job.objects.filter(status__in=['done', 'failed'], finished_at__lt=since).delete()[0]
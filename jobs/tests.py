@@ -0,0 +1,180 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from blog_system.testing import seed_performance_data
+from . import queue
+from .models import Job
+from .worker import Worker, run_job
+
+
+calls = []
+
+
+@queue.task(max_attempts=2)
+def record(value):
+    calls.append(value)
+
+
+@queue.task(max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    """Tests for enqueueing, claiming and retrying jobs"""
+
+    def setUp(self):
+        calls.clear()
+
+    def job(self, func, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue.enqueue(func, **kwargs)
+        return Job.objects.latest('id')
+
+    def test_jobs_are_written_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            queue.enqueue(record, value=1)
+            self.assertFalse(Job.objects.exists())
+        callbacks[0]()
+
+        job = Job.objects.get()
+        self.assertEqual((job.task, job.kwargs, job.status, job.max_attempts),
+                         ('jobs.tests.record', {'value': 1}, 'queued', 2))
+
+    def test_rejects_unregistered_tasks_and_unserializable_arguments(self):
+        with self.assertRaises(ValueError):
+            queue.enqueue(print, value=1)
+        with self.assertRaises(TypeError):
+            queue.enqueue(record, value=object())
+
+    def test_claimed_jobs_run_once(self):
+        job = self.job(record, value='a')
+
+        claimed = queue.claim('one', 10)
+        self.assertEqual(claimed, [job])
+        self.assertEqual(queue.claim('two', 10), [])
+        self.assertEqual(run_job(claimed[0], 'one'), 'done')
+
+        job.refresh_from_db()
+        self.assertEqual(calls, ['a'])
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('done', 1, ''))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failures_back_off_then_fail(self):
+        job = self.job(explode)
+
+        self.assertEqual(run_job(queue.claim('one', 1)[0], 'one'), 'queued')
+        job.refresh_from_db()
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertEqual(queue.claim('one', 1), [])
+
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(run_job(queue.claim('one', 1)[0], 'one'), 'failed')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    @override_settings(JOBS_RETRY_DELAY=10, JOBS_RETRY_MAX_DELAY=60)
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        self.assertTrue(5 <= queue.retry_delay(1) <= 10)
+        self.assertTrue(20 <= queue.retry_delay(3) <= 40)
+        self.assertTrue(30 <= queue.retry_delay(8) <= 60)
+
+    def test_jobs_of_a_silent_worker_are_run_again(self):
+        job = self.job(record, value='b')
+        stale = queue.claim('gone', 1)[0]
+        self.assertEqual(queue.extend('gone', [job.id]), 1)
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(run_job(queue.claim('other', 1)[0], 'other'), 'done')
+        # The first worker finishing late changes nothing
+        self.assertIsNone(queue.finish(stale, 'gone', error='late'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('done', 2, ''))
+
+        # Nor is a job that was on its last attempt retried
+        last = self.job(record, value='c')
+        queue.claim('gone', 1)
+        Job.objects.filter(pk=last.pk).update(attempts=2, locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(queue.claim('other', 1), [])
+        self.assertEqual(Job.objects.get(pk=last.pk).status, 'failed')
+
+    def test_prune_keeps_recent_and_unfinished_jobs(self):
+        old = self.job(record, value=1)
+        self.job(record, value=2)
+        Job.objects.update(status='done', finished_at=timezone.now() - timedelta(days=10))
+        Job.objects.filter(pk=old.pk).update(finished_at=timezone.now() - timedelta(days=40))
+        self.job(record, value=3)
+
+        self.assertEqual(queue.prune(30), 1)
+        self.assertEqual(Job.objects.count(), 2)
+
+
+class WorkerTests(TransactionTestCase):
+    """Tests for the run_worker command"""
+
+    def test_runs_due_jobs_concurrently_and_exits(self):
+        calls.clear()
+        for value in range(6):
+            queue.enqueue(record, value=value)
+        queue.enqueue(explode)
+        output = StringIO()
+
+        call_command('run_worker', once=True, concurrency=3, poll_interval=0.01, stdout=output)
+
+        self.assertEqual(sorted(calls), list(range(6)))
+        self.assertEqual(Job.objects.filter(status='done').count(), 6)
+        self.assertEqual(Job.objects.get(task='jobs.tests.explode').status, 'queued')
+        self.assertIn('Processed 7 jobs', output.getvalue())
+
+    def test_stopped_worker_claims_nothing(self):
+        queue.enqueue(record, value=1)
+        worker = Worker(concurrency=1)
+        worker.stop()
+        worker.run()
+        self.assertEqual(Job.objects.get().status, 'queued')
+
+
+class SideEffectJobTests(APITestCase):
+    """Tests for the slow side effects that run as jobs"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def run_jobs(self):
+        for job in queue.claim('test', 100):
+            run_job(job, 'test')
+
+    def test_publishing_queues_the_newsletter(self):
+        editor = self.data['users']['editor']
+        blog = self.data['blogs'][0]
+        blog.status = 'draft'
+        blog.save()
+        self.client.force_authenticate(editor)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/blogs/{blog.slug}/publish/', {'status': 'published'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+
+        self.run_jobs()
+        self.assertEqual(len(mail.outbox), 24)
+        self.assertIn(blog.title, mail.outbox[0].subject)
+
+    def test_password_reset_is_mailed_by_a_worker(self):
+        viewer = self.data['users']['viewer']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/password-reset/', {'email': viewer.email})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+
+        self.run_jobs()
+        self.assertEqual([message.to for message in mail.outbox], [[viewer.email]])
+        self.assertIn('/reset-password/', mail.outbox[0].body)
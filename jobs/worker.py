@@ -0,0 +1,107 @@
+"""
+The job worker behind ``manage.py run_worker``.
+
+One thread polls for due jobs and hands them to a pool of ``concurrency``
+threads, claiming no more jobs than there are idle threads. While jobs run,
+it extends their visibility timeout every third of the timeout, so only
+the jobs of a worker that really stopped are run again elsewhere.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connections
+
+from . import queue
+
+
+logger = logging.getLogger(__name__)
+
+
+# Queue updates that hit a locked or unavailable database are retried this
+# many times; an unrecorded outcome would make the job run again.
+DB_ATTEMPTS = 5
+
+
+def retrying(func, *args, **kwargs):
+    for attempt in range(DB_ATTEMPTS):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError:
+            if attempt == DB_ATTEMPTS - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def run_job(job, worker):
+    """Run a claimed job and record its outcome; returns the new status."""
+    try:
+        queue.get_task(job.task)(**job.kwargs)
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %s', job.id, job.task, job.attempts)
+        return retrying(queue.finish, job, worker, error=traceback.format_exc())
+    return retrying(queue.finish, job, worker)
+
+
+class Worker:
+
+    def __init__(self, concurrency=None, poll_interval=None, name=None):
+        self.concurrency = concurrency or getattr(settings, 'JOBS_CONCURRENCY', 4)
+        self.poll_interval = poll_interval or getattr(settings, 'JOBS_POLL_INTERVAL', 1.0)
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.stopping = threading.Event()
+        self.processed = 0
+
+    def stop(self):
+        """Stop claiming jobs; ``run`` returns once the running ones finish."""
+        self.stopping.set()
+
+    def run(self, once=False):
+        """Process jobs until ``stop``, or until none are due when ``once``."""
+        running = {}
+        extend_every = queue.visibility_timeout().total_seconds() / 3
+        extended_at = time.monotonic()
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='jobs') as executor:
+            while True:
+                claimed, claim_failed = [], False
+                if not self.stopping.is_set() and len(running) < self.concurrency:
+                    try:
+                        claimed = retrying(queue.claim, self.name, self.concurrency - len(running))
+                    except DatabaseError:
+                        logger.exception('Could not claim jobs')
+                        claim_failed = True
+                    for job in claimed:
+                        running[executor.submit(self.execute, job)] = job
+                if not running and not claim_failed and (once or self.stopping.is_set()):
+                    break
+                if running and time.monotonic() - extended_at >= extend_every:
+                    try:
+                        retrying(queue.extend, self.name, [job.id for job in running.values()])
+                        extended_at = time.monotonic()
+                    except DatabaseError:
+                        logger.exception('Could not extend the visibility timeout of running jobs')
+                if running:
+                    # Look for more work as soon as a thread frees up, or after
+                    # a poll interval when none has and some are idle.
+                    timeout = self.poll_interval if len(running) < self.concurrency else extend_every
+                    done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = running.pop(future)
+                        if future.exception() is not None:
+                            logger.error('Job %s (%s) could not be recorded', job.id, job.task,
+                                         exc_info=future.exception())
+                        self.processed += 1
+                else:
+                    self.stopping.wait(self.poll_interval)
+
+    def execute(self, job):
+        try:
+            return run_job(job, self.name)
+        finally:
+            connections.close_all()
@@ -0,0 +1,50 @@
+"""
+Cache backends that count hits and misses in ``cache_requests_total``.
+
+Use them in place of the Django backends they extend, e.g.
+``monitoring.cache.RedisCache`` instead of
+``django.core.cache.backends.redis.RedisCache``.
+"""
+from django.core.cache.backends import locmem, redis
+
+from .metrics import CACHE_REQUESTS
+
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """Count lookups made through ``get`` and ``get_many``.
+
+    Backends without their own ``get_many`` fall back to ``get`` for each key,
+    so only backends with ``native_get_many`` count there.
+    """
+
+    native_get_many = False
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            CACHE_REQUESTS.inc(result='miss')
+            return default
+        CACHE_REQUESTS.inc(result='hit')
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        if not self.native_get_many:
+            return found
+        if found:
+            CACHE_REQUESTS.inc(len(found), result='hit')
+        if len(keys) > len(found):
+            CACHE_REQUESTS.inc(len(keys) - len(found), result='miss')
+        return found
+
+
+class LocMemCache(InstrumentedCacheMixin, locmem.LocMemCache):
+    pass
+
+
+class RedisCache(InstrumentedCacheMixin, redis.RedisCache):
+    native_get_many = True
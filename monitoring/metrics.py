@@ -0,0 +1,261 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Every process records into its own registry under a lock. When
+``METRICS_DIR`` is set (for example when gunicorn runs several workers), each
+process also writes a snapshot of its values to
+``<METRICS_DIR>/metrics-<pid>-<id>.json`` at most every
+``METRICS_FLUSH_INTERVAL`` seconds, and the exposition endpoint sums the
+snapshots of all processes. Snapshots of exited workers are kept so that
+counters never go backwards; empty the directory when the server starts.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """Base class for a named metric with a fixed set of label names."""
+
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def empty(self):
+        raise NotImplementedError
+
+    def merge(self, current, other):
+        raise NotImplementedError
+
+    def render(self, values):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def empty(self):
+        return 0
+
+    def merge(self, current, other):
+        return current + other
+
+    def render(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}'
+
+
+class Histogram(Metric):
+    """Observations counted into fixed buckets, plus their sum and count.
+
+    Values are stored as per-bucket counts followed by the sum, and made
+    cumulative only when rendered.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = self.empty()
+            counts[index] += 1
+            counts[-1] += value
+
+    def empty(self):
+        # One slot per bucket, one for +Inf and one for the sum.
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def merge(self, current, other):
+        return [a + b for a, b in zip(current, other)]
+
+    def render(self, values):
+        bounds = self.buckets + (float('inf'),)
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, [('le', format_value(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {format_value(counts[-1])}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Registry:
+    """Thread-safe collection of metrics that can be shared across processes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.last_flush = 0.0
+        self.snapshot_name = None
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def reset(self):
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.values = {}
+
+    def snapshot(self):
+        """Copy of this process's values, keyed by metric name."""
+        with self.lock:
+            return {
+                name: {key: list(value) if isinstance(value, list) else value
+                       for key, value in metric.values.items()}
+                for name, metric in self.metrics.items()
+            }
+
+    @property
+    def directory(self):
+        directory = getattr(settings, 'METRICS_DIR', '')
+        return Path(directory) if directory else None
+
+    def snapshot_path(self):
+        # The pid is not unique across restarts, so add a random suffix.
+        if self.snapshot_name is None or not self.snapshot_name.startswith(f'metrics-{os.getpid()}-'):
+            self.snapshot_name = f'metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+        return self.directory / self.snapshot_name
+
+    def flush(self):
+        """Write this process's snapshot to ``METRICS_DIR``."""
+        if self.directory is None:
+            return
+        self.last_flush = time.monotonic()
+        data = {
+            name: [[list(key), value] for key, value in values.items()]
+            for name, values in self.snapshot().items()
+        }
+        path = self.snapshot_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(data))
+        os.replace(temporary, path)
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        if self.directory is not None and time.monotonic() - self.last_flush >= interval:
+            self.flush()
+
+    def collect(self):
+        """Values summed over every process that shares ``METRICS_DIR``."""
+        if self.directory is None:
+            return self.snapshot()
+
+        self.flush()
+        totals = {name: {} for name in self.metrics}
+        for path in self.directory.glob('metrics-*.json'):
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # Being replaced or removed
+            for name, entries in data.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                values = totals[name]
+                for key, value in entries:
+                    key = tuple(key)
+                    values[key] = metric.merge(values.get(key, metric.empty()), value)
+        return totals
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        values = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.render(values.get(name, {})))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by route.', ['method', 'route']
+)
+REQUESTS = registry.counter(
+    'http_requests_total', 'Requests handled, by route and status code.', ['method', 'route', 'status']
+)
+DB_QUERY_DURATION = registry.histogram(
+    'http_request_db_seconds', 'Time spent in database queries per request, by route.', ['route'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_QUERIES = registry.counter(
+    'db_queries_total', 'Database queries issued, by route.', ['route']
+)
+CACHE_REQUESTS = registry.counter(
+    'cache_requests_total', 'Cache lookups by outcome (hit or miss).', ['result']
+)
+COMMENT_VELOCITY = registry.counter(
+    'comment_velocity_limited_total', 'Comments held or rejected by velocity limits, by rule.', ['rule', 'action']
+)
+NEWSLETTER_EMAILS = registry.counter(
+    'newsletter_emails_total', 'Newsletter emails by outcome (sent or failed).', ['result']
+)
+JOBS = registry.counter(
+    'jobs_total', 'Background job attempts by task and outcome (done, retried or failed).', ['task', 'result']
+)
@@ -0,0 +1,116 @@
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.urls import Resolver404, resolve
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import metrics
+from .profiling import QueryTimer, RequestProfiler
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile='
+PROFILE_MODES = ('1', 'sample')
+
+
+def admin_user(request):
+    """Return the Admin user behind the request's JWT, if any."""
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    if result is None:
+        return None
+    user = result[0]
+    return user if user.is_active and user.is_admin else None
+
+
+class RequestProfilingMiddleware:
+    """Profile a request when an authenticated Admin asks for it.
+    
+    A request is profiled when it carries an ``X-Profile`` header or a
+    ``profile`` query parameter (``1`` for cProfile, ``sample`` for
+    pyinstrument when installed; other values are ignored). Untriggered
+    requests only pay for the two membership checks below.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        meta = request.META
+        if PROFILE_HEADER not in meta and PROFILE_PARAM not in meta.get('QUERY_STRING', ''):
+            return self.get_response(request)
+        
+        mode = meta.get(PROFILE_HEADER) or request.GET.get('profile', '')
+        if mode not in PROFILE_MODES:
+            return self.get_response(request)
+        
+        user = admin_user(request)
+        if user is None:
+            return self.get_response(request)
+        
+        profiler = RequestProfiler(mode)
+        response = profiler.run(self.get_response, request)
+        
+        profile = self.store(request, response, user, profiler)
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
+    
+    def store(self, request, response, user, profiler):
+        from .models import RequestProfile
+        
+        try:
+            view_name = resolve(request.path_info).view_name
+        except Resolver404:
+            view_name = ''
+        
+        profile = RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.path[:500],
+            query_string=request.META.get('QUERY_STRING', ''),
+            view_name=view_name,
+            status_code=response.status_code,
+            duration_ms=profiler.duration_ms,
+            query_count=profiler.query_count,
+            profiler=profiler.name,
+            data=profiler.dump(),
+        )
+        
+        # Keep only the most recent profiles
+        keep = getattr(settings, 'PROFILING_MAX_STORED', 200)
+        stale = RequestProfile.objects.values_list('id', flat=True)[keep:]
+        RequestProfile.objects.filter(id__in=list(stale)).delete()
+        return profile
+
+
+class MetricsMiddleware:
+    """Record latency, status and database time for every request.
+    
+    Requests are labelled with the resolved URL name (``blogs:blog-list``),
+    or ``unmatched`` when no route matched, so that paths with ids in them do
+    not create a label per object.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        metrics.REQUEST_DURATION.observe(elapsed, method=request.method, route=route)
+        metrics.REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+        metrics.DB_QUERY_DURATION.observe(timer.seconds, route=route)
+        if timer.count:
+            metrics.DB_QUERIES.inc(timer.count, route=route)
+        metrics.registry.maybe_flush()
+        return response
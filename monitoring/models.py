@@ -0,0 +1,38 @@
+from django.db import models
+from django.utils import timezone
+from django.conf import settings
+
+
+class RequestProfile(models.Model):
+    """Profile of a single request captured on demand by an admin."""
+    
+    PROFILER_CHOICES = [
+        ('cprofile', 'cProfile'),
+        ('pyinstrument', 'pyinstrument'),
+    ]
+    
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='request_profiles')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    query_string = models.TextField(blank=True)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(default=0)
+    profiler = models.CharField(max_length=20, choices=PROFILER_CHOICES, default='cprofile')
+    data = models.BinaryField(help_text='Marshalled pstats data for cProfile, HTML for pyinstrument')
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'request_profiles'
+        verbose_name = 'Request Profile'
+        verbose_name_plural = 'Request Profiles'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration_ms:.1f} ms)'
+    
+    @property
+    def file_extension(self):
+        return 'html' if self.profiler == 'pyinstrument' else 'prof'
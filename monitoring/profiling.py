@@ -0,0 +1,89 @@
+import cProfile
+import marshal
+import time
+
+from django.conf import settings
+from django.db import connections
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # pyinstrument is optional
+    SamplingProfiler = None
+
+
+class QueryCounter:
+    """Database execute wrapper that counts queries while a profile runs."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryTimer:
+    """Database execute wrapper that totals query time for a request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class RequestProfiler:
+    """Runs a callable under cProfile, or pyinstrument when asked and installed."""
+
+    def __init__(self, mode=''):
+        self.use_sampling = mode == 'sample' and SamplingProfiler is not None
+        self.name = 'pyinstrument' if self.use_sampling else 'cprofile'
+        self.duration_ms = 0.0
+        self.query_count = 0
+        self._profiler = None
+
+    def run(self, func, *args, **kwargs):
+        counter = QueryCounter()
+        wrappers = [connections[alias].execute_wrapper(counter) for alias in connections]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+
+        if self.use_sampling:
+            self._profiler = SamplingProfiler(interval=getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.001))
+        else:
+            self._profiler = cProfile.Profile()
+
+        started = time.perf_counter()
+        self._toggle(True)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._toggle(False)
+            self.duration_ms = (time.perf_counter() - started) * 1000
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+            self.query_count = counter.count
+
+    def _toggle(self, on):
+        if self.use_sampling:
+            if on:
+                self._profiler.start()
+            else:
+                self._profiler.stop()
+        elif on:
+            self._profiler.enable()
+        else:
+            self._profiler.disable()
+
+    def dump(self):
+        """Serialized profile: pstats-compatible bytes, or pyinstrument HTML."""
+        if self.use_sampling:
+            return self._profiler.output_html().encode()
+        self._profiler.create_stats()
+        return marshal.dumps(self._profiler.stats)
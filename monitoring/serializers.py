@@ -0,0 +1,16 @@
+from rest_framework import serializers
+from .models import RequestProfile
+
+
+class RequestProfileSerializer(serializers.ModelSerializer):
+    """Serializer for stored request profiles (metadata only)"""
+    user_email = serializers.EmailField(source='user.email', read_only=True, default=None)
+    size = serializers.IntegerField(source='data_size', read_only=True)
+    
+    class Meta:
+        model = RequestProfile
+        fields = [
+            'id', 'user_email', 'method', 'path', 'query_string', 'view_name',
+            'status_code', 'duration_ms', 'query_count', 'profiler', 'size', 'created_at'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,173 @@
+import marshal
+import pstats
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from blog_system.testing import EndpointPerformanceTestCase, expand_cases
+from users.models import User
+from . import metrics
+from .models import RequestProfile
+
+
+class MonitoringEndpointPerformanceTests(EndpointPerformanceTestCase):
+    """Query-count and serializer-time regression tests for the monitoring API"""
+
+    def get_cases(self):
+        profile = RequestProfile.objects.create(
+            user=self.data['users']['admin'], method='GET', path='/api/blogs/', view_name='blogs:blog-list',
+            status_code=200, duration_ms=12.5, query_count=3, data=marshal.dumps({}),
+        )
+        expected = {
+            # name: method, path, data, {role: (status, queries)}
+            'monitoring:profile-list': ('GET', '/api/monitoring/profiles/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 2),
+            }),
+            'monitoring:profile-detail': ('GET', f'/api/monitoring/profiles/{profile.pk}/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 1),
+            }),
+            'monitoring:profile-download': ('GET', f'/api/monitoring/profiles/{profile.pk}/download/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 1),
+            }),
+        }
+        return expand_cases(expected)
+
+
+class RequestProfilingTests(TestCase):
+    """Tests for the on-demand request profiling middleware"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', name='Admin', password='x', role='Admin')
+        cls.viewer = User.objects.create_user(email='viewer@example.com', name='Viewer', password='x', role='Viewer')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def test_admin_header_profiles_request(self):
+        response = self.client_for(self.admin).get('/api/categories/', HTTP_X_PROFILE='1')
+
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.view_name, 'categories:category-list-create')
+        self.assertEqual(profile.profiler, 'cprofile')
+        self.assertEqual(profile.user, self.admin)
+        self.assertGreaterEqual(profile.query_count, 1)
+
+        with tempfile.NamedTemporaryFile(suffix='.prof') as handle:
+            handle.write(bytes(profile.data))
+            handle.flush()
+            self.assertGreater(pstats.Stats(handle.name).total_calls, 0)
+
+    def test_query_flag_profiles_request(self):
+        response = self.client_for(self.admin).get('/api/tags/?profile=1')
+
+        self.assertIn('X-Profile-Id', response)
+        self.assertEqual(RequestProfile.objects.count(), 1)
+
+    def test_non_admin_and_untriggered_requests_are_not_profiled(self):
+        response = self.client_for(self.viewer).get('/api/categories/', HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+
+        response = self.client_for(self.admin).get('/api/categories/')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_only_documented_modes_trigger_profiling(self):
+        self.client_for(self.admin).get('/api/categories/', HTTP_X_PROFILE='0')
+        self.client_for(self.admin).get('/api/tags/?profile=0')
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_download_as_text_report(self):
+        response = self.client_for(self.admin).get('/api/categories/', HTTP_X_PROFILE='1')
+        profile_id = response['X-Profile-Id']
+
+        download = self.client_for(self.admin).get(f'/api/monitoring/profiles/{profile_id}/download/?output=text')
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('function calls', download.content.decode())
+
+        bad_sort = self.client_for(self.admin).get(f'/api/monitoring/profiles/{profile_id}/download/?output=text&sort=x')
+        self.assertEqual(bad_sort.status_code, 400)
+
+        raw = self.client_for(self.admin).get(f'/api/monitoring/profiles/{profile_id}/download/')
+        self.assertEqual(raw['Content-Disposition'], f'attachment; filename="profile-{profile_id}.prof"')
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsTests(TestCase):
+    """Tests for the metrics registry and Prometheus endpoint"""
+
+    def setUp(self):
+        metrics.registry.reset()
+
+    def test_requests_are_recorded_by_route(self):
+        self.client.get('/api/categories/')
+        self.client.get('/api/nowhere/')
+
+        body = self.client.get(
+            '/api/monitoring/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret'
+        ).content.decode()
+        self.assertIn(
+            'http_requests_total{method="GET",route="categories:category-list-create",status="200"} 1', body
+        )
+        self.assertIn('http_requests_total{method="GET",route="unmatched",status="404"} 1', body)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{method="GET",route="categories:category-list-create",le="+Inf"} 1',
+            body
+        )
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = metrics.Registry()
+        histogram = registry.histogram('latency_seconds', 'Latency.', ['route'], buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value, route='x')
+
+        lines = registry.render().splitlines()
+        self.assertIn('latency_seconds_bucket{route="x",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{route="x",le="1"} 3', lines)
+        self.assertIn('latency_seconds_bucket{route="x",le="+Inf"} 4', lines)
+        self.assertIn('latency_seconds_sum{route="x"} 4.05', lines)
+        self.assertIn('latency_seconds_count{route="x"} 4', lines)
+
+    def test_snapshots_are_summed_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            other = metrics.Registry()
+            other.counter('jobs_total', 'Jobs.', ['result']).inc(2, result='ok')
+            other.snapshot_name = 'metrics-1-worker.json'
+            other.flush()
+
+            registry = metrics.Registry()
+            registry.counter('jobs_total', 'Jobs.', ['result']).inc(3, result='ok')
+            self.assertIn('jobs_total{result="ok"} 5', registry.render())
+
+    def test_cache_hits_and_misses(self):
+        cache.set('present', 1)
+        cache.get('present')
+        cache.get('absent')
+        cache.get_many(['present', 'absent', 'other'])
+
+        body = metrics.registry.render()
+        self.assertIn('cache_requests_total{result="hit"} 2', body)
+        self.assertIn('cache_requests_total{result="miss"} 3', body)
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/api/monitoring/metrics/').status_code, 403)
+        response = self.client.get('/api/monitoring/metrics/', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('/api/monitoring/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_only_admins_read_metrics_without_a_token(self):
+        self.assertEqual(self.client.get('/api/monitoring/metrics/').status_code, 403)
+        for role, expected in (('Viewer', 403), ('Admin', 200)):
+            user = User.objects.create_user(email=f'{role}@example.com', name=role, password='x', role=role)
+            token = RefreshToken.for_user(user).access_token
+            response = self.client.get('/api/monitoring/metrics/', HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(response.status_code, expected)
@@ -0,0 +1,14 @@
+from django.urls import path
+from . import views
+
+app_name = 'monitoring'
+
+urlpatterns = [
+    # Request profiling endpoints
+    path('profiles/', views.RequestProfileListView.as_view(), name='profile-list'),
+    path('profiles/<int:pk>/', views.RequestProfileDetailView.as_view(), name='profile-detail'),
+    path('profiles/<int:pk>/download/', views.download_profile, name='profile-download'),
+    
+    # Prometheus exposition endpoint
+    path('metrics/', views.metrics_view, name='metrics'),
+]
@@ -0,0 +1,88 @@
+import hmac
+import io
+import marshal
+import pstats
+
+from django.conf import settings
+from django.db.models.functions import Length
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import generics, status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+from .metrics import registry
+from .middleware import admin_user
+from .models import RequestProfile
+from .serializers import RequestProfileSerializer
+from users.permissions import IsAdminUser
+
+
+SORT_KEYS = sorted(key.value for key in pstats.SortKey)
+
+
+class RequestProfileListView(generics.ListAPIView):
+    """List stored request profiles (Admin only)"""
+    serializer_class = RequestProfileSerializer
+    permission_classes = [IsAdminUser]
+    filterset_fields = ['view_name', 'method', 'status_code', 'profiler']
+    ordering_fields = ['created_at', 'duration_ms', 'query_count']
+    ordering = ['-created_at']
+    
+    def get_queryset(self):
+        return RequestProfile.objects.defer('data').select_related('user').annotate(data_size=Length('data'))
+
+
+class RequestProfileDetailView(generics.RetrieveDestroyAPIView):
+    """Retrieve or delete a stored request profile (Admin only)"""
+    serializer_class = RequestProfileSerializer
+    permission_classes = [IsAdminUser]
+    
+    def get_queryset(self):
+        return RequestProfile.objects.defer('data').select_related('user').annotate(data_size=Length('data'))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def download_profile(request, pk):
+    """Download a stored profile (Admin only)
+    
+    cProfile data is returned as a ``.prof`` file readable by ``pstats`` and
+    snakeviz, or as a plain-text report with ``?output=text``, sorted by
+    ``?sort=`` (a ``pstats.SortKey`` value, default ``cumulative``).
+    """
+    sort = request.query_params.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        return Response({'sort': [f'Choose one of: {", ".join(SORT_KEYS)}.']}, status=status.HTTP_400_BAD_REQUEST)
+    
+    profile = get_object_or_404(RequestProfile, pk=pk)
+    data = bytes(profile.data)
+    
+    if profile.profiler == 'pyinstrument':
+        return HttpResponse(data, content_type='text/html')
+    
+    if request.query_params.get('output') == 'text':
+        stream = io.StringIO()
+        stats = pstats.Stats(stream=stream)
+        stats.stats = marshal.loads(data)
+        stats.get_top_level_stats()
+        stats.sort_stats(sort).print_stats(50)
+        return HttpResponse(stream.getvalue(), content_type='text/plain; charset=utf-8')
+    
+    response = HttpResponse(data, content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="profile-{profile.pk}.{profile.file_extension}"'
+    return response
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus text exposition of the in-process metrics
+    
+    Scrapers send ``METRICS_TOKEN`` as a bearer token; Admins may use their
+    own access token. Without a configured token only Admins get through.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    supplied = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+    if not (token and hmac.compare_digest(supplied.encode(), token.encode())) and admin_user(request) is None:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,195 @@
+"""
+Newsletter delivery.
+
+Every subscriber gets an individual message, so addresses are never
+disclosed to each other and one refused recipient fails only its own
+message. Recipients are streamed from the database; a bounded window of
+their messages waits in a ``DomainScheduler`` (see ``scheduling``), and
+``NEWSLETTER_SEND_CONNECTIONS`` worker threads take them from it, each
+keeping its own mail connection open for the whole send instead of
+reconnecting per message. The scheduler interleaves recipient domains and
+holds each to its rate and concurrency limits.
+
+``send`` reports the outcome of each recipient to ``on_chunk`` in chunks of
+``NEWSLETTER_CHUNK_SIZE``, on the calling thread, so callers can record
+deliveries in one write per chunk.
+"""
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+from monitoring.metrics import NEWSLETTER_EMAILS
+from .scheduling import DomainScheduler
+
+
+def is_deferral(exc):
+    """Whether the server asked to try again later (a 4xx reply)."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return any(400 <= code < 500 for code, _ in exc.recipients.values())
+    return isinstance(exc, smtplib.SMTPResponseException) and 400 <= exc.smtp_code < 500
+
+
+def deferred_error(address):
+    return f'Deferred: {address.rpartition("@")[2]} asked to try again later'
+
+
+class DispatchResult:
+    def __init__(self, sent=0, failed=0, seconds=0.0):
+        self.sent = sent
+        self.failed = failed
+        self.seconds = seconds
+
+    @property
+    def rate(self):
+        """Messages handled per second."""
+        return (self.sent + self.failed) / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return f'<DispatchResult sent={self.sent} failed={self.failed} {self.rate:.0f}/s>'
+
+
+class Dispatcher:
+    """Sends one message per recipient over a small pool of reused connections.
+
+    ``connection_kwargs`` are passed to ``get_connection`` (``backend``,
+    ``host``, ``port``...), so the same dispatcher drives SMTP in production
+    and the in-memory backend in tests. ``limits`` is the ``DomainLimits``
+    of the scheduler, from settings by default.
+    """
+
+    def __init__(self, connections=None, chunk_size=None, limits=None, **connection_kwargs):
+        self.connections = connections or getattr(settings, 'NEWSLETTER_SEND_CONNECTIONS', 4)
+        self.chunk_size = chunk_size or getattr(settings, 'NEWSLETTER_CHUNK_SIZE', 100)
+        self.limits = limits
+        self.connection_kwargs = connection_kwargs
+        self._local = threading.local()
+        self._opened = []
+        self._lock = threading.Lock()
+
+    def send(self, subject, text, html, recipients, from_email=None, on_chunk=None, personalize=None):
+        """Send the message to every address in the ``recipients`` iterable.
+
+        ``personalize(address)``, if given, returns the ``(subject, text,
+        html, headers)`` of that recipient's message. ``on_chunk`` is called
+        with ``[(address, error or None)]`` for each completed chunk.
+        """
+        from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        result = DispatchResult()
+        started = time.perf_counter()
+        recipients = iter(recipients)
+        scheduler = DomainScheduler(self.limits)
+        outcomes = queue.Queue()
+        # Messages built ahead of sending, so recipients are read from the
+        # database only as fast as they are sent.
+        window = self.connections * self.chunk_size * 2
+
+        def build(address):
+            parts = (subject, text, html, None) if personalize is None else personalize(address)
+            message = EmailMultiAlternatives(parts[0], parts[1], from_email, [address], headers=parts[3])
+            message.attach_alternative(parts[2], 'text/html')
+            return message
+
+        def report(chunk):
+            failed = sum(error is not None for _, error in chunk)
+            result.sent += len(chunk) - failed
+            result.failed += failed
+            if len(chunk) - failed:
+                NEWSLETTER_EMAILS.inc(len(chunk) - failed, result='sent')
+            if failed:
+                NEWSLETTER_EMAILS.inc(failed, result='failed')
+            if on_chunk is not None:
+                on_chunk(chunk)
+
+        with ThreadPoolExecutor(self.connections, thread_name_prefix='newsletter') as executor:
+            for _ in range(self.connections):
+                executor.submit(self.work, scheduler, outcomes)
+            try:
+                queued, exhausted, chunk = 0, False, []
+                while True:
+                    while not exhausted and queued < window:
+                        address = next(recipients, None)
+                        if address is None:
+                            exhausted = True
+                            scheduler.close()
+                        elif scheduler.put(address, build(address)):
+                            queued += 1
+                        else:
+                            chunk.append((address, deferred_error(address)))
+                            # A paused domain queues nothing, so report as we go
+                            if len(chunk) >= self.chunk_size:
+                                report(chunk)
+                                chunk = []
+                    if not queued:
+                        break
+                    for outcome in outcomes.get():
+                        queued -= 1
+                        chunk.append(outcome)
+                    if len(chunk) >= self.chunk_size:
+                        report(chunk)
+                        chunk = []
+                if chunk:
+                    report(chunk)
+            finally:
+                # Stops the workers when reading recipients or reporting failed
+                scheduler.cancel()
+        self.close()
+
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def work(self, scheduler, outcomes):
+        """Send the messages the scheduler releases until it is closed and empty.
+
+        Puts ``[(address, error)]`` on ``outcomes`` for each message, error
+        being None once the message was accepted; a deferral adds the
+        domain's waiting messages.
+        """
+        while True:
+            scheduled = scheduler.get()
+            if scheduled is None:
+                return
+            domain, message = scheduled
+            deferred = False
+            try:
+                error = None if self.send_one(message) else 'Not sent'
+            except Exception as exc:
+                error = str(exc) or exc.__class__.__name__
+                deferred = is_deferral(exc)
+            dropped = scheduler.done(domain, deferred=deferred)
+            outcomes.put([(message.to[0], error)] + [
+                (waiting.to[0], deferred_error(waiting.to[0])) for waiting in dropped
+            ])
+
+    def send_one(self, message):
+        try:
+            return self.connection().send_messages([message])
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The server dropped an idle or overloaded connection: reconnect once.
+            self.connection(reopen=True)
+            return self.connection().send_messages([message])
+
+    def connection(self, reopen=False):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or reopen:
+            if connection is not None:
+                connection.close()
+            connection = get_connection(fail_silently=False, **self.connection_kwargs)
+            connection.open()
+            self._local.connection = connection
+            with self._lock:
+                self._opened.append(connection)
+        return connection
+
+    def close(self):
+        with self._lock:
+            opened, self._opened = self._opened, []
+        for connection in opened:
+            try:
+                connection.close()
+            except Exception:
+                pass
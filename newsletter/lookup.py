@@ -0,0 +1,182 @@
+"""
+Subscription lookups that do not reach the database for unknown emails.
+
+Each process keeps a Bloom filter of the active subscribers' emails, hashed
+with a key derived from ``SECRET_KEY``. An email the filter does not know is
+not subscribed, and is answered without a query. Emails it does know (real
+subscribers, ones who since unsubscribed, and about
+``NEWSLETTER_LOOKUP_ERROR_RATE`` of the others) are looked up once and
+their answer cached for ``NEWSLETTER_LOOKUP_ANSWER_TTL`` seconds.
+
+New subscribers are appended to a numbered log in the shared cache, which
+other processes replay into their filters on their next lookup. Their
+cached answers, and those of anyone who unsubscribes, are dropped at once.
+A filter is rebuilt from the subscribers table when the log was lost, when
+it fills up, or after ``NEWSLETTER_LOOKUP_MAX_AGE`` seconds, which also
+clears the bits of those who left.
+
+All of this relies on every process seeing the same cache. With a
+local-memory cache a process would miss the subscribers and unsubscribes
+handled by the others, so lookups go straight to the database unless
+``NEWSLETTER_LOOKUP_SHARED_CACHE`` says the cache is shared anyway (one
+process).
+"""
+import hashlib
+import math
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+GENERATION_KEY = 'newsletter:lookup-generation'
+ADDITIONS_KEY = 'newsletter:lookup-additions'
+
+# More new subscribers than this since a filter was loaded rebuild it
+# instead of replaying the log.
+MAX_REPLAY = 1000
+
+_MISSING = object()
+
+
+def lookup_key():
+    return hashlib.sha256(f'newsletter.lookup:{settings.SECRET_KEY}'.encode()).digest()
+
+
+def uses_shared_cache():
+    """Whether other processes see what this one writes to the cache."""
+    return (getattr(settings, 'NEWSLETTER_LOOKUP_SHARED_CACHE', False)
+            or not isinstance(caches['default'], LocMemCache))
+
+
+def email_digest(email, key=None):
+    """The keyed hash of a normalized email; the only form emails take in filters and the cache."""
+    return hashlib.blake2b(email.strip().lower().encode(), key=key or lookup_key(), digest_size=16).digest()
+
+
+def addition_key(number):
+    return f'newsletter:lookup-addition:{number}'
+
+
+def answer_key(digest):
+    return f'newsletter:lookup-answer:{digest.hex()}'
+
+
+class BloomFilter:
+    """A set of digests that may report false positives, never false negatives."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1024)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, digest):
+        # Double hashing over the two halves of the digest
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, digest):
+        for position in self.positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest):
+        return all(self.bits[position >> 3] >> (position & 7) & 1 for position in self.positions(digest))
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+
+_lock = threading.Lock()
+_cached = {'filter': None, 'generation': None, 'additions': 0, 'loaded_at': 0.0}
+
+
+def log_state():
+    """``(generation, additions)`` of the shared log, starting a generation if there is none."""
+    state = cache.get_many([GENERATION_KEY, ADDITIONS_KEY])
+    generation = state.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation, state.get(ADDITIONS_KEY, 0)
+
+
+def get_lookup_filter():
+    """This process's filter, brought up to date with the log or rebuilt."""
+    generation, additions = log_state()
+    max_age = getattr(settings, 'NEWSLETTER_LOOKUP_MAX_AGE', 3600)
+    with _lock:
+        lookup_filter = _cached['filter']
+        if (lookup_filter is not None and _cached['generation'] == generation
+                and time.monotonic() - _cached['loaded_at'] < max_age
+                and _cached['additions'] <= additions <= _cached['additions'] + MAX_REPLAY):
+            if additions == _cached['additions']:
+                return lookup_filter
+            keys = [addition_key(number) for number in range(_cached['additions'] + 1, additions + 1)]
+            digests = cache.get_many(keys)
+            if len(digests) == len(keys):
+                for digest in digests.values():
+                    lookup_filter.add(digest)
+                _cached['additions'] = additions
+                if not lookup_filter.full:
+                    return lookup_filter
+        return _rebuild(generation, additions)
+
+
+def _rebuild(generation, additions):
+    from .models import NewsletterSubscriber
+
+    active = NewsletterSubscriber.objects.filter(is_active=True).order_by()
+    emails = list(active.values_list('email', flat=True).iterator(chunk_size=5000))
+    # Room to grow before the next rebuild
+    lookup_filter = BloomFilter(
+        int(len(emails) * 1.25) + MAX_REPLAY, getattr(settings, 'NEWSLETTER_LOOKUP_ERROR_RATE', 0.01)
+    )
+    key = lookup_key()
+    for email in emails:
+        lookup_filter.add(email_digest(email, key))
+    # Additions logged while reading are replayed again next time; adding twice is harmless
+    _cached.update(filter=lookup_filter, generation=generation, additions=additions, loaded_at=time.monotonic())
+    return lookup_filter
+
+
+def subscription_date(email):
+    """When the active subscription of ``email`` started, or None when it is not subscribed."""
+    from .models import NewsletterSubscriber
+
+    query = (NewsletterSubscriber.objects.filter(email=email.strip().lower(), is_active=True)
+             .values_list('subscription_date', flat=True))
+    if not uses_shared_cache():
+        return query.first()
+    digest = email_digest(email)
+    if digest not in get_lookup_filter():
+        return None
+    answer = cache.get(answer_key(digest), _MISSING)
+    if answer is _MISSING:
+        answer = query.first()
+        cache.set(answer_key(digest), answer, getattr(settings, 'NEWSLETTER_LOOKUP_ANSWER_TTL', 300))
+    return answer
+
+
+def subscriptions_changed(emails, subscribed=()):
+    """Drop the cached answers of ``emails`` and log those of them in ``subscribed``."""
+    key = lookup_key()
+    cache.delete_many([answer_key(email_digest(email, key)) for email in emails])
+    subscribed = list(subscribed)
+    if not subscribed:
+        return
+    log_state()
+    cache.add(ADDITIONS_KEY, 0, timeout=None)
+    last = cache.incr(ADDITIONS_KEY, len(subscribed))
+    timeout = 2 * getattr(settings, 'NEWSLETTER_LOOKUP_MAX_AGE', 3600)
+    cache.set_many({
+        addition_key(number): email_digest(email, key)
+        for number, email in enumerate(subscribed, start=last - len(subscribed) + 1)
+    }, timeout)
@@ -0,0 +1,148 @@
+import time
+from types import SimpleNamespace
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+
+from newsletter.dispatch import Dispatcher
+from newsletter.models import NewsletterSubscriber, unsubscribe_signer
+from newsletter.rendering import Newsletter
+from newsletter.scheduling import DomainLimits
+from newsletter.smtp_sink import SMTPSink
+
+
+SUBJECT = 'New Blog Post: Benchmarking the newsletter'
+TEXT = 'A new post is out. Read more at http://localhost:3000/blogs/bench\n' * 20
+HTML = '<p>A new post is out. <a href="http://localhost:3000/blogs/bench">Read more</a></p>\n' * 20
+POST = SimpleNamespace(title='Benchmarking the newsletter', slug='bench',
+                       meta_description='How fast can we personalize and send a newsletter?')
+
+
+class Command(BaseCommand):
+    help = 'Measure newsletter sending throughput against a local SMTP sink'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--connections', default='1,4,8',
+                            help='Comma-separated connection pool sizes to try')
+        parser.add_argument('--chunk-size', type=int, default=100)
+        parser.add_argument('--latency-ms', type=float, default=2.0,
+                            help='Delay the sink adds per message, standing in for a remote server')
+        parser.add_argument('--skip-unpooled', action='store_true',
+                            help='Do not measure a new connection per message')
+        parser.add_argument('--domains', type=int, default=1,
+                            help='Recipient domains the messages are spread over')
+        parser.add_argument('--domain-rate', type=float, default=0,
+                            help='Messages a second per domain (default: unlimited)')
+        parser.add_argument('--domain-concurrency', type=int, default=0,
+                            help='Messages in flight per domain (default: unlimited)')
+        parser.add_argument('--renders', type=int, default=2000,
+                            help='Recipients to personalize when measuring render cost (0 to skip)')
+
+    def handle(self, *args, **options):
+        if options['renders']:
+            self.bench_rendering(options['renders'])
+        recipients = [
+            f'reader{index}@bench{index % options["domains"]}.test' for index in range(options['messages'])
+        ]
+        limits = DomainLimits(rate=options['domain_rate'], concurrency=options['domain_concurrency'], overrides={})
+        with SMTPSink(latency=options['latency_ms'] / 1000) as sink:
+            smtp = {
+                'backend': 'django.core.mail.backends.smtp.EmailBackend',
+                'host': sink.host, 'port': sink.port, 'use_tls': False, 'use_ssl': False,
+                'username': '', 'password': '',
+            }
+            self.stdout.write(
+                f'{len(recipients)} messages to {options["domains"]} domain(s), '
+                f'sink latency {options["latency_ms"]:.1f}ms per message'
+            )
+
+            if not options['skip_unpooled']:
+                started = time.perf_counter()
+                for address in recipients:
+                    message = EmailMultiAlternatives(SUBJECT, TEXT, 'news@bench.test', [address],
+                                                     connection=get_connection(**smtp))
+                    message.attach_alternative(HTML, 'text/html')
+                    message.send()
+                self.report('new connection per message', len(recipients), 0, time.perf_counter() - started, sink)
+                sink.arrivals = []
+
+            for connections in (int(value) for value in options['connections'].split(',')):
+                dispatcher = Dispatcher(connections=connections, chunk_size=options['chunk_size'],
+                                        limits=limits, **smtp)
+                result = dispatcher.send(SUBJECT, TEXT, HTML, iter(recipients), from_email='news@bench.test')
+                self.report(f'{connections} pooled connection(s)', result.sent, result.failed, result.seconds, sink)
+                if options['domain_rate']:
+                    self.report_domains(sink, limits)
+                sink.arrivals = []
+
+    def report(self, label, sent, failed, seconds, sink):
+        handled = sent + failed
+        self.stdout.write(
+            f'  {label}: {handled / seconds:,.0f} messages/s ({sent} sent, {failed} failed, '
+            f'{sink.connections} connections)'
+        )
+        sink.connections = 0
+
+    def report_domains(self, sink, limits):
+        """The most messages any domain got within one second, against its limit."""
+        arrivals = {}
+        for address, arrived in sink.arrivals:
+            arrivals.setdefault(address.rpartition('@')[2], []).append(arrived)
+        peak = 0
+        for times in arrivals.values():
+            times.sort()
+            start = 0
+            for end, arrived in enumerate(times):
+                while arrived - times[start] >= 1.0:
+                    start += 1
+                peak = max(peak, end - start + 1)
+        self.stdout.write(
+            f'    busiest domain: {peak} messages within one second '
+            f'(limit {limits.rate:g}/s after a burst of {limits.burst})'
+        )
+
+    def bench_rendering(self, count):
+        """Per-recipient cost of a template render against the precompiled newsletter."""
+        context = {'blog_post': POST, 'frontend_url': 'http://localhost:3000'}
+        recipients = [
+            {'name': f'Reader {index}', 'email': f'reader{index}@bench.test', 'subscriber_id': index}
+            for index in range(count)
+        ]
+
+        signer = unsubscribe_signer()
+
+        def fields(recipient):
+            return {
+                'name': recipient['name'], 'email': recipient['email'],
+                'unsubscribe_url': NewsletterSubscriber.unsubscribe_url(recipient['subscriber_id'], signer),
+            }
+
+        text, html = get_template('newsletter/post.txt'), get_template('newsletter/post.html')
+        started = time.perf_counter()
+        for recipient in recipients:
+            recipient_context = {**context, 'recipient': fields(recipient)}
+            text.render(recipient_context)
+            html.render(recipient_context)
+        template_us = (time.perf_counter() - started) / count * 1e6
+
+        started = time.perf_counter()
+        newsletter = Newsletter('post', context)
+        compile_us = (time.perf_counter() - started) * 1e6
+        started = time.perf_counter()
+        for recipient in recipients:
+            newsletter.render(fields(recipient))
+        precompiled_us = (time.perf_counter() - started) / count * 1e6
+
+        prepared = [fields(recipient) for recipient in recipients]
+        started = time.perf_counter()
+        for recipient_fields in prepared:
+            newsletter.render(recipient_fields)
+        splice_us = (time.perf_counter() - started) / count * 1e6
+
+        self.stdout.write(f'Per-recipient render cost over {count} recipients (text and HTML parts):')
+        self.stdout.write(f'  template render per recipient: {template_us:,.1f} us')
+        self.stdout.write(f'  precompiled, with signed unsubscribe link: {precompiled_us:,.1f} us '
+                          f'(compiled once in {compile_us:,.0f} us)')
+        self.stdout.write(f'  precompiled, splicing only: {splice_us:,.1f} us')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from newsletter import audience
+
+
+class Command(BaseCommand):
+    help = 'Recompute the newsletter audience bitsets from subscription preferences'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {audience.rebuild()} audience bitsets'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from newsletter import stats
+from newsletter.models import NewsletterDailyStats, NewsletterSubscriber
+
+
+class Command(BaseCommand):
+    help = 'Recompute the newsletter growth rollups from the subscribers table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+
+    def handle(self, *args, **options):
+        actual = set(stats.daily_counts(NewsletterSubscriber.objects.all()))
+        stored = set(NewsletterDailyStats.objects.exclude(count=0).values_list('day', 'cohort', 'event', 'count'))
+        drifted = actual != stored
+
+        if options['dry_run'] or not drifted:
+            self.stdout.write(f'newsletter growth rollups: {"drifted" if drifted else "in step"}')
+            return
+
+        stats.rebuild()
+        self.stdout.write(self.style.SUCCESS('newsletter growth rollups: rebuilt'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from jobs.queue import enqueue
+from newsletter.models import NewsletterDigest
+from newsletter.tasks import send_digest
+
+
+class Command(BaseCommand):
+    help = 'Queue the daily and weekly newsletter digests of the last complete period; run this daily'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frequency', choices=['daily', 'weekly'], action='append',
+                            help='Only build digests of this frequency (repeatable)')
+
+    def handle(self, *args, **options):
+        for frequency in options['frequency'] or ['daily', 'weekly']:
+            digest = NewsletterDigest.build(frequency)
+            if digest is None:
+                self.stdout.write(f'{frequency}: nothing published')
+            elif digest.sent_at is not None:
+                self.stdout.write(f'{frequency}: {digest} already sent')
+            else:
+                enqueue(send_digest, digest_id=digest.id)
+                self.stdout.write(self.style.SUCCESS(f'{frequency}: queued {digest} ({digest.blogs.count()} posts)'))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0003_comment_counts'),
+        ('newsletter', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsletterDelivery',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('sent', 'Sent'), ('failed', 'Failed')], max_length=10)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='newsletter_deliveries', to='blogs.blog')),
+                ('subscriber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='newsletter.newslettersubscriber')),
+            ],
+            options={
+                'verbose_name': 'Newsletter Delivery',
+                'verbose_name_plural': 'Newsletter Deliveries',
+                'db_table': 'newsletter_deliveries',
+                'indexes': [models.Index(fields=['blog', 'status'], name='newsletter__blog_id_b564a0_idx')],
+                'constraints': [models.UniqueConstraint(fields=('blog', 'subscriber'), name='unique_newsletter_delivery')],
+            },
+        ),
+    ]
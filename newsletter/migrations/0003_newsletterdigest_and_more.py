@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0003_comment_counts'),
+        ('newsletter', '0002_newsletterdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsletterDigest',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('period_end', models.DateTimeField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Newsletter Digest',
+                'verbose_name_plural': 'Newsletter Digests',
+                'db_table': 'newsletter_digests',
+                'ordering': ['-period_start'],
+            },
+        ),
+        migrations.AddField(
+            model_name='newslettersubscriber',
+            name='digest_frequency',
+            field=models.CharField(choices=[('immediate', 'Every post'), ('daily', 'Daily digest'), ('weekly', 'Weekly digest')], default='immediate', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='newslettersubscriber',
+            index=models.Index(fields=['digest_frequency', 'is_active'], name='newsletter__digest__fad83f_idx'),
+        ),
+        migrations.AddField(
+            model_name='newsletterdigest',
+            name='blogs',
+            field=models.ManyToManyField(related_name='newsletter_digests', to='blogs.blog'),
+        ),
+        migrations.AddConstraint(
+            model_name='newsletterdigest',
+            constraint=models.UniqueConstraint(fields=('frequency', 'period_start'), name='unique_newsletter_digest'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0003_newsletterdigest_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newslettersubscriber',
+            name='name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
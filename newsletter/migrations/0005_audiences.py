@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:29
+
+import zlib
+
+from django.db import migrations, models
+
+
+def fill_all_audience(apps, schema_editor):
+    NewsletterSubscriber = apps.get_model('newsletter', 'NewsletterSubscriber')
+    NewsletterAudience = apps.get_model('newsletter', 'NewsletterAudience')
+
+    # Nobody has preferences yet: everyone gets every post. The bitset has
+    # bit ``id`` set for each subscriber, little-endian, zlib-compressed.
+    subscriber_ids = list(NewsletterSubscriber.objects.values_list('id', flat=True).iterator(chunk_size=5000))
+    bits = bytearray((max(subscriber_ids) >> 3) + 1 if subscriber_ids else 0)
+    for subscriber_id in subscriber_ids:
+        bits[subscriber_id >> 3] |= 1 << (subscriber_id & 7)
+    NewsletterAudience.objects.create(key='all', bits=zlib.compress(bytes(bits), 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0001_initial'),
+        ('newsletter', '0004_newslettersubscriber_name'),
+        ('tags', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsletterAudience',
+            fields=[
+                ('key', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('bits', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'Newsletter Audience',
+                'verbose_name_plural': 'Newsletter Audiences',
+                'db_table': 'newsletter_audiences',
+            },
+        ),
+        migrations.AddField(
+            model_name='newslettersubscriber',
+            name='categories',
+            field=models.ManyToManyField(blank=True, help_text='Only mail posts in these categories (or with these tags)', related_name='newsletter_subscribers', to='categories.category'),
+        ),
+        migrations.AddField(
+            model_name='newslettersubscriber',
+            name='tags',
+            field=models.ManyToManyField(blank=True, help_text='Only mail posts with these tags (or in these categories)', related_name='newsletter_subscribers', to='tags.tag'),
+        ),
+        migrations.RunPython(fill_all_audience, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:45
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def fill_daily_stats(apps, schema_editor):
+    """Count every subscriber on the day they came and, if gone, the day they left."""
+    NewsletterSubscriber = apps.get_model('newsletter', 'NewsletterSubscriber')
+    NewsletterDailyStats = apps.get_model('newsletter', 'NewsletterDailyStats')
+
+    subscribers = NewsletterSubscriber.objects.order_by().annotate(cohort=TruncDate('subscription_date'))
+    rows = [
+        NewsletterDailyStats(day=cohort, cohort=cohort, event='subscribed', count=total)
+        for cohort, total in subscribers.values_list('cohort').annotate(total=Count('id'))
+    ]
+    unsubscribed = (subscribers.filter(is_active=False)
+                    .annotate(day=Coalesce(TruncDate('unsubscribed_at'), 'cohort'))
+                    .values_list('day', 'cohort').annotate(total=Count('id')))
+    rows.extend(
+        NewsletterDailyStats(day=day, cohort=cohort, event='unsubscribed', count=total)
+        for day, cohort, total in unsubscribed
+    )
+    NewsletterDailyStats.objects.bulk_create(rows, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0005_audiences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsletterDailyStats',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('cohort', models.DateField()),
+                ('event', models.CharField(choices=[('subscribed', 'Subscribed'), ('unsubscribed', 'Unsubscribed')], max_length=12)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Newsletter Daily Stats',
+                'verbose_name_plural': 'Newsletter Daily Stats',
+                'db_table': 'newsletter_daily_stats',
+                'indexes': [models.Index(fields=['cohort', 'day'], name='newsletter__cohort_c2b7ae_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'cohort', 'event'), name='unique_newsletter_daily_stats')],
+            },
+        ),
+        migrations.RunPython(fill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:24
+
+import zlib
+
+from django.db import migrations, models
+
+
+# Subscriber ids per segment row
+SEGMENT_BITS = 1 << 16
+
+
+def split_audiences(apps, schema_editor):
+    """Cut each stored bitset (little-endian, zlib-compressed) into segment rows."""
+    NewsletterAudience = apps.get_model('newsletter', 'NewsletterAudience')
+    NewsletterAudienceSegment = apps.get_model('newsletter', 'NewsletterAudienceSegment')
+
+    segment_bytes = SEGMENT_BITS // 8
+    rows = []
+    for key, bits in NewsletterAudience.objects.values_list('key', 'bits').iterator():
+        data = zlib.decompress(bytes(bits))
+        for segment, start in enumerate(range(0, len(data), segment_bytes)):
+            chunk = data[start:start + segment_bytes].rstrip(b'\0')
+            if chunk:
+                rows.append(NewsletterAudienceSegment(key=key, segment=segment, bits=zlib.compress(chunk, 1)))
+    NewsletterAudienceSegment.objects.bulk_create(rows, batch_size=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0006_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsletterAudienceSegment',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=50)),
+                ('segment', models.PositiveIntegerField(help_text='Holds the subscriber ids from segment * SEGMENT_BITS on')),
+                ('bits', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'Newsletter Audience Segment',
+                'verbose_name_plural': 'Newsletter Audience Segments',
+                'db_table': 'newsletter_audience_segments',
+            },
+        ),
+        migrations.RunPython(split_audiences, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='NewsletterAudience',
+        ),
+        migrations.AddConstraint(
+            model_name='newsletteraudiencesegment',
+            constraint=models.UniqueConstraint(fields=('key', 'segment'), name='unique_newsletter_audience_segment'),
+        ),
+    ]
@@ -1,17 +1,50 @@
-from django.db import models
+import logging
+import operator
+from datetime import timedelta
+from functools import reduce
+
+from django.db import models, transaction
+from django.db.models import Count, Exists, OuterRef, Q
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from django.core import signing
+from . import audience
+from .dispatch import Dispatcher, DispatchResult
+from .rendering import Newsletter
+
+
+logger = logging.getLogger(__name__)
+
+# Subscribers loaded per query when sending
+RECIPIENT_BATCH_SIZE = 1000
+
+
+def unsubscribe_signer():
+    return signing.Signer(salt='newsletter.unsubscribe')
+
+
+def frontend_url():
+    return settings.FRONTEND_URL or 'http://localhost:3000'
 
 
 class NewsletterSubscriber(models.Model):
     """Newsletter subscription model."""
     
+    FREQUENCY_CHOICES = [
+        ('immediate', 'Every post'),
+        ('daily', 'Daily digest'),
+        ('weekly', 'Weekly digest'),
+    ]
+    
     id = models.AutoField(primary_key=True)
     email = models.EmailField(unique=True)
+    name = models.CharField(max_length=100, blank=True)
     is_active = models.BooleanField(default=True)
+    digest_frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='immediate')
+    categories = models.ManyToManyField('categories.Category', blank=True, related_name='newsletter_subscribers',
+                                        help_text='Only mail posts in these categories (or with these tags)')
+    tags = models.ManyToManyField('tags.Tag', blank=True, related_name='newsletter_subscribers',
+                                  help_text='Only mail posts with these tags (or in these categories)')
     subscription_date = models.DateTimeField(default=timezone.now)
     unsubscribed_at = models.DateTimeField(blank=True, null=True)
     
@@ -20,10 +53,31 @@ class NewsletterSubscriber(models.Model):
         verbose_name = 'Newsletter Subscriber'
         verbose_name_plural = 'Newsletter Subscribers'
         ordering = ['-subscription_date']
+        indexes = [
+            models.Index(fields=['digest_frequency', 'is_active']),
+        ]
     
     def __str__(self):
         return self.email
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored state so that the signals can adjust the growth
+        # rollups and the subscription lookups.
+        instance._loaded_state = instance.growth_state
+        instance._loaded_email = instance.__dict__.get('email')
+        return instance
+    
+    @property
+    def growth_state(self):
+        """What the growth rollups (see ``stats``) count this subscriber by."""
+        return (
+            self.__dict__.get('subscription_date'),
+            self.__dict__.get('is_active'),
+            self.__dict__.get('unsubscribed_at'),
+        )
+    
     def unsubscribe(self):
         """Unsubscribe the user from newsletter."""
         self.is_active = False
@@ -37,46 +91,319 @@ class NewsletterSubscriber(models.Model):
         self.save()
     
     @classmethod
-    def send_newsletter(cls, blog_post):
-        """Send newsletter to all active subscribers when a new blog is published."""
-        active_subscribers = cls.objects.filter(is_active=True)
+    def set_active(cls, subscriber_ids, active):
+        """Resubscribe or unsubscribe ``subscriber_ids`` in one ``UPDATE``; returns how many changed."""
+        from . import lookup, stats
         
-        if not active_subscribers.exists():
-            return
+        now = timezone.now()
+        unsubscribed_at = None if active else now
+        with transaction.atomic():
+            rows = list(
+                cls.objects.select_for_update().filter(id__in=subscriber_ids, is_active=not active)
+                .order_by().values_list('id', 'subscription_date', 'unsubscribed_at', 'email')
+            )
+            changed = cls.objects.filter(id__in=[row[0] for row in rows]).update(
+                is_active=active, unsubscribed_at=unsubscribed_at
+            )
+            stats.record_changes([
+                ((subscribed_at, not active, old_unsubscribed_at), (subscribed_at, active, unsubscribed_at))
+                for _, subscribed_at, old_unsubscribed_at, _ in rows
+            ])
+            emails = [row[3] for row in rows]
+            transaction.on_commit(lambda: lookup.subscriptions_changed(emails, emails if active else ()))
+        return changed
+    
+    @classmethod
+    def send_newsletter(cls, blog_post):
+        """Send newsletter to active subscribers of every post when a new blog is published.
         
+        Each subscriber gets their own message. Returns None when there is
+        nobody to send to, otherwise whether every message was sent.
+        """
+        result = cls.dispatch_newsletter(blog_post)
+        if not result.sent and not result.failed:
+            return None
+        if result.failed:
+            logger.warning(
+                'Failed to send the newsletter of blog %s to %s of %s subscribers',
+                blog_post.pk, result.failed, result.sent + result.failed,
+            )
+        return not result.failed
+    
+    @classmethod
+    def dispatch_newsletter(cls, blog_post):
+        """Send the newsletter for ``blog_post``; returns the ``DispatchResult``."""
         subject = f"New Blog Post: {blog_post.title}"
+        newsletter = Newsletter('post', {'blog_post': blog_post, 'frontend_url': frontend_url()})
+        subscribers = cls.objects.filter(is_active=True, digest_frequency='immediate')
+        return cls.dispatch([blog_post], lambda posts: (subject, newsletter), subscribers)
+    
+    @classmethod
+    def dispatch(cls, blogs, compose, subscribers):
+        """Mail ``blogs`` to those of ``subscribers`` who want them and record the deliveries.
         
-        # Create email content
-        context = {
-            'blog_post': blog_post,
-            'blog_url': f"{settings.FRONTEND_URL or 'http://localhost:3000'}/blogs/{blog_post.slug}",
-        }
-        
-        # You can create an HTML template for better formatting
-        html_message = f"""
-        <h2>New Blog Post Published!</h2>
-        <h3>{blog_post.title}</h3>
-        <p>{blog_post.meta_description or 'Check out our latest blog post!'}</p>
-        <p><a href="{context['blog_url']}">Read More</a></p>
-        <hr>
-        <p><small>You're receiving this because you subscribed to our newsletter.</small></p>
+        Recipients come from the audience bitsets of the posts, and each
+        gets the posts they want: ``compose(posts)`` returns the subject and
+        ``Newsletter`` for them, once per distinct selection. Subscribers
+        with a delivery of any of ``blogs`` are skipped, so a send that was
+        interrupted, or a post published again, resumes instead of mailing
+        everyone twice.
         """
+        audiences = audience.resolve(blogs)
+        wanted = reduce(operator.or_, audiences.values())
+        delivered = NewsletterDelivery.objects.filter(blog__in=blogs, subscriber=OuterRef('pk'), status='sent')
+        pending = subscribers.filter(~Exists(delivered)).order_by('id').values_list('id', 'email', 'name')
+        recipients_by_email = {}
+        messages = {}
+        signer = unsubscribe_signer()
+        
+        def recipients():
+            # Load only the subscribers who want a post, by primary key
+            for ids in wanted.batches(RECIPIENT_BATCH_SIZE):
+                for subscriber_id, email, name in pending.filter(id__in=ids):
+                    posts = tuple(blog for blog in blogs if subscriber_id in audiences[blog.id])
+                    recipients_by_email[email] = (subscriber_id, name, posts)
+                    yield email
         
-        plain_message = strip_tags(html_message)
+        def personalize(email):
+            subscriber_id, name, posts = recipients_by_email[email]
+            if posts not in messages:
+                messages[posts] = compose(posts)
+            subject, newsletter = messages[posts]
+            unsubscribe_url = cls.unsubscribe_url(subscriber_id, signer)
+            text, html = newsletter.render({'name': name or 'there', 'email': email, 'unsubscribe_url': unsubscribe_url})
+            return subject, text, html, {
+                'List-Unsubscribe': f'<{unsubscribe_url}>',
+                'List-Unsubscribe-Post': 'List-Unsubscribe=One-Click',
+            }
         
-        # Send email to all subscribers
-        recipient_list = [subscriber.email for subscriber in active_subscribers]
+        def record(outcomes):
+            recorded = []
+            for email, error in outcomes:
+                subscriber_id, _, posts = recipients_by_email.pop(email)
+                recorded.append((posts, subscriber_id, error))
+            NewsletterDelivery.record(recorded)
         
+        return Dispatcher().send(None, None, None, recipients(), on_chunk=record, personalize=personalize)
+    
+    @staticmethod
+    def unsubscribe_token(subscriber_id, signer=None):
+        return (signer or unsubscribe_signer()).sign(str(subscriber_id))
+    
+    @classmethod
+    def from_unsubscribe_token(cls, token):
+        """The subscriber a signed unsubscribe token was made for, or None."""
         try:
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=recipient_list,
-                html_message=html_message,
-                fail_silently=False,
-            )
-            return True
-        except Exception as e:
-            print(f"Failed to send newsletter: {e}")
-            return False
+            subscriber_id = int(unsubscribe_signer().unsign(token))
+        except (signing.BadSignature, ValueError):
+            return None
+        return cls.objects.filter(pk=subscriber_id).first()
+    
+    @classmethod
+    def unsubscribe_url(cls, subscriber_id, signer=None):
+        """One-click unsubscribe link; POSTing to it unsubscribes without logging in.
+        
+        Pass the ``signer`` from ``unsubscribe_signer()`` when making many links.
+        """
+        return f"{settings.BACKEND_URL}/api/newsletter/unsubscribe/{cls.unsubscribe_token(subscriber_id, signer)}/"
+
+
+class NewsletterDelivery(models.Model):
+    """Outcome of mailing one blog post to one subscriber."""
+    
+    STATUS_CHOICES = [
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    blog = models.ForeignKey('blogs.Blog', on_delete=models.CASCADE, related_name='newsletter_deliveries')
+    subscriber = models.ForeignKey(NewsletterSubscriber, on_delete=models.CASCADE, related_name='deliveries')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    error = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'newsletter_deliveries'
+        verbose_name = 'Newsletter Delivery'
+        verbose_name_plural = 'Newsletter Deliveries'
+        constraints = [
+            models.UniqueConstraint(fields=['blog', 'subscriber'], name='unique_newsletter_delivery'),
+        ]
+        indexes = [
+            models.Index(fields=['blog', 'status']),
+        ]
+    
+    def __str__(self):
+        return f'{self.blog_id} -> {self.subscriber_id} ({self.status})'
+    
+    @classmethod
+    def record(cls, outcomes):
+        """Store ``(blogs, subscriber_id, error or None)`` outcomes in one upsert."""
+        now = timezone.now()
+        cls.objects.bulk_create(
+            [
+                cls(blog=blog, subscriber_id=subscriber_id, status='failed' if error else 'sent',
+                    error=(error or '')[:255], updated_at=now)
+                for blogs, subscriber_id, error in outcomes
+                for blog in blogs
+            ],
+            update_conflicts=True, unique_fields=['blog', 'subscriber'],
+            update_fields=['status', 'error', 'updated_at'],
+        )
+    
+    @classmethod
+    def stats(cls, blog):
+        """Deliveries of ``blog`` by status, and recipients not reached yet.
+        
+        Recipients are chosen as ``dispatch_newsletter`` chooses them: active
+        subscribers who get posts immediately and want this one.
+        """
+        counts = cls.objects.filter(blog=blog).aggregate(
+            sent=Count('id', filter=Q(status='sent')),
+            failed=Count('id', filter=Q(status='failed')),
+        )
+        wanted = audience.resolve([blog])[blog.id]
+        delivered = cls.objects.filter(blog=blog, subscriber=OuterRef('pk'), status='sent')
+        pending = NewsletterSubscriber.objects.filter(is_active=True, digest_frequency='immediate').filter(
+            ~Exists(delivered)
+        )
+        counts['pending'] = sum(
+            pending.filter(id__in=ids).count() for ids in wanted.batches(RECIPIENT_BATCH_SIZE)
+        )
+        return counts
+
+
+class NewsletterDigest(models.Model):
+    """Posts published during one day or week, mailed together to digest subscribers."""
+    
+    FREQUENCY_CHOICES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+    ]
+    
+    id = models.AutoField(primary_key=True)
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES)
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+    blogs = models.ManyToManyField('blogs.Blog', related_name='newsletter_digests')
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'newsletter_digests'
+        verbose_name = 'Newsletter Digest'
+        verbose_name_plural = 'Newsletter Digests'
+        ordering = ['-period_start']
+        constraints = [
+            models.UniqueConstraint(fields=['frequency', 'period_start'], name='unique_newsletter_digest'),
+        ]
+    
+    def __str__(self):
+        return f'{self.frequency} digest of {self.period_start:%Y-%m-%d}'
+    
+    @staticmethod
+    def last_period(frequency, now=None):
+        """Start and end of the last complete day, or Monday-to-Monday week."""
+        end = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        if frequency == 'weekly':
+            end -= timedelta(days=end.weekday())
+            return end - timedelta(days=7), end
+        return end - timedelta(days=1), end
+    
+    @classmethod
+    def build(cls, frequency, now=None):
+        """The digest of the last complete period, or None if nothing was published in it."""
+        from blogs.models import Blog
+        
+        start, end = cls.last_period(frequency, now)
+        digest = cls.objects.filter(frequency=frequency, period_start=start).first()
+        if digest is not None:
+            return digest
+        blogs = list(Blog.objects.filter(status='published', published_at__gte=start, published_at__lt=end)
+                     .values_list('id', flat=True))
+        if not blogs:
+            return None
+        with transaction.atomic():
+            digest, created = cls.objects.get_or_create(frequency=frequency, period_start=start,
+                                                        defaults={'period_end': end})
+            if created:
+                digest.blogs.set(blogs)
+        return digest
+    
+    def dispatch(self):
+        """Mail the digest to its subscribers; returns the ``DispatchResult``.
+        
+        Subscribers with category or tag preferences get only the posts
+        they want; the digest is rendered once per distinct selection.
+        """
+        blogs = list(self.blogs.filter(status='published').order_by('published_at', 'id'))
+        if not blogs:
+            return DispatchResult()
+        period = 'week' if self.frequency == 'weekly' else 'day'
+        
+        def compose(posts):
+            subject = f"Your {self.frequency} digest: {len(posts)} new post{'s' if len(posts) > 1 else ''}"
+            return subject, Newsletter('digest', {
+                'blogs': posts,
+                'frequency': self.frequency,
+                'period': period,
+                'frontend_url': frontend_url(),
+            })
+        
+        subscribers = NewsletterSubscriber.objects.filter(is_active=True, digest_frequency=self.frequency)
+        result = NewsletterSubscriber.dispatch(blogs, compose, subscribers)
+        if not result.failed:
+            self.sent_at = timezone.now()
+            self.save(update_fields=['sent_at'])
+        return result
+
+
+class NewsletterAudienceSegment(models.Model):
+    """One segment of the compressed bitset of the subscribers who want a category or tag (see ``audience``)."""
+    
+    id = models.AutoField(primary_key=True)
+    key = models.CharField(max_length=50)
+    segment = models.PositiveIntegerField(help_text='Holds the subscriber ids from segment * SEGMENT_BITS on')
+    bits = models.BinaryField()
+    
+    class Meta:
+        db_table = 'newsletter_audience_segments'
+        verbose_name = 'Newsletter Audience Segment'
+        verbose_name_plural = 'Newsletter Audience Segments'
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'segment'], name='unique_newsletter_audience_segment'),
+        ]
+    
+    def __str__(self):
+        return f'{self.key} #{self.segment}'
+
+
+class NewsletterDailyStats(models.Model):
+    """Subscribers per day, cohort (day subscribed) and event; see ``stats``."""
+    
+    EVENT_CHOICES = [
+        ('subscribed', 'Subscribed'),
+        ('unsubscribed', 'Unsubscribed'),
+    ]
+    KEY_FIELDS = ('day', 'cohort', 'event')
+    
+    id = models.AutoField(primary_key=True)
+    day = models.DateField()
+    cohort = models.DateField()
+    event = models.CharField(max_length=12, choices=EVENT_CHOICES)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'newsletter_daily_stats'
+        verbose_name = 'Newsletter Daily Stats'
+        verbose_name_plural = 'Newsletter Daily Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'cohort', 'event'], name='unique_newsletter_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['cohort', 'day']),
+        ]
+    
+    def __str__(self):
+        return f'{self.day} cohort {self.cohort} {self.event}: {self.count}'
@@ -0,0 +1,74 @@
+"""
+Newsletter templates rendered once per send and personalized per recipient.
+
+A newsletter template is rendered with the Django template engine once, with
+``recipient`` standing in for the per-recipient fields. Each
+``{{ recipient.<field> }}`` renders as a marker, and the output is compiled
+into a format string with one slot per marker. Personalizing a message
+is then a single ``str.format_map`` call, which costs microseconds where a
+template render per recipient costs a millisecond or more.
+
+Each render draws a random marker, so content in the context (a post title,
+say) cannot forge one and open a slot of its own.
+
+Fields spliced into the HTML part are escaped. Text templates should turn
+autoescaping off.
+"""
+import html
+import re
+import secrets
+
+from django.template.loader import render_to_string
+
+
+FIELDS = ('name', 'email', 'unsubscribe_url')
+
+class Placeholders:
+    """The ``recipient`` of the one render: every field is a marker."""
+
+    def __init__(self):
+        self.token = secrets.token_hex(16)
+        self.pattern = re.compile(f'\x1f{self.token}:(\\w+)\x1f')
+
+    def __getattr__(self, name):
+        if name not in FIELDS:
+            raise AttributeError(name)
+        return f'\x1f{self.token}:{name}\x1f'
+
+
+class CompiledTemplate:
+    """Rendered output with slots for per-recipient fields."""
+
+    def __init__(self, rendered, placeholders, escape=None):
+        # Literals and field names alternate
+        parts = placeholders.pattern.split(rendered)
+        self.fields = frozenset(parts[1::2])
+        self.format = ''.join(
+            '{' + part + '}' if index % 2 else part.replace('{', '{{').replace('}', '}}')
+            for index, part in enumerate(parts)
+        )
+        self.escape = escape
+
+    def render(self, fields):
+        if self.escape is not None:
+            fields = {name: self.escape(fields[name]) for name in self.fields}
+        return self.format.format_map(fields)
+
+
+def compile_template(template_name, context, escape=None):
+    """Render ``template_name`` once and compile it for personalization."""
+    placeholders = Placeholders()
+    rendered = render_to_string(template_name, {**context, 'recipient': placeholders})
+    return CompiledTemplate(rendered, placeholders, escape=escape)
+
+
+class Newsletter:
+    """The text and HTML parts of one newsletter, ready to personalize."""
+
+    def __init__(self, name, context):
+        self.text = compile_template(f'newsletter/{name}.txt', context)
+        self.html = compile_template(f'newsletter/{name}.html', context, escape=html.escape)
+
+    def render(self, fields):
+        """The text and HTML parts for one recipient's ``fields``."""
+        return self.text.render(fields), self.html.render(fields)
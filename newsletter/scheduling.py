@@ -0,0 +1,180 @@
+"""
+Per-domain scheduling of newsletter messages.
+
+Mail providers throttle senders that deliver too much to their users at
+once. ``DomainScheduler`` keeps the messages waiting to be sent in one queue
+per recipient domain and hands them to the sending threads round robin,
+skipping domains that are out of tokens or already have their maximum of
+messages in flight. Each domain has a token bucket refilled at ``rate``
+messages a second up to ``burst``, so no domain gets more than its rate
+while the others keep the connections busy.
+
+A domain whose server defers a message (a 4xx reply) is paused for
+``NEWSLETTER_DOMAIN_BACKOFF`` seconds. Its waiting messages are handed back
+as deferred instead of holding the send up; the delivery ledger retries
+them on the next run.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+
+def domain_of(address):
+    return address.rpartition('@')[2].lower()
+
+
+class TokenBucket:
+    """``rate`` tokens a second, up to ``burst``; a rate of 0 never runs out."""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = now
+
+    def wait(self, now):
+        """Seconds until a token is available."""
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate:
+            self.tokens -= 1
+
+
+class DomainLimits:
+    """The ``(rate, burst, concurrency)`` of each domain; 0 means unlimited.
+
+    ``overrides`` maps domains to dicts with any of those keys, defaulting
+    to ``NEWSLETTER_DOMAIN_LIMITS``.
+    """
+
+    def __init__(self, rate=None, burst=None, concurrency=None, overrides=None):
+        self.rate = rate if rate is not None else getattr(settings, 'NEWSLETTER_DOMAIN_RATE', 20.0)
+        self.burst = burst if burst is not None else getattr(settings, 'NEWSLETTER_DOMAIN_BURST', 40)
+        self.concurrency = (concurrency if concurrency is not None
+                            else getattr(settings, 'NEWSLETTER_DOMAIN_CONCURRENCY', 2))
+        self.overrides = overrides if overrides is not None else getattr(settings, 'NEWSLETTER_DOMAIN_LIMITS', {})
+
+    def __call__(self, domain):
+        override = self.overrides.get(domain, {})
+        return (
+            override.get('rate', self.rate),
+            override.get('burst', self.burst),
+            override.get('concurrency', self.concurrency),
+        )
+
+
+class Domain:
+    __slots__ = ('queue', 'bucket', 'concurrency', 'in_flight', 'paused_until')
+
+    def __init__(self, rate, burst, concurrency, now):
+        self.queue = deque()
+        self.bucket = TokenBucket(rate, burst, now)
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+
+
+class DomainScheduler:
+    """Queues items by recipient domain and releases them within the domains' limits.
+
+    Thread-safe: one thread ``put``s and ``close``s, any number ``get`` and
+    report back with ``done``.
+    """
+
+    def __init__(self, limits=None, backoff=None, clock=time.monotonic):
+        self.limits = limits or DomainLimits()
+        self.backoff = backoff if backoff is not None else getattr(settings, 'NEWSLETTER_DOMAIN_BACKOFF', 60)
+        self.clock = clock
+        self.domains = {}
+        # Domains with waiting items, in round robin order
+        self.ready = OrderedDict()
+        self.waiting = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def domain(self, name):
+        domain = self.domains.get(name)
+        if domain is None:
+            domain = self.domains[name] = Domain(*self.limits(name), now=self.clock())
+        return domain
+
+    def put(self, address, item):
+        """Queue ``item`` for ``address``; returns False, without queueing it, while its domain is paused."""
+        name = domain_of(address)
+        with self.condition:
+            domain = self.domain(name)
+            if domain.paused_until > self.clock():
+                return False
+            domain.queue.append(item)
+            self.ready.setdefault(name, domain)
+            self.waiting += 1
+            self.condition.notify()
+        return True
+
+    def close(self):
+        """No more items; ``get`` returns None once the queues are empty."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def cancel(self):
+        """Drop the waiting items and close."""
+        with self.condition:
+            for domain in self.ready.values():
+                domain.queue.clear()
+            self.ready.clear()
+            self.waiting = 0
+        self.close()
+
+    def get(self):
+        """Wait for an item that may be sent now; returns ``(domain, item)``, or None when closed and empty."""
+        with self.condition:
+            while True:
+                now = self.clock()
+                delay = None
+                for name, domain in self.ready.items():
+                    if domain.concurrency and domain.in_flight >= domain.concurrency:
+                        continue
+                    wait = domain.bucket.wait(now)
+                    if wait:
+                        delay = wait if delay is None else min(delay, wait)
+                        continue
+                    domain.bucket.take()
+                    domain.in_flight += 1
+                    item = domain.queue.popleft()
+                    self.waiting -= 1
+                    if domain.queue:
+                        self.ready.move_to_end(name)
+                    else:
+                        del self.ready[name]
+                    return name, item
+                if self.closed and not self.waiting:
+                    return None
+                # Woken early by ``put`` and ``done``
+                self.condition.wait(delay)
+
+    def done(self, name, deferred=False):
+        """Free the slot of an item from ``get``.
+
+        When the item was ``deferred`` the domain is paused, and its waiting
+        items are returned to be reported as deferred too.
+        """
+        with self.condition:
+            domain = self.domains[name]
+            domain.in_flight -= 1
+            dropped = []
+            if deferred:
+                domain.paused_until = self.clock() + self.backoff
+                dropped = list(domain.queue)
+                domain.queue.clear()
+                self.ready.pop(name, None)
+                self.waiting -= len(dropped)
+            self.condition.notify_all()
+        return dropped
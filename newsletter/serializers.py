@@ -1,15 +1,23 @@
 from rest_framework import serializers
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError as DjangoValidationError
+from categories.models import Category
+from tags.models import Tag
 from .models import NewsletterSubscriber
 
 
 class NewsletterSubscribeSerializer(serializers.ModelSerializer):
     """Serializer for newsletter subscription"""
+    categories = serializers.SlugRelatedField(
+        many=True, required=False, slug_field='slug', queryset=Category.objects.all()
+    )
+    tags = serializers.SlugRelatedField(
+        many=True, required=False, slug_field='slug', queryset=Tag.objects.all()
+    )
     
     class Meta:
         model = NewsletterSubscriber
-        fields = ['email']
+        fields = ['email', 'name', 'digest_frequency', 'categories', 'tags']
     
     def validate_email(self, value):
         """Validate email format and uniqueness"""
@@ -28,19 +36,31 @@ class NewsletterSubscribeSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """Create or reactivate newsletter subscription"""
         email = validated_data['email']
+        categories = validated_data.pop('categories', None)
+        tags = validated_data.pop('tags', None)
         
         # Check if subscriber exists but is inactive
         existing_subscriber = NewsletterSubscriber.objects.filter(email=email).first()
         if existing_subscriber:
             if not existing_subscriber.is_active:
+                existing_subscriber.name = validated_data.get('name', existing_subscriber.name)
+                existing_subscriber.digest_frequency = validated_data.get(
+                    'digest_frequency', existing_subscriber.digest_frequency
+                )
                 existing_subscriber.resubscribe()
-                return existing_subscriber
+                subscriber = existing_subscriber
             else:
                 # This shouldn't happen due to validation, but just in case
                 raise serializers.ValidationError("This email is already subscribed.")
+        else:
+            # Create new subscriber
+            subscriber = NewsletterSubscriber.objects.create(**validated_data)
         
-        # Create new subscriber
-        return NewsletterSubscriber.objects.create(**validated_data)
+        if categories is not None:
+            subscriber.categories.set(categories)
+        if tags is not None:
+            subscriber.tags.set(tags)
+        return subscriber
 
 
 class NewsletterUnsubscribeSerializer(serializers.Serializer):
@@ -68,11 +88,18 @@ class NewsletterUnsubscribeSerializer(serializers.Serializer):
 
 class NewsletterSubscriberSerializer(serializers.ModelSerializer):
     """Serializer for newsletter subscriber (admin view)"""
+    categories = serializers.SlugRelatedField(
+        many=True, required=False, slug_field='slug', queryset=Category.objects.all()
+    )
+    tags = serializers.SlugRelatedField(
+        many=True, required=False, slug_field='slug', queryset=Tag.objects.all()
+    )
     
     class Meta:
         model = NewsletterSubscriber
         fields = [
-            'id', 'email', 'is_active', 'subscription_date', 'unsubscribed_at'
+            'id', 'email', 'name', 'is_active', 'digest_frequency', 'categories', 'tags',
+            'subscription_date', 'unsubscribed_at'
         ]
         read_only_fields = ['id', 'subscription_date', 'unsubscribed_at']
 
@@ -87,27 +114,23 @@ class NewsletterBulkActionSerializer(serializers.Serializer):
     
     def validate_subscriber_ids(self, value):
         """Validate all subscriber IDs exist"""
-        existing_subscribers = NewsletterSubscriber.objects.filter(id__in=value)
-        if len(existing_subscribers) != len(value):
+        value = list(dict.fromkeys(value))
+        if NewsletterSubscriber.objects.filter(id__in=value).count() != len(value):
             raise serializers.ValidationError("One or more subscriber IDs do not exist.")
         return value
     
     def save(self):
-        """Perform bulk action on subscribers"""
+        """Perform bulk action on subscribers; returns how many changed"""
         action = self.validated_data['action']
         subscriber_ids = self.validated_data['subscriber_ids']
         
-        subscribers = NewsletterSubscriber.objects.filter(id__in=subscriber_ids)
-        
-        if action == 'activate':
-            for subscriber in subscribers:
-                if not subscriber.is_active:
-                    subscriber.resubscribe()
-        elif action == 'deactivate':
-            for subscriber in subscribers:
-                if subscriber.is_active:
-                    subscriber.unsubscribe()
-        elif action == 'delete':
-            subscribers.delete()
-        
-        return subscribers
\ No newline at end of file
+        if action == 'delete':
+            return NewsletterSubscriber.objects.filter(id__in=subscriber_ids).delete()[1].get(
+                NewsletterSubscriber._meta.label, 0
+            )
+        return NewsletterSubscriber.set_active(subscriber_ids, action == 'activate')
+
+
+class NewsletterImportSerializer(serializers.Serializer):
+    """Serializer for CSV subscriber imports"""
+    file = serializers.FileField()
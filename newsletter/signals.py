@@ -0,0 +1,110 @@
+"""
+Keep the newsletter audience bitsets (see ``audience``) in step with
+subscription preferences.
+
+New subscribers join ``all``. Adding or removing categories and tags, from
+either side of the relation, sets or clears their bits, and moves the
+subscribers in or out of ``all`` when they gain their first or lose their
+last preference. Deleting a category or tag drops its bitset.
+
+Subscriber changes also move the growth rollups (see ``stats``) and, once
+committed, refresh the subscription lookups (see ``lookup``).
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from categories.models import Category
+from tags.models import Tag
+from . import audience, lookup, stats
+from .models import NewsletterAudienceSegment, NewsletterSubscriber
+
+
+@receiver(post_save, sender=NewsletterSubscriber)
+def subscriber_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        audience.update(add={audience.ALL: [instance.pk]})
+
+
+@receiver(post_save, sender=NewsletterSubscriber)
+def subscriber_state_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_state = None if created else getattr(instance, '_loaded_state', instance.growth_state)
+    old_email = getattr(instance, '_loaded_email', instance.email)
+    stats.record_changes([(old_state, instance.growth_state)])
+
+    was_active = old_state is not None and old_state[1]
+    if created or was_active != instance.is_active or old_email != instance.email:
+        emails = {old_email, instance.email}
+        subscribed = [instance.email] if instance.is_active else []
+        # Readers must not cache the old answer again before the change is visible
+        transaction.on_commit(lambda: lookup.subscriptions_changed(emails, subscribed))
+    instance._loaded_state = instance.growth_state
+    instance._loaded_email = instance.email
+
+
+@receiver(post_delete, sender=NewsletterSubscriber)
+def subscriber_deleted(sender, instance, **kwargs):
+    stats.record_changes([(getattr(instance, '_loaded_state', instance.growth_state), None)])
+    emails = {getattr(instance, '_loaded_email', instance.email), instance.email}
+    transaction.on_commit(lambda: lookup.subscriptions_changed(emails))
+
+
+def preferences_changed(relation, key, instance, action, reverse, pk_set, **kwargs):
+    """Shared by the ``categories`` and ``tags`` relations; ``key`` makes a bitset key from an id."""
+    if action == 'pre_clear':
+        # The cleared ids are gone by post_clear
+        if reverse:
+            instance._cleared_subscribers = list(instance.newsletter_subscribers.values_list('pk', flat=True))
+        else:
+            instance._cleared_preferences = list(getattr(instance, relation).values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_clear':
+        if reverse:
+            subscriber_ids, changed = instance._cleared_subscribers, {instance.pk}
+        else:
+            subscriber_ids, changed = [instance.pk], set(instance._cleared_preferences)
+    elif reverse:
+        subscriber_ids, changed = list(pk_set), {instance.pk}
+    else:
+        subscriber_ids, changed = [instance.pk], set(pk_set)
+    if not subscriber_ids or not changed:
+        return
+
+    bits = {key(pk): subscriber_ids for pk in changed}
+    if action == 'post_add':
+        audience.update(add=bits, remove={audience.ALL: subscriber_ids})
+    else:
+        audience.update(remove=bits)
+        audience.refresh_all(subscriber_ids)
+
+
+@receiver(m2m_changed, sender=NewsletterSubscriber.categories.through)
+def categories_changed(sender, **kwargs):
+    preferences_changed('categories', audience.category_key, **kwargs)
+
+
+@receiver(m2m_changed, sender=NewsletterSubscriber.tags.through)
+def tags_changed(sender, **kwargs):
+    preferences_changed('tags', audience.tag_key, **kwargs)
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Tag)
+def preference_deleting(sender, instance, **kwargs):
+    # The relation rows are deleted without m2m_changed
+    instance._newsletter_subscribers = list(instance.newsletter_subscribers.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+def preference_deleted(sender, instance, **kwargs):
+    key = audience.category_key(instance.pk) if sender is Category else audience.tag_key(instance.pk)
+    NewsletterAudienceSegment.objects.filter(key=key).delete()
+    subscriber_ids = getattr(instance, '_newsletter_subscribers', [])
+    if subscriber_ids:
+        audience.refresh_all(subscriber_ids)
@@ -0,0 +1,105 @@
+"""
+A local SMTP server that accepts and counts messages, for benchmarks and tests.
+
+It speaks just enough SMTP for ``smtplib`` (no TLS or authentication), can
+add a delay per message to stand in for a remote server's latency, refuses
+the addresses in ``reject`` and asks to try those in ``defer`` again later.
+``arrivals`` records when each message was accepted, and for whom.
+"""
+import socketserver
+import threading
+import time
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        self.reply('220 smtp-sink ESMTP')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.reply('250-smtp-sink')
+                self.reply('250 8BITMIME')
+            elif command == b'HELO':
+                self.reply('250 smtp-sink')
+            elif command == b'MAIL':
+                sender, recipients = line[10:].strip().strip(b'<>').decode(), []
+                self.reply('250 OK')
+            elif command == b'RCPT':
+                address = line[8:].strip().strip(b'<>').decode()
+                if address in sink.reject:
+                    self.reply('550 Mailbox unavailable')
+                elif address in sink.defer:
+                    self.reply('451 Try again later')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif command == b'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in self.rfile:
+                    if data_line == b'.\r\n':
+                        break
+                    data.append(data_line)
+                if sink.latency:
+                    time.sleep(sink.latency)
+                with sink.lock:
+                    sink.messages.append((sender, recipients, b''.join(data)))
+                    sink.arrivals.extend((address, time.monotonic()) for address in recipients)
+                self.reply('250 OK')
+            elif command in (b'RSET', b'NOOP'):
+                if command == b'RSET':
+                    sender, recipients = None, []
+                self.reply('250 OK')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """Run with ``with SMTPSink() as sink:``; connect to ``sink.host``/``sink.port``."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, reject=(), defer=()):
+        self.server = SMTPServer((host, port), SMTPHandler)
+        self.server.sink = self
+        self.host, self.port = self.server.server_address[:2]
+        self.latency = latency
+        self.reject = set(reject)
+        self.defer = set(defer)
+        self.lock = threading.Lock()
+        self.messages = []
+        self.arrivals = []
+        self.connections = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,129 @@
+"""
+Subscriber growth served from daily rollups instead of table scans.
+
+``NewsletterDailyStats`` counts subscribers by day, cohort (the day they
+subscribed) and event. Every subscriber counts as ``subscribed`` on the day
+they subscribed and, while unsubscribed, as ``unsubscribed`` on the day they
+left. Totals, time series and retention cohorts are sums over these rows,
+whose number grows with days rather than subscribers.
+
+The rollups are adjusted whenever subscribers are created, change state or
+are deleted, and rebuilt from the subscribers table by
+``rebuild_newsletter_stats``.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncWeek
+from django.utils import timezone
+
+from blog_system.counters import add_counts
+from .models import NewsletterDailyStats, NewsletterSubscriber
+
+
+def local_day(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def state_keys(subscription_date, is_active, unsubscribed_at):
+    """The ``(day, cohort, event)`` keys a subscriber in this state counts under."""
+    if subscription_date is None:
+        return []
+    cohort = local_day(subscription_date)
+    keys = [(cohort, cohort, 'subscribed')]
+    if not is_active:
+        # Subscribers deactivated without a date left on the day they came
+        keys.append((local_day(unsubscribed_at) if unsubscribed_at else cohort, cohort, 'unsubscribed'))
+    return keys
+
+
+def record_changes(changes):
+    """Apply ``(old_state, new_state)`` changes; a state is a ``growth_state`` or None."""
+    deltas = Counter()
+    for old, new in changes:
+        if old == new:
+            continue
+        for key in state_keys(*old) if old else ():
+            deltas[key] -= 1
+        for key in state_keys(*new) if new else ():
+            deltas[key] += 1
+    add_counts(NewsletterDailyStats, deltas)
+
+
+def daily_counts(subscribers):
+    """``(day, cohort, event, count)`` rows for ``subscribers``, grouped in the database."""
+    subscribers = subscribers.order_by().annotate(cohort=TruncDate('subscription_date'))
+    for cohort, total in subscribers.values_list('cohort').annotate(total=Count('id')).iterator():
+        yield cohort, cohort, 'subscribed', total
+    unsubscribed = (subscribers.filter(is_active=False)
+                    .annotate(day=Coalesce(TruncDate('unsubscribed_at'), 'cohort'))
+                    .values_list('day', 'cohort').annotate(total=Count('id')))
+    for day, cohort, total in unsubscribed.iterator():
+        yield day, cohort, 'unsubscribed', total
+
+
+def rebuild():
+    """Recompute the rollups from the subscribers table."""
+    with transaction.atomic():
+        NewsletterDailyStats.objects.all().delete()
+        NewsletterDailyStats.objects.bulk_create(
+            (NewsletterDailyStats(day=day, cohort=cohort, event=event, count=total)
+             for day, cohort, event, total in daily_counts(NewsletterSubscriber.objects.all())),
+            batch_size=5000,
+        )
+
+
+def event_columns():
+    return {
+        event: Coalesce(Sum('count', filter=Q(event=event)), 0)
+        for event, _ in NewsletterDailyStats.EVENT_CHOICES
+    }
+
+
+def totals():
+    """``{'subscribed': n, 'unsubscribed': n}`` over all subscribers, in one query."""
+    return NewsletterDailyStats.objects.aggregate(**event_columns())
+
+
+def series(days, period='day'):
+    """Subscriptions and unsubscriptions per day or week over the last ``days`` days."""
+    rows = NewsletterDailyStats.objects.filter(day__gt=timezone.localdate() - timedelta(days=days)).order_by()
+    if period == 'week':
+        rows = rows.annotate(period=TruncWeek('day'))
+    else:
+        rows = rows.annotate(period=F('day'))
+    return [
+        {**row, 'period': row['period'].isoformat(), 'net': row['subscribed'] - row['unsubscribed']}
+        for row in rows.values('period').annotate(**event_columns()).order_by('period')
+    ]
+
+
+def cohorts(weeks):
+    """Retention of the weekly cohorts of the last ``weeks`` weeks.
+
+    ``retained[n]`` is how many of a cohort were still subscribed at the end
+    of the ``n``-th week after the one they subscribed in.
+    """
+    this_week = timezone.localdate() - timedelta(days=timezone.localdate().weekday())
+    first = this_week - timedelta(weeks=weeks - 1)
+    rows = (NewsletterDailyStats.objects.filter(cohort__gte=first).order_by()
+            .annotate(cohort_week=TruncWeek('cohort'), week=TruncWeek('day'))
+            .values_list('cohort_week', 'week', 'event').annotate(total=Sum('count')))
+    sizes = Counter()
+    left = defaultdict(Counter)
+    for cohort, week, event, total in rows:
+        if event == 'subscribed':
+            sizes[cohort] += total
+        else:
+            left[cohort][max((week - cohort).days // 7, 0)] += total
+
+    result = []
+    for cohort in sorted(sizes):
+        retained, remaining = [], sizes[cohort]
+        for offset in range((this_week - cohort).days // 7 + 1):
+            remaining -= left[cohort][offset]
+            retained.append(remaining)
+        result.append({'cohort': cohort.isoformat(), 'size': sizes[cohort], 'retained': retained})
+    return result
@@ -0,0 +1,33 @@
+from blogs.models import Blog
+from jobs.queue import task
+from .models import NewsletterDigest, NewsletterSubscriber
+
+
+class NewsletterNotSent(Exception):
+    pass
+
+
+@task(max_attempts=3)
+def send_newsletter(blog_id):
+    """Mail subscribers about a newly published blog.
+
+    Failed recipients are retried with the job; the delivery ledger makes
+    the retry skip everyone already reached.
+    """
+    blog = Blog.objects.filter(pk=blog_id, status='published').first()
+    if blog is None:
+        return
+    result = NewsletterSubscriber.dispatch_newsletter(blog)
+    if result.failed:
+        raise NewsletterNotSent(f'{result.failed} of {result.sent + result.failed} newsletter messages failed')
+
+
+@task(max_attempts=3)
+def send_digest(digest_id):
+    """Mail a daily or weekly digest to its subscribers."""
+    digest = NewsletterDigest.objects.filter(pk=digest_id, sent_at__isnull=True).first()
+    if digest is None:
+        return
+    result = digest.dispatch()
+    if result.failed:
+        raise NewsletterNotSent(f'{result.failed} of {result.sent + result.failed} digest messages failed')
@@ -1,3 +1,760 @@
-from django.test import TestCase
+import html
+import io
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from blog_system.testing import EndpointPerformanceTestCase, expand_cases, seed_performance_data
+from . import audience, lookup, stats, subscriber_csv
+from .dispatch import Dispatcher
+from .scheduling import DomainLimits, DomainScheduler
+from blogs.models import Blog
+from jobs.models import Job
+from .serializers import NewsletterBulkActionSerializer
+from .models import (
+    NewsletterAudienceSegment, NewsletterDailyStats, NewsletterDelivery, NewsletterDigest, NewsletterSubscriber,
+)
+from .rendering import CompiledTemplate, Newsletter, Placeholders
+from .smtp_sink import SMTPSink
+
+
+class NewsletterEndpointPerformanceTests(EndpointPerformanceTestCase):
+    """Query-count and serializer-time regression tests for the newsletter API"""
+
+    def get_cases(self):
+        active = self.data['subscribers'][1]
+        blog = self.data['blogs'][0]
+        unsubscribe_token = NewsletterSubscriber.unsubscribe_token(self.data['subscribers'][2].id)
+        subscriber_ids = [subscriber.id for subscriber in self.data['subscribers'][:10]]
+        expected = {
+            # name: method, path, data, {role: (status, queries)}
+            'newsletter:subscribe': ('POST', '/api/newsletter/subscribe/', {'email': 'new.reader@perf.test'}, {
+                'anonymous': (201, 9), 'viewer': (201, 9), 'editor': (201, 9), 'admin': (201, 9),
+            }),
+            'newsletter:unsubscribe': ('POST', '/api/newsletter/unsubscribe/', {'email': active.email}, {
+                'anonymous': (200, 4), 'viewer': (200, 4), 'editor': (200, 4), 'admin': (200, 4),
+            }),
+            'newsletter:one-click-unsubscribe': ('POST', f'/api/newsletter/unsubscribe/{unsubscribe_token}/', {
+                'List-Unsubscribe': 'One-Click',
+            }, {
+                'anonymous': (200, 3), 'viewer': (200, 3), 'editor': (200, 3), 'admin': (200, 3),
+            }),
+            'newsletter:check-subscription': ('GET', f'/api/newsletter/check-subscription/?email={active.email}', None, {
+                'anonymous': (200, 1), 'viewer': (200, 1), 'editor': (200, 1), 'admin': (200, 1),
+            }),
+            'newsletter:subscriber-list': ('GET', '/api/newsletter/subscribers/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 4),
+            }),
+            'newsletter:subscriber-detail': ('GET', f'/api/newsletter/subscribers/{active.pk}/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 3),
+            }),
+            'newsletter:subscriber-detail (update)': ('PATCH', f'/api/newsletter/subscribers/{active.pk}/', {
+                'is_active': False,
+            }, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 7),
+            }),
+            'newsletter:subscriber-detail (delete)': ('DELETE', f'/api/newsletter/subscribers/{active.pk}/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (204, 8),
+            }),
+            'newsletter:bulk-action': ('POST', '/api/newsletter/bulk-action/', {
+                'action': 'deactivate', 'subscriber_ids': subscriber_ids,
+            }, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 6),
+            }),
+            'newsletter:newsletter-stats': ('GET', '/api/newsletter/stats/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 1),
+            }),
+            'newsletter:growth-stats': ('GET', '/api/newsletter/stats/growth/?period=week', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 1),
+            }),
+            'newsletter:cohort-stats': ('GET', '/api/newsletter/stats/cohorts/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 1),
+            }),
+            'newsletter:delivery-stats': ('GET', f'/api/newsletter/stats/deliveries/{blog.slug}/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 5),
+            }),
+        }
+        return expand_cases(expected)
+
+
+class NewsletterDispatchTests(TestCase):
+    """Tests for per-recipient newsletter delivery"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def test_every_subscriber_gets_their_own_message(self):
+        blog = self.data['blogs'][0]
+        active = set(NewsletterSubscriber.objects.filter(is_active=True).values_list('email', flat=True))
+
+        self.assertTrue(NewsletterSubscriber.send_newsletter(blog))
+        self.assertEqual(len(mail.outbox), len(active))
+        self.assertEqual({address for message in mail.outbox for address in message.to}, active)
+        self.assertTrue(all(len(message.recipients()) == 1 for message in mail.outbox))
+        self.assertIn(blog.title, mail.outbox[0].subject)
+
+    def test_nobody_to_send_to(self):
+        NewsletterSubscriber.objects.update(is_active=False)
+        self.assertIsNone(NewsletterSubscriber.send_newsletter(self.data['blogs'][0]))
+        self.assertEqual(mail.outbox, [])
+
+    def test_smtp_failures_are_isolated_and_connections_reused(self):
+        recipients = [f'reader{index}@smtp.test' for index in range(25)]
+        with SMTPSink(reject={'reader7@smtp.test'}) as sink:
+            dispatcher = Dispatcher(
+                connections=3, chunk_size=4, backend='django.core.mail.backends.smtp.EmailBackend',
+                host=sink.host, port=sink.port, use_tls=False, use_ssl=False, username='', password='',
+            )
+            result = dispatcher.send('Subject', 'Text', '<p>Text</p>', iter(recipients), from_email='news@test')
+
+        self.assertEqual((result.sent, result.failed), (24, 1))
+        self.assertLessEqual(sink.connections, 3)
+        self.assertEqual(sorted(rcpt for _, (rcpt,), _ in sink.messages),
+                         sorted(set(recipients) - {'reader7@smtp.test'}))
+
+    def test_deliveries_are_recorded_and_never_repeated(self):
+        blog = self.data['blogs'][0]
+        # Neither a digest subscriber nor one who only wants other categories is pending
+        digest, elsewhere = NewsletterSubscriber.objects.filter(is_active=True).order_by('-id')[:2]
+        NewsletterSubscriber.objects.filter(pk=digest.pk).update(digest_frequency='daily')
+        elsewhere.categories.add(next(category for category in self.data['categories']
+                                      if category.id != blog.category_id))
+        active = list(NewsletterSubscriber.objects.filter(is_active=True).exclude(pk__in=[digest.pk, elsewhere.pk])
+                      .order_by('id'))
+        # An earlier send reached the first ten before it was interrupted
+        NewsletterDelivery.record([([blog], subscriber.id, None) for subscriber in active[:10]])
+
+        self.assertTrue(NewsletterSubscriber.send_newsletter(blog))
+        self.assertEqual({message.to[0] for message in mail.outbox}, {subscriber.email for subscriber in active[10:]})
+        self.assertEqual(NewsletterDelivery.stats(blog), {'sent': len(active), 'failed': 0, 'pending': 0})
+
+        # Publishing the post again mails nobody
+        self.assertIsNone(NewsletterSubscriber.send_newsletter(blog))
+        self.assertEqual(len(mail.outbox), len(active) - 10)
+
+    def test_failed_recipients_are_retried_alone(self):
+        blog = self.data['blogs'][0]
+        active = list(NewsletterSubscriber.objects.filter(is_active=True).order_by('id'))
+        refused = active[3].email
+        with SMTPSink(reject={refused}) as sink:
+            smtp = override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST=sink.host,
+                EMAIL_PORT=sink.port, EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+            )
+            with smtp, self.assertLogs('newsletter.models', 'WARNING') as logs:
+                self.assertFalse(NewsletterSubscriber.send_newsletter(blog))
+            self.assertIn('to 1 of', logs.output[0])
+            delivery = NewsletterDelivery.objects.get(blog=blog, status='failed')
+            self.assertEqual(delivery.subscriber, active[3])
+            self.assertIn('550', delivery.error)
+            self.assertEqual(NewsletterDelivery.stats(blog), {'sent': len(active) - 1, 'failed': 1, 'pending': 1})
+
+            sink.reject.clear()
+            with smtp:
+                self.assertTrue(NewsletterSubscriber.send_newsletter(blog))
+
+        self.assertEqual(sorted(rcpt for _, (rcpt,), _ in sink.messages), sorted(s.email for s in active))
+        self.assertEqual(NewsletterDelivery.stats(blog), {'sent': len(active), 'failed': 0, 'pending': 0})
+
+
+class NewsletterDigestTests(TestCase):
+    """Tests for daily and weekly digests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+        active = list(NewsletterSubscriber.objects.filter(is_active=True).order_by('id'))
+        cls.daily = active[:12]
+        NewsletterSubscriber.objects.filter(id__in=[s.id for s in cls.daily]).update(digest_frequency='daily')
+        cls.immediate = active[12:]
+
+    def publish_yesterday(self, blogs):
+        yesterday = NewsletterDigest.last_period('daily')[0] + timedelta(hours=9)
+        Blog.objects.exclude(id__in=[blog.id for blog in blogs]).update(published_at=yesterday - timedelta(days=3))
+        Blog.objects.filter(id__in=[blog.id for blog in blogs]).update(published_at=yesterday)
+
+    def test_periods_end_at_midnight_and_on_mondays(self):
+        wednesday = datetime(2026, 10, 21, 15, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(NewsletterDigest.last_period('daily', wednesday),
+                         (datetime(2026, 10, 20, tzinfo=dt_timezone.utc), datetime(2026, 10, 21, tzinfo=dt_timezone.utc)))
+        self.assertEqual(NewsletterDigest.last_period('weekly', wednesday),
+                         (datetime(2026, 10, 12, tzinfo=dt_timezone.utc), datetime(2026, 10, 19, tzinfo=dt_timezone.utc)))
+
+    def test_posts_go_only_to_immediate_subscribers(self):
+        self.assertTrue(NewsletterSubscriber.send_newsletter(self.data['blogs'][0]))
+        self.assertEqual({message.to[0] for message in mail.outbox}, {s.email for s in self.immediate})
+
+    def test_digest_mails_each_subscriber_once_for_all_posts(self):
+        blogs = self.data['blogs'][:3]
+        self.publish_yesterday(blogs)
+
+        digest = NewsletterDigest.build('daily')
+        self.assertEqual(NewsletterDigest.build('daily'), digest)
+        # Posts, their tags and audiences, recipients, one delivery upsert
+        # and the digest itself
+        with self.assertNumQueries(6):
+            result = digest.dispatch()
+
+        self.assertEqual((result.sent, result.failed), (len(self.daily), 0))
+        self.assertEqual({message.to[0] for message in mail.outbox}, {s.email for s in self.daily})
+        for blog in blogs:
+            self.assertIn(blog.title, mail.outbox[0].body)
+            self.assertEqual(NewsletterDelivery.objects.filter(blog=blog, status='sent').count(), len(self.daily))
+        digest.refresh_from_db()
+        self.assertIsNotNone(digest.sent_at)
+
+        # Sending again reaches nobody
+        self.assertEqual(digest.dispatch().sent, 0)
+
+    def test_command_queues_due_digests(self):
+        self.publish_yesterday(self.data['blogs'][:2])
+        output = StringIO()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('send_newsletter_digests', frequency=['daily'], stdout=output)
+
+        digest = NewsletterDigest.objects.get()
+        self.assertIn('queued', output.getvalue())
+        self.assertEqual(digest.blogs.count(), 2)
+        self.assertEqual(Job.objects.get().kwargs, {'digest_id': digest.id})
+
+
+class NewsletterPersonalizationTests(APITestCase):
+    """Tests for precompiled templates and one-click unsubscribe links"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def test_compiled_templates_splice_escaped_fields(self):
+        recipient = Placeholders()
+        rendered = f'<p>Hi {recipient.name}, {{braces}} stay</p><a href="{recipient.unsubscribe_url}">x</a>'
+        compiled = CompiledTemplate(rendered, recipient, escape=html.escape)
+
+        self.assertEqual(compiled.fields, {'name', 'unsubscribe_url'})
+        self.assertEqual(
+            compiled.render({'name': '<Ann & Bo>', 'unsubscribe_url': 'http://x/?a=1&b="2"', 'email': 'unused'}),
+            '<p>Hi &lt;Ann &amp; Bo&gt;, {braces} stay</p><a href="http://x/?a=1&amp;b=&quot;2&quot;">x</a>',
+        )
+        with self.assertRaises(AttributeError):
+            Placeholders().password
+
+    def test_content_cannot_forge_slots(self):
+        blog = self.data['blogs'][0]
+        blog.title = 'Hi \x1fpwn\x1f and \x1femail\x1f'
+        newsletter = Newsletter('post', {'blog_post': blog, 'frontend_url': 'http://localhost:3000'})
+
+        text, html_part = newsletter.render({'name': 'Ada', 'email': 'ada@example.com', 'unsubscribe_url': 'http://x/'})
+        self.assertIn(blog.title, text)
+        # Only the footer's own slot
+        self.assertEqual(text.count('ada@example.com'), 1)
+        self.assertEqual(html_part.count('ada@example.com'), 1)
+
+    def test_each_message_carries_its_own_unsubscribe_link(self):
+        subscriber = NewsletterSubscriber.objects.filter(is_active=True).order_by('id').first()
+        subscriber.name = 'Ada'
+        subscriber.save()
+        blog = self.data['blogs'][0]
+
+        self.assertTrue(NewsletterSubscriber.send_newsletter(blog))
+
+        message = next(message for message in mail.outbox if message.to == [subscriber.email])
+        url = NewsletterSubscriber.unsubscribe_url(subscriber.id)
+        html_part = message.alternatives[0][0]
+        self.assertIn('Hi Ada,', message.body)
+        self.assertIn(blog.title, html_part)
+        self.assertIn(url, message.body)
+        self.assertIn(f'href="{url}"', html_part)
+        self.assertEqual(message.extra_headers['List-Unsubscribe'], f'<{url}>')
+        self.assertEqual(len({m.extra_headers['List-Unsubscribe'] for m in mail.outbox}), len(mail.outbox))
+        self.assertIn('Hi there,', next(m for m in mail.outbox if m.to != [subscriber.email]).body)
+
+        path = url.split('localhost:8000', 1)[1]
+        self.assertEqual(self.client.get(path).data, {'email': subscriber.email, 'subscribed': True})
+        self.assertEqual(self.client.post(path, {'List-Unsubscribe': 'One-Click'}).data['subscribed'], False)
+        self.assertFalse(NewsletterSubscriber.objects.get(pk=subscriber.pk).is_active)
+
+    def test_forged_unsubscribe_tokens_are_rejected(self):
+        subscriber = self.data['subscribers'][1]
+        token = NewsletterSubscriber.unsubscribe_token(subscriber.id)
+        forged = f'{subscriber.id + 1}:{token.split(":", 1)[1]}'
+
+        self.assertEqual(self.client.post(f'/api/newsletter/unsubscribe/{forged}/').status_code, 404)
+        self.assertTrue(NewsletterSubscriber.objects.get(pk=subscriber.id + 1).is_active)
+
+
+class NewsletterAudienceTests(APITestCase):
+    """Tests for category and tag subscriptions and their audience bitsets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+        cls.engineering, cls.design, cls.culture = cls.data['categories']
+        cls.python, cls.django, cls.performance = cls.data['tags'][:3]
+        cls.readers = list(NewsletterSubscriber.objects.filter(is_active=True).order_by('id')[:3])
+
+    def audience(self, key):
+        return set(audience.load([key])[key])
+
+    def stored_audiences(self):
+        return audience.load(set(NewsletterAudienceSegment.objects.values_list('key', flat=True)))
+
+    def test_bitset_operations(self):
+        bits = audience.Bitset.of([0, 3, 9, 4000])
+        self.assertEqual(list(bits), [0, 3, 9, 4000])
+        self.assertEqual(len(bits), 4)
+        self.assertIn(4000, bits)
+        self.assertNotIn(4, bits)
+        self.assertNotIn(10 ** 6, bits)
+        self.assertEqual(audience.Bitset.decode(bits.encode()), bits)
+        self.assertEqual(list(bits | audience.Bitset.of([5])), [0, 3, 5, 9, 4000])
+        self.assertEqual(list(bits & audience.Bitset.of([3, 5])), [3])
+        self.assertEqual(list(bits - audience.Bitset.of([3, 5])), [0, 9, 4000])
+        self.assertEqual(list(bits.batches(3)), [[0, 3, 9], [4000]])
+        self.assertEqual(list(audience.Bitset()), [])
+
+    def test_preferences_move_subscribers_between_audiences(self):
+        first, second, _ = self.readers
+        everyone = set(NewsletterSubscriber.objects.values_list('id', flat=True))
+        self.assertEqual(self.audience(audience.ALL), everyone)
+
+        first.categories.add(self.engineering)
+        self.design.newsletter_subscribers.add(first, second)
+        second.tags.add(self.python)
+        self.assertEqual(self.audience(audience.category_key(self.engineering.id)), {first.id})
+        self.assertEqual(self.audience(audience.category_key(self.design.id)), {first.id, second.id})
+        self.assertEqual(self.audience(audience.tag_key(self.python.id)), {second.id})
+        self.assertEqual(self.audience(audience.ALL), everyone - {first.id, second.id})
+
+        self.design.newsletter_subscribers.clear()
+        second.tags.remove(self.python)
+        self.assertEqual(self.audience(audience.category_key(self.design.id)), set())
+        self.assertEqual(self.audience(audience.ALL), everyone - {first.id})
+
+        first.categories.clear()
+        self.assertEqual(self.audience(audience.ALL), everyone)
+
+    @mock.patch('newsletter.audience.SEGMENT_BITS', 8)
+    def test_bitsets_are_stored_in_segments(self):
+        first, second, _ = self.readers
+        audience.rebuild()
+        everyone = set(NewsletterSubscriber.objects.values_list('id', flat=True))
+        self.assertEqual(self.audience(audience.ALL), everyone)
+        self.assertEqual(
+            set(NewsletterAudienceSegment.objects.filter(key=audience.ALL).values_list('segment', flat=True)),
+            {subscriber_id // 8 for subscriber_id in everyone},
+        )
+
+        # A change rewrites only the segments of the subscribers it touches
+        untouched = dict(NewsletterAudienceSegment.objects.exclude(segment=first.id // 8).values_list('id', 'bits'))
+        first.categories.add(self.design)
+        self.assertEqual(self.audience(audience.ALL), everyone - {first.id})
+        self.assertEqual(
+            {row_id: bytes(bits) for row_id, bits in NewsletterAudienceSegment.objects.filter(id__in=untouched)
+             .values_list('id', 'bits')},
+            {row_id: bytes(bits) for row_id, bits in untouched.items()},
+        )
+
+        second.tags.add(self.python)
+        self.assertEqual(self.audience(audience.tag_key(self.python.id)), {second.id})
+
+    def test_deleting_a_category_returns_its_subscribers_to_all(self):
+        first = self.readers[0]
+        first.categories.add(self.culture)
+        self.culture.delete()
+
+        self.assertFalse(NewsletterAudienceSegment.objects.filter(key=audience.category_key(self.culture.id)).exists())
+        self.assertIn(first.id, self.audience(audience.ALL))
+
+    def test_subscribing_with_preferences(self):
+        response = self.client.post('/api/newsletter/subscribe/', {
+            'email': 'picky@perf.test', 'categories': [self.design.slug], 'tags': [self.python.slug],
+        })
+        self.assertEqual(response.status_code, 201)
+
+        subscriber = NewsletterSubscriber.objects.get(email='picky@perf.test')
+        self.assertEqual(list(subscriber.categories.all()), [self.design])
+        self.assertNotIn(subscriber.id, self.audience(audience.ALL))
+        self.assertIn(subscriber.id, self.audience(audience.tag_key(self.python.id)))
+
+    def test_posts_go_to_the_subscribers_who_want_them(self):
+        first, second, third = self.readers
+        first.categories.add(self.design)
+        second.tags.add(self.python)
+        third.categories.add(self.culture)
+        blog = self.data['blogs'][0]  # Engineering, tagged python and django
+
+        self.assertTrue(NewsletterSubscriber.send_newsletter(blog))
+
+        recipients = {message.to[0] for message in mail.outbox}
+        self.assertIn(second.email, recipients)
+        self.assertNotIn(first.email, recipients)
+        self.assertNotIn(third.email, recipients)
+        self.assertEqual(len(recipients), 24 - 2)
+
+    def test_digests_carry_only_the_wanted_posts(self):
+        first = self.readers[0]
+        first.categories.add(self.design)
+        NewsletterSubscriber.objects.filter(pk=first.pk).update(digest_frequency='daily')
+        blogs = self.data['blogs'][:3]
+        yesterday = NewsletterDigest.last_period('daily')[0] + timedelta(hours=9)
+        Blog.objects.exclude(id__in=[blog.id for blog in blogs]).update(published_at=yesterday - timedelta(days=3))
+        Blog.objects.filter(id__in=[blog.id for blog in blogs]).update(published_at=yesterday)
+
+        result = NewsletterDigest.build('daily').dispatch()
+
+        self.assertEqual(result.sent, 1)
+        message = mail.outbox[0]
+        self.assertIn('1 new post', message.subject)
+        self.assertIn(blogs[1].title, message.body)
+        self.assertNotIn(blogs[0].title, message.body)
+        self.assertEqual(list(NewsletterDelivery.objects.values_list('blog_id', flat=True)), [blogs[1].id])
+
+    def test_rebuild_matches_the_incremental_bitsets(self):
+        first, second, _ = self.readers
+        first.categories.add(self.engineering, self.design)
+        second.tags.add(self.django, self.performance)
+        incremental = self.stored_audiences()
+        output = StringIO()
+
+        call_command('rebuild_newsletter_audiences', stdout=output)
+
+        self.assertEqual({key: bits for key, bits in incremental.items() if bits.bits}, self.stored_audiences())
+        self.assertIn('Rebuilt 5 audience bitsets', output.getvalue())
+
+
+class NewsletterBulkAndCsvTests(APITestCase):
+    """Tests for set-based bulk actions and CSV import/export"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def setUp(self):
+        self.client.force_authenticate(self.data['users']['admin'])
+
+    def upload(self, content, **kwargs):
+        return self.client.post('/api/newsletter/subscribers/import/', {
+            'file': SimpleUploadedFile('subscribers.csv', content.encode(), content_type='text/csv'),
+        }, format='multipart', **kwargs)
+
+    def test_bulk_actions_are_single_updates(self):
+        subscribers = self.data['subscribers'][:10]
+        ids = [subscriber.id for subscriber in subscribers]
+        serializer = NewsletterBulkActionSerializer(data={'action': 'activate', 'subscriber_ids': ids + ids[:2]})
+        # One count to validate; the changing rows are locked, updated in
+        # one UPDATE and rolled up, within a savepoint
+        with self.assertNumQueries(6):
+            self.assertTrue(serializer.is_valid())
+            self.assertEqual(serializer.save(), 2)
+        self.assertEqual(NewsletterSubscriber.objects.filter(id__in=ids, is_active=True).count(), 10)
+
+        response = self.client.post('/api/newsletter/bulk-action/', {
+            'action': 'deactivate', 'subscriber_ids': ids,
+        }, format='json')
+        self.assertEqual(response.data['affected_count'], 10)
+        self.assertFalse(NewsletterSubscriber.objects.filter(id__in=ids, unsubscribed_at=None).exists())
+
+        response = self.client.post('/api/newsletter/bulk-action/', {
+            'action': 'delete', 'subscriber_ids': ids[:3],
+        }, format='json')
+        self.assertEqual(response.data['affected_count'], 3)
+
+    def test_import_normalizes_and_upserts_in_batches(self):
+        existing = self.data['subscribers'][0]  # inactive
+        content = (
+            'email,name,digest_frequency\r\n'
+            f'  {existing.email.upper()} ,Returning Reader,weekly\r\n'
+            ' New.Reader@Example.com,New Reader,\r\n'
+            'not-an-email,Nobody,daily\r\n'
+            'other@example.com,Other,hourly\r\n'
+            'new.reader@example.com,New Reader Again,daily\r\n'
+        )
+        result = subscriber_csv.import_csv(io.BytesIO(content.encode()), batch_size=2)
+
+        # The repeated email was upserted again in the second batch
+        self.assertEqual((result.imported, result.invalid), (3, 2))
+        self.assertEqual([error['line'] for error in result.errors], [4, 5])
+
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.digest_frequency, existing.is_active),
+                         ('Returning Reader', 'weekly', False))
+        new = NewsletterSubscriber.objects.get(email='new.reader@example.com')
+        self.assertEqual((new.name, new.digest_frequency, new.is_active), ('New Reader Again', 'daily', True))
+        self.assertIn(new.id, audience.load([audience.ALL])[audience.ALL])
+
+    def test_import_of_emails_only_keeps_existing_details(self):
+        existing = self.data['subscribers'][1]
+        NewsletterSubscriber.objects.filter(pk=existing.pk).update(name='Kept')
+
+        response = self.upload(f'email\n{existing.email}\nfresh@example.com\n')
+
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(NewsletterSubscriber.objects.get(pk=existing.pk).name, 'Kept')
+        self.assertTrue(NewsletterSubscriber.objects.filter(email='fresh@example.com').exists())
+        self.assertEqual(self.upload('name\nNobody\n').status_code, 400)
+
+    def test_export_streams_the_filtered_list(self):
+        response = self.client.get('/api/newsletter/subscribers/export/?is_active=true')
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'email,name,is_active,digest_frequency,subscription_date,unsubscribed_at')
+        self.assertEqual(len(lines), 1 + 24)
+        self.assertTrue(lines[1].startswith(self.data['subscribers'][1].email + ','))
+
+        self.client.force_authenticate(self.data['users']['editor'])
+        self.assertEqual(self.client.get('/api/newsletter/subscribers/export/').status_code, 403)
+
+
+class DomainSchedulingTests(TestCase):
+    """Tests for per-domain token buckets and concurrency caps"""
+
+    def test_domains_are_interleaved_within_their_limits(self):
+        limits = DomainLimits(rate=20, burst=1, concurrency=0, overrides={'fast.test': {'rate': 0}})
+        scheduler = DomainScheduler(limits)
+        for index in range(3):
+            scheduler.put(f'a{index}@slow.test', f'slow{index}')
+        for index in range(3):
+            scheduler.put(f'b{index}@fast.test', f'fast{index}')
+        scheduler.close()
+
+        released = []
+        while (scheduled := scheduler.get()) is not None:
+            released.append((scheduled[1], time.monotonic()))
+            scheduler.done(scheduled[0])
+        # slow.test gets one message every 50ms; fast.test fills the gaps
+        self.assertEqual([item for item, _ in released], ['slow0', 'fast0', 'fast1', 'fast2', 'slow1', 'slow2'])
+        slow = [at for item, at in released if item.startswith('slow')]
+        self.assertTrue(all(later - earlier >= 0.045 for earlier, later in zip(slow, slow[1:])))
+
+    def test_concurrency_caps_and_deferrals(self):
+        scheduler = DomainScheduler(DomainLimits(rate=0, concurrency=1, overrides={}), backoff=60)
+        for index in range(3):
+            scheduler.put(f'r{index}@busy.test', index)
+        scheduler.put('other@idle.test', 'other')
+
+        first = scheduler.get()
+        # busy.test has a message in flight, so the other domain goes next
+        self.assertEqual(scheduler.get(), ('idle.test', 'other'))
+        self.assertEqual(scheduler.done(first[0], deferred=True), [1, 2])
+        self.assertFalse(scheduler.put('later@busy.test', 3))
+        scheduler.close()
+        self.assertIsNone(scheduler.get())
+
+    def test_sends_respect_domain_rates_against_an_smtp_sink(self):
+        recipients = [f'reader{index}@slow.test' for index in range(6)] + \
+            [f'reader{index}@fast.test' for index in range(30)]
+        limits = DomainLimits(rate=20, burst=1, concurrency=1, overrides={'fast.test': {'rate': 0, 'concurrency': 0}})
+        with SMTPSink(defer={'reader5@slow.test'}) as sink:
+            dispatcher = Dispatcher(
+                connections=3, chunk_size=4, limits=limits, backend='django.core.mail.backends.smtp.EmailBackend',
+                host=sink.host, port=sink.port, use_tls=False, use_ssl=False, username='', password='',
+            )
+            outcomes = []
+            result = dispatcher.send('Subject', 'Text', '<p>Text</p>', iter(recipients), from_email='news@test',
+                                     on_chunk=outcomes.extend)
+
+        self.assertEqual((result.sent, result.failed), (35, 1))
+        self.assertIn('451', dict(outcomes)['reader5@slow.test'])
+        slow = [arrived for address, arrived in sink.arrivals if address.endswith('@slow.test')]
+        fast = [arrived for address, arrived in sink.arrivals if address.endswith('@fast.test')]
+        self.assertEqual(len(slow), 5)
+        # Five messages at 20 a second take 200ms; the first may arrive late,
+        # after its connection was set up
+        self.assertGreaterEqual(slow[-1] - slow[0], 0.14)
+        # Throttling slow.test does not hold fast.test up
+        self.assertLess(max(fast), slow[-1])
+
+
+    def test_recipients_of_a_paused_domain_are_reported_in_chunks(self):
+        recipients = [f'reader{index}@paused.test' for index in range(50)] + ['reader@open.test']
+        put = DomainScheduler.put
+
+        def refuse_paused(scheduler, address, message):
+            return not address.endswith('@paused.test') and put(scheduler, address, message)
+
+        chunks = []
+        with mock.patch.object(DomainScheduler, 'put', refuse_paused):
+            result = Dispatcher(connections=1, chunk_size=4).send(
+                'Subject', 'Text', '<p>Text</p>', iter(recipients), from_email='news@test',
+                on_chunk=lambda chunk: chunks.append(len(chunk)),
+            )
+
+        self.assertEqual((result.sent, result.failed), (1, 50))
+        self.assertEqual(sum(chunks), 51)
+        self.assertLessEqual(max(chunks), 4)
+
+
+class NewsletterGrowthStatsTests(APITestCase):
+    """Tests for the subscriber growth rollups"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+        cls.today = timezone.localdate()
+
+    def setUp(self):
+        self.client.force_authenticate(self.data['users']['admin'])
+
+    def assertInStep(self):
+        stored = set(NewsletterDailyStats.objects.exclude(count=0).values_list('day', 'cohort', 'event', 'count'))
+        self.assertEqual(stored, set(stats.daily_counts(NewsletterSubscriber.objects.all())))
+
+    def test_rollups_follow_every_change(self):
+        self.assertInStep()
+        subscriber = NewsletterSubscriber.objects.filter(is_active=True).first()
+        subscriber.unsubscribe()
+        self.assertInStep()
+        subscriber.resubscribe()
+        self.assertInStep()
+        subscriber.delete()
+        self.assertInStep()
+
+        ids = list(NewsletterSubscriber.objects.values_list('id', flat=True)[:8])
+        NewsletterSubscriber.set_active(ids, False)
+        self.assertInStep()
+        NewsletterSubscriber.set_active(ids[:4], True)
+        self.assertInStep()
+        subscriber_csv.import_csv(io.BytesIO(b'email\nfresh@example.com\nreader1@perf.test\n'))
+        self.assertInStep()
+
+    def test_stats_come_from_the_rollups(self):
+        with self.assertNumQueries(1):
+            totals = stats.totals()
+        self.assertEqual(totals, {'subscribed': 30, 'unsubscribed': 6})
+
+        response = self.client.get('/api/newsletter/stats/')
+        self.assertEqual(response.data, {'total_subscribers': 30, 'active_subscribers': 24, 'inactive_subscribers': 6})
+
+    def test_growth_series_by_day_and_week(self):
+        old = self.data['subscribers'][1]
+        NewsletterSubscriber.objects.filter(pk=old.pk).update(subscription_date=timezone.now() - timedelta(days=10))
+        call_command('rebuild_newsletter_stats', stdout=StringIO())
+        NewsletterSubscriber.objects.get(pk=old.pk).unsubscribe()
+
+        response = self.client.get('/api/newsletter/stats/growth/', {'days': 30})
+        self.assertEqual(response.data[-1], {
+            'period': self.today.isoformat(), 'subscribed': 29, 'unsubscribed': 6 + 1, 'net': 22,
+        })
+        self.assertEqual(response.data[0]['subscribed'], 1)
+
+        weekly = self.client.get('/api/newsletter/stats/growth/', {'period': 'week'}).data
+        monday = self.today - timedelta(days=self.today.weekday())
+        self.assertEqual(weekly[-1]['period'], monday.isoformat())
+        self.assertEqual(sum(row['subscribed'] for row in weekly), 30)
+
+    def test_cohorts_shrink_as_subscribers_leave(self):
+        two_weeks_ago = timezone.now() - timedelta(weeks=2)
+        leavers = [subscriber.id for subscriber in self.data['subscribers'][1:4]]
+        NewsletterSubscriber.objects.filter(id__in=leavers[:2]).update(subscription_date=two_weeks_ago)
+        NewsletterSubscriber.objects.filter(id=leavers[2]).update(
+            subscription_date=two_weeks_ago, is_active=False, unsubscribed_at=two_weeks_ago + timedelta(days=7),
+        )
+        call_command('rebuild_newsletter_stats', stdout=StringIO())
+
+        cohorts = self.client.get('/api/newsletter/stats/cohorts/', {'weeks': 4}).data
+
+        self.assertEqual(cohorts[0]['size'], 3)
+        self.assertEqual(cohorts[0]['retained'], [3, 2, 2])
+        self.assertEqual((cohorts[-1]['size'], cohorts[-1]['retained']), (27, [21]))
+
+    def test_rebuild_command_reports_drift(self):
+        output = StringIO()
+        call_command('rebuild_newsletter_stats', dry_run=True, stdout=output)
+        self.assertIn('in step', output.getvalue())
+
+        NewsletterDailyStats.objects.update(count=0)
+        call_command('rebuild_newsletter_stats', stdout=output)
+        self.assertIn('rebuilt', output.getvalue())
+        self.assertInStep()
+
+
+@override_settings(NEWSLETTER_LOOKUP_SHARED_CACHE=True)
+class SubscriptionLookupTests(APITestCase):
+    """Tests for the Bloom filter behind public subscription checks"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_performance_data()
+
+    def setUp(self):
+        cache.clear()
+
+    def check(self, email):
+        return self.client.get('/api/newsletter/check-subscription/', {'email': email})
+
+    def test_bloom_filter_has_no_false_negatives_and_few_false_positives(self):
+        bloom = lookup.BloomFilter(2000, 0.01)
+        key = lookup.lookup_key()
+        for index in range(2000):
+            bloom.add(lookup.email_digest(f'member{index}@example.com', key))
+
+        self.assertTrue(all(lookup.email_digest(f'member{index}@example.com', key) in bloom for index in range(2000)))
+        false_positives = sum(lookup.email_digest(f'other{index}@example.com', key) in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertFalse(bloom.full)
+
+    def test_unknown_emails_cost_no_query(self):
+        lookup.get_lookup_filter()
+        with self.assertNumQueries(0):
+            response = self.check('stranger@example.com')
+        self.assertEqual(response.data, {'subscribed': False, 'subscription_date': None})
+
+        subscriber = self.data['subscribers'][1]
+        with self.assertNumQueries(1):
+            self.assertTrue(self.check(subscriber.email.upper()).data['subscribed'])
+        # The answer is cached
+        with self.assertNumQueries(0):
+            self.assertTrue(self.check(subscriber.email).data['subscribed'])
+
+    def test_subscribing_and_unsubscribing_refresh_the_filter(self):
+        lookup.get_lookup_filter()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/newsletter/subscribe/', {'email': 'new.reader@example.com'})
+        # Replayed from the log rather than rebuilt
+        with self.assertNumQueries(1):
+            self.assertTrue(self.check('new.reader@example.com').data['subscribed'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/newsletter/unsubscribe/', {'email': 'new.reader@example.com'})
+        self.assertFalse(self.check('new.reader@example.com').data['subscribed'])
+
+        ids = [subscriber.id for subscriber in self.data['subscribers'][:2]]  # the first is inactive
+        with self.captureOnCommitCallbacks(execute=True):
+            NewsletterSubscriber.set_active(ids, True)
+        self.assertTrue(self.check(self.data['subscribers'][0].email).data['subscribed'])
+
+    def test_a_lost_log_rebuilds_the_filter(self):
+        lookup.get_lookup_filter()
+        NewsletterSubscriber.objects.create(email='quiet@example.com')
+        cache.clear()
+
+        self.assertTrue(self.check('quiet@example.com').data['subscribed'])
+
+    @override_settings(NEWSLETTER_LOOKUP_SHARED_CACHE=False)
+    def test_a_local_cache_falls_back_to_the_database(self):
+        lookup.get_lookup_filter()
+        # Subscribed through another process, whose log this one cannot see
+        NewsletterSubscriber.objects.create(email='elsewhere@example.com')
+
+        with self.assertNumQueries(1):
+            self.assertTrue(self.check('elsewhere@example.com').data['subscribed'])
+        with self.assertNumQueries(1):
+            self.assertFalse(self.check('stranger@example.com').data['subscribed'])
+
+    def test_checks_are_rate_limited_per_ip(self):
+        for _ in range(30):
+            self.assertEqual(self.check('stranger@example.com').status_code, 200)
+        self.assertEqual(self.check('stranger@example.com').status_code, 403)
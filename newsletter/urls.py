@@ -7,13 +7,19 @@ urlpatterns = [
     # Subscription endpoints
     path('subscribe/', views.NewsletterSubscribeView.as_view(), name='subscribe'),
     path('unsubscribe/', views.NewsletterUnsubscribeView.as_view(), name='unsubscribe'),
+    path('unsubscribe/<str:token>/', views.newsletter_one_click_unsubscribe, name='one-click-unsubscribe'),
     path('check-subscription/', views.newsletter_check_subscription, name='check-subscription'),
     
     # Admin endpoints
     path('subscribers/', views.NewsletterSubscriberListView.as_view(), name='subscriber-list'),
+    path('subscribers/export/', views.NewsletterSubscriberExportView.as_view(), name='subscriber-export'),
+    path('subscribers/import/', views.NewsletterSubscriberImportView.as_view(), name='subscriber-import'),
     path('subscribers/<int:pk>/', views.NewsletterSubscriberDetailView.as_view(), name='subscriber-detail'),
     path('bulk-action/', views.NewsletterBulkActionView.as_view(), name='bulk-action'),
     
     # Statistics endpoints
     path('stats/', views.newsletter_stats, name='newsletter-stats'),
+    path('stats/growth/', views.newsletter_growth_stats, name='growth-stats'),
+    path('stats/cohorts/', views.newsletter_cohort_stats, name='cohort-stats'),
+    path('stats/deliveries/<slug:slug>/', views.newsletter_delivery_stats, name='delivery-stats'),
 ]
\ No newline at end of file
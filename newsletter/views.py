@@ -1,20 +1,32 @@
+import csv
+
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_ratelimit.decorators import ratelimit
 from django.utils.decorators import method_decorator
-from .models import NewsletterSubscriber
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from blogs.models import Blog
+from . import lookup, stats, subscriber_csv
+from .models import NewsletterDelivery, NewsletterSubscriber
 from .serializers import (
     NewsletterSubscribeSerializer,
     NewsletterUnsubscribeSerializer,
     NewsletterSubscriberSerializer,
-    NewsletterBulkActionSerializer
+    NewsletterBulkActionSerializer,
+    NewsletterImportSerializer
 )
 from users.permissions import IsAdminUser
 
 
+MAX_STATS_DAYS = 366
+MAX_COHORT_WEEKS = 52
+
+
 class NewsletterSubscribeView(generics.CreateAPIView):
     """Subscribe to newsletter"""
     serializer_class = NewsletterSubscribeSerializer
@@ -54,19 +66,54 @@ class NewsletterUnsubscribeView(generics.GenericAPIView):
 
 class NewsletterSubscriberListView(generics.ListAPIView):
     """List all newsletter subscribers (Admin only)"""
-    queryset = NewsletterSubscriber.objects.all().order_by('-subscription_date')
+    queryset = NewsletterSubscriber.objects.prefetch_related('categories', 'tags').order_by('-subscription_date')
     serializer_class = NewsletterSubscriberSerializer
     permission_classes = [IsAdminUser]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     search_fields = ['email']
-    filterset_fields = ['is_active']
+    filterset_fields = ['is_active', 'digest_frequency']
     ordering_fields = ['subscription_date', 'email']
     ordering = ['-subscription_date']
 
 
+class NewsletterSubscriberExportView(NewsletterSubscriberListView):
+    """Stream the subscriber list as CSV, with the filters of the list (Admin only)"""
+    queryset = NewsletterSubscriber.objects.order_by('id')
+    ordering = ['id']
+    pagination_class = None
+    
+    def get(self, request, *args, **kwargs):
+        subscribers = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(subscriber_csv.export_rows(subscribers), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="newsletter-subscribers.csv"'
+        return response
+
+
+class NewsletterSubscriberImportView(generics.GenericAPIView):
+    """Subscribe the emails of an uploaded CSV file (Admin only)"""
+    serializer_class = NewsletterImportSerializer
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+    
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = subscriber_csv.import_csv(serializer.validated_data['file'])
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return Response({
+                'error': f'Could not read the CSV file: {e}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'imported': result.imported,
+            'invalid': result.invalid,
+            'errors': result.errors
+        }, status=status.HTTP_200_OK)
+
+
 class NewsletterSubscriberDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update or delete a newsletter subscriber (Admin only)"""
-    queryset = NewsletterSubscriber.objects.all()
+    queryset = NewsletterSubscriber.objects.prefetch_related('categories', 'tags')
     serializer_class = NewsletterSubscriberSerializer
     permission_classes = [IsAdminUser]
 
@@ -80,19 +127,19 @@ class NewsletterBulkActionView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             action = serializer.validated_data['action']
-            subscriber_ids = serializer.validated_data['subscriber_ids']
             
             try:
-                subscribers = serializer.save()
+                # Subscribers already in the requested state are not counted
+                affected_count = serializer.save()
                 
                 if action == 'delete':
-                    message = f'Successfully deleted {len(subscriber_ids)} subscribers.'
+                    message = f'Successfully deleted {affected_count} subscribers.'
                 else:
-                    message = f'Successfully {action}d {len(subscriber_ids)} subscribers.'
+                    message = f'Successfully {action}d {affected_count} subscribers.'
                 
                 return Response({
                     'message': message,
-                    'affected_count': len(subscriber_ids)
+                    'affected_count': affected_count
                 }, status=status.HTTP_200_OK)
             
             except Exception as e:
@@ -106,22 +153,82 @@ class NewsletterBulkActionView(generics.GenericAPIView):
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def newsletter_stats(request):
-    """Get newsletter statistics (Admin only)"""
-    total_subscribers = NewsletterSubscriber.objects.count()
-    active_subscribers = NewsletterSubscriber.objects.filter(is_active=True).count()
-    inactive_subscribers = NewsletterSubscriber.objects.filter(is_active=False).count()
+    """Get newsletter statistics (Admin only)
+    
+    Totals come from the growth rollups in a single query.
+    """
+    totals = stats.totals()
     
     return Response({
-        'total_subscribers': total_subscribers,
-        'active_subscribers': active_subscribers,
-        'inactive_subscribers': inactive_subscribers
+        'total_subscribers': totals['subscribed'],
+        'active_subscribers': totals['subscribed'] - totals['unsubscribed'],
+        'inactive_subscribers': totals['unsubscribed']
+    })
+
+
+def bounded_param(request, name, default, maximum):
+    try:
+        return min(max(int(request.query_params.get(name, default)), 1), maximum)
+    except ValueError:
+        return default
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def newsletter_growth_stats(request):
+    """Subscriptions and unsubscriptions per day or week, from the rollups (Admin only)
+    
+    Query parameters: ``days`` (default 30) and ``period`` (``day`` or ``week``).
+    """
+    period = 'week' if request.query_params.get('period') == 'week' else 'day'
+    return Response(stats.series(bounded_param(request, 'days', 30, MAX_STATS_DAYS), period))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def newsletter_cohort_stats(request):
+    """Retention of the weekly subscriber cohorts, from the rollups (Admin only)
+    
+    Query parameter: ``weeks`` (default 12).
+    """
+    return Response(stats.cohorts(bounded_param(request, 'weeks', 12, MAX_COHORT_WEEKS)))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def newsletter_delivery_stats(request, slug):
+    """Get newsletter delivery statistics of a blog (Admin only)"""
+    blog = get_object_or_404(Blog.objects.only('id', 'slug', 'category'), slug=slug)
+    return Response({'blog': blog.slug, **NewsletterDelivery.stats(blog)})
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.AllowAny])
+def newsletter_one_click_unsubscribe(request, token):
+    """Unsubscribe with the signed link of a newsletter on POST; GET shows the subscription"""
+    subscriber = NewsletterSubscriber.from_unsubscribe_token(token)
+    if subscriber is None:
+        return Response({
+            'error': 'Invalid unsubscribe link.'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.method == 'POST' and subscriber.is_active:
+        subscriber.unsubscribe()
+    return Response({
+        'email': subscriber.email,
+        'subscribed': subscriber.is_active
     })
 
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
+@ratelimit(key='ip', rate='30/m', method='GET')
 def newsletter_check_subscription(request):
-    """Check if an email is subscribed to newsletter"""
+    """Check if an email is subscribed to newsletter
+    
+    Answered from the in-memory lookup filter: with a shared cache, emails
+    that never subscribed cost no query.
+    """
     email = request.query_params.get('email')
     
     if not email:
@@ -129,14 +236,8 @@ def newsletter_check_subscription(request):
             'error': 'Email parameter is required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    try:
-        subscriber = NewsletterSubscriber.objects.get(email=email.lower())
-        return Response({
-            'subscribed': subscriber.is_active,
-            'subscription_date': subscriber.subscription_date if subscriber.is_active else None
-        })
-    except NewsletterSubscriber.DoesNotExist:
-        return Response({
-            'subscribed': False,
-            'subscription_date': None
-        })
+    subscription_date = lookup.subscription_date(email)
+    return Response({
+        'subscribed': subscription_date is not None,
+        'subscription_date': subscription_date
+    })
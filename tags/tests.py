@@ -1,3 +1,32 @@
-from django.test import TestCase
+from blog_system.testing import EndpointPerformanceTestCase, expand_cases
+from .models import Tag
 
-# Create your tests here.
+
+class TagEndpointPerformanceTests(EndpointPerformanceTestCase):
+    """Query-count and serializer-time regression tests for the tags API"""
+
+    def get_cases(self):
+        used = self.data['tags'][0]
+        unused = Tag.objects.create(name='Unused tag')
+        expected = {
+            # name: method, path, data, {role: (status, queries)}
+            'tags:tag-list-create': ('GET', '/api/tags/', None, {
+                'anonymous': (200, 2), 'viewer': (200, 2), 'editor': (200, 2), 'admin': (200, 2),
+            }),
+            'tags:tag-list-create (create)': ('POST', '/api/tags/', {'name': 'Observability'}, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (201, 3),
+            }),
+            'tags:tag-detail': ('GET', f'/api/tags/{used.slug}/', None, {
+                'anonymous': (200, 1), 'viewer': (200, 1), 'editor': (200, 1), 'admin': (200, 1),
+            }),
+            'tags:tag-detail (update)': ('PATCH', f'/api/tags/{used.slug}/', {'name': 'Renamed'}, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 4),
+            }),
+            'tags:tag-detail (delete in use)': ('DELETE', f'/api/tags/{used.slug}/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (400, 2),
+            }),
+            'tags:tag-detail (delete)': ('DELETE', f'/api/tags/{unused.slug}/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (204, 8),
+            }),
+        }
+        return expand_cases(expected)
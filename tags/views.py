@@ -43,7 +43,7 @@ class TagDetailView(generics.RetrieveUpdateDestroyAPIView):
         tag = self.get_object()
         
         # Check if tag has associated blogs
-        if tag.blog_set.exists():
+        if tag.blogs.exists():
             return Response({
                 'error': 'Cannot delete tag that has associated blogs. Please remove the tag from blogs first.'
             }, status=status.HTTP_400_BAD_REQUEST)
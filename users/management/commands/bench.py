@@ -0,0 +1,347 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import Resolver404, resolve
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from blogs.models import Blog
+from categories.models import Category
+from comments.models import Comment
+from newsletter.models import NewsletterSubscriber
+from tags.models import Tag
+from users.models import User
+
+
+BENCH_USER_AGENT = 'manage.py bench'
+BENCH_TITLE_PREFIX = 'Bench run'
+
+Request = namedtuple('Request', 'method path data role')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Fixtures:
+    """Ids, slugs and tokens the scenarios draw their requests from."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        published = Blog.objects.filter(status='published').order_by('-published_at')
+        self.blog_slugs = list(published.values_list('slug', flat=True)[:500])
+        self.blog_ids = list(published.values_list('id', flat=True)[:500])
+        self.category_slugs = list(Category.objects.values_list('slug', flat=True)[:100])
+        self.category_ids = list(Category.objects.values_list('id', flat=True)[:100])
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True)[:200])
+        self.tag_ids = list(Tag.objects.values_list('id', flat=True)[:200])
+        self.subscriber_emails = list(NewsletterSubscriber.objects.values_list('email', flat=True)[:500])
+        self.pending_comment_ids = list(
+            Comment.objects.filter(status='pending').order_by('id').values_list('id', flat=True)[:500]
+        )
+
+        self.tokens = {}
+        for role in ('Admin', 'Editor', 'Viewer'):
+            users = list(User.objects.filter(role=role, is_active=True)[:20])
+            self.tokens[role.lower()] = [str(RefreshToken.for_user(user).access_token) for user in users]
+
+        if not self.blog_slugs:
+            raise CommandError('No published blogs to benchmark against. Run "manage.py seed_load" first.')
+        if not self.tokens['viewer'] or not self.tokens['editor'] or not self.tokens['admin']:
+            raise CommandError('Benchmarks need at least one Admin, Editor and Viewer user.')
+
+    def blog_slug(self):
+        # Traffic concentrates on recent posts.
+        index = min(int(self.rng.expovariate(1 / 20)), len(self.blog_slugs) - 1)
+        return self.blog_slugs[index]
+
+
+def anonymous_browsing(rng, fixtures, state):
+    roll = rng.random()
+    if roll < 0.25:
+        return Request('GET', f'/api/blogs/?page={rng.randint(1, 3)}', None, 'viewer')
+    if roll < 0.45:
+        return Request('GET', f'/api/blogs/{fixtures.blog_slug()}/', None, 'viewer')
+    if roll < 0.6:
+        return Request('GET', f'/api/comments/blog/{fixtures.blog_slug()}/', None, 'viewer')
+    if roll < 0.7:
+        return Request('GET', '/api/blogs/featured/', None, None)
+    if roll < 0.78:
+        return Request('GET', '/api/categories/', None, None)
+    if roll < 0.84:
+        return Request('GET', '/api/tags/', None, None)
+    if roll < 0.9:
+        return Request('GET', '/api/blogs/stats/', None, None)
+    if roll < 0.95 and fixtures.category_slugs:
+        return Request('GET', f'/api/blogs/?category__slug={rng.choice(fixtures.category_slugs)}', None, 'viewer')
+    return Request('GET', f'/api/blogs/?search={rng.choice(["cache", "query", "python", "deploy"])}', None, 'viewer')
+
+
+def editor_authoring(rng, fixtures, state):
+    created = state.setdefault('created_slugs', [])
+    roll = rng.random()
+    if roll < 0.3 or not created:
+        state['pending_title'] = f'{BENCH_TITLE_PREFIX} {uuid.uuid4().hex[:12]}'
+        return Request('POST', '/api/blogs/create/', {
+            'title': state['pending_title'],
+            'content': '<p>' + 'Benchmark content paragraph with enough words to pass validation. ' * 20 + '</p>',
+            'category_id': rng.choice(fixtures.category_ids),
+            'tag_ids': rng.sample(fixtures.tag_ids, min(3, len(fixtures.tag_ids))),
+            'status': 'draft',
+        }, 'editor')
+    slug = rng.choice(created)
+    if roll < 0.55:
+        return Request('PATCH', f'/api/blogs/{slug}/update/', {'meta_description': f'Revision {rng.random()}'},
+                       'editor')
+    if roll < 0.7:
+        return Request('PATCH', f'/api/blogs/{slug}/publish/', {'status': 'published'}, 'editor')
+    return Request('GET', '/api/blogs/my-blogs/', None, 'editor')
+
+
+def comment_burst(rng, fixtures, state):
+    if rng.random() < 0.7:
+        return Request('POST', f'/api/comments/blog/{fixtures.blog_slug()}/create/', {
+            'blog_id': rng.choice(fixtures.blog_ids[:20]),
+            'content': f'Benchmark comment {uuid.uuid4().hex} with a little extra text.',
+        }, 'viewer')
+    return Request('GET', f'/api/comments/blog/{fixtures.blog_slug()}/', None, 'viewer')
+
+
+def admin_moderation(rng, fixtures, state):
+    roll = rng.random()
+    if roll < 0.35 and fixtures.pending_comment_ids:
+        return Request('PATCH', f'/api/comments/{rng.choice(fixtures.pending_comment_ids)}/moderate/',
+                       {'action': rng.choice(['approve', 'spam', 'pending'])}, 'admin')
+    if roll < 0.6:
+        return Request('GET', '/api/comments/pending/', None, 'admin')
+    if roll < 0.75:
+        return Request('GET', '/api/comments/stats/', None, 'admin')
+    if roll < 0.85:
+        return Request('GET', '/api/newsletter/subscribers/', None, 'admin')
+    if roll < 0.92:
+        return Request('GET', '/api/newsletter/stats/', None, 'admin')
+    return Request('GET', '/api/users/list/', None, 'admin')
+
+
+SCENARIOS = {
+    'anonymous': [(1.0, anonymous_browsing)],
+    'editor': [(1.0, editor_authoring)],
+    'comments': [(1.0, comment_burst)],
+    'moderation': [(1.0, admin_moderation)],
+    'mixed': [(0.7, anonymous_browsing), (0.1, editor_authoring), (0.15, comment_burst), (0.05, admin_moderation)],
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the API in-process through the real URLconf and report per-endpoint latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='mixed')
+        parser.add_argument('--threads', type=int, default=4, help='Number of concurrent client threads')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run for')
+        parser.add_argument('--requests', type=int, default=0, help='Stop after this many requests (0 = no limit)')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per thread before measuring')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+        parser.add_argument('--compare', help='Compare against results previously written with --output')
+        parser.add_argument('--keep-ratelimit', action='store_true', help='Leave django-ratelimit enabled')
+        parser.add_argument('--send-email', action='store_true', help='Use the configured email backend')
+        parser.add_argument('--no-cleanup', action='store_true', help='Keep rows created by the benchmark')
+
+    def handle(self, *args, **options):
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if not options['keep_ratelimit']:
+            overrides['RATELIMIT_ENABLE'] = False
+        if not options['send_email']:
+            overrides['EMAIL_BACKEND'] = 'django.core.mail.backends.locmem.EmailBackend'
+
+        # Server errors are counted per endpoint; their tracebacks would drown the report.
+        request_logger = logging.getLogger('django.request')
+        previous_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        with override_settings(**overrides):
+            fixtures = Fixtures(random.Random(options['seed']))
+            pending_before = list(fixtures.pending_comment_ids)
+            try:
+                samples, elapsed = self.run(fixtures, options)
+            finally:
+                if not options['no_cleanup']:
+                    self.cleanup(pending_before)
+                request_logger.setLevel(previous_level)
+
+        results = self.summarize(samples, elapsed, options)
+        self.report(results)
+
+        if options['compare']:
+            with open(options['compare']) as handle:
+                self.compare(json.load(handle), results)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def run(self, fixtures, options):
+        scenario = SCENARIOS[options['scenario']]
+        weights = [weight for weight, _ in scenario]
+        steps = [step for _, step in scenario]
+        limit = options['requests']
+        issued = [0]
+        lock = threading.Lock()
+        clock = {}
+
+        def start_clock():
+            clock['started'] = time.perf_counter()
+            clock['deadline'] = clock['started'] + options['duration']
+
+        # Warmup is excluded: the clock starts once every thread has warmed up.
+        barrier = threading.Barrier(options['threads'], action=start_clock)
+
+        def worker(worker_id):
+            rng = random.Random(options['seed'] * 1000 + worker_id)
+            client = Client(raise_request_exception=False, HTTP_USER_AGENT=BENCH_USER_AGENT)
+            state = {}
+            samples = []
+            try:
+                for _ in range(options['warmup']):
+                    self.issue(client, rng.choices(steps, weights)[0](rng, fixtures, state), fixtures, rng, state)
+                barrier.wait()
+                while time.perf_counter() < clock['deadline']:
+                    if limit:
+                        with lock:
+                            if issued[0] >= limit:
+                                break
+                            issued[0] += 1
+                    request = rng.choices(steps, weights)[0](rng, fixtures, state)
+                    samples.append(self.issue(client, request, fixtures, rng, state))
+            finally:
+                connection.close()
+            return samples
+
+        self.stdout.write(
+            f'Running "{options["scenario"]}" with {options["threads"]} threads for up to {options["duration"]}s...'
+        )
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            futures = [pool.submit(worker, worker_id) for worker_id in range(options['threads'])]
+            samples = [sample for future in futures for sample in future.result()]
+        return samples, time.perf_counter() - clock['started']
+
+    def issue(self, client, request, fixtures, rng, state):
+        """Send one request and return ``(route, latency_ms, status)``."""
+        extra = {}
+        if request.role:
+            extra['HTTP_AUTHORIZATION'] = f'Bearer {rng.choice(fixtures.tokens[request.role])}'
+        path = request.path.split('?')[0]
+        try:
+            route = resolve(path).view_name
+        except Resolver404:
+            route = path
+
+        started = time.perf_counter()
+        response = client.generic(
+            request.method, request.path,
+            data=json.dumps(request.data) if request.data is not None else '',
+            content_type='application/json', **extra
+        )
+        status = response.status_code
+        latency = (time.perf_counter() - started) * 1000
+
+        if route == 'blogs:blog-create' and status == 201:
+            slug = Blog.objects.filter(title=state.get('pending_title')).values_list('slug', flat=True).first()
+            if slug:
+                state.setdefault('created_slugs', []).append(slug)
+        return route, latency, status
+
+    def cleanup(self, pending_before):
+        """Remove benchmark rows and put moderated comments back in the queue."""
+        Comment.objects.filter(user_agent=BENCH_USER_AGENT).delete()
+        Blog.objects.filter(title__startswith=BENCH_TITLE_PREFIX).delete()
+        if pending_before:
+            # Save each one so that the comment counters follow.
+            for comment in Comment.objects.filter(id__in=pending_before).exclude(status='pending'):
+                comment.status = 'pending'
+                comment.save(update_fields=['status', 'updated_at'])
+
+    def summarize(self, samples, elapsed, options):
+        by_route = defaultdict(list)
+        statuses = defaultdict(lambda: defaultdict(int))
+        for route, latency, status in samples:
+            by_route[route].append(latency)
+            statuses[route][str(status)] += 1
+
+        endpoints = {}
+        for route, latencies in sorted(by_route.items()):
+            latencies.sort()
+            errors = sum(count for status, count in statuses[route].items() if int(status) >= 500)
+            endpoints[route] = {
+                'requests': len(latencies),
+                'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+                'mean_ms': round(sum(latencies) / len(latencies), 3),
+                'p50_ms': round(percentile(latencies, 0.50), 3),
+                'p95_ms': round(percentile(latencies, 0.95), 3),
+                'p99_ms': round(percentile(latencies, 0.99), 3),
+                'max_ms': round(latencies[-1], 3),
+                'errors': errors,
+                'statuses': dict(statuses[route]),
+            }
+
+        return {
+            'scenario': options['scenario'],
+            'threads': options['threads'],
+            'seed': options['seed'],
+            'database': connection.vendor,
+            'started_at': datetime.now(dt_timezone.utc).isoformat(),
+            'elapsed_s': round(elapsed, 3),
+            'total_requests': len(samples),
+            'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0,
+            'endpoints': endpoints,
+        }
+
+    def report(self, results):
+        header = f'{"endpoint":<34} {"reqs":>6} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"errors":>6}'
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for route, stats in results['endpoints'].items():
+            self.stdout.write(
+                f'{route:<34} {stats["requests"]:>6} {stats["throughput_rps"]:>8.1f} {stats["p50_ms"]:>8.2f} '
+                f'{stats["p95_ms"]:>8.2f} {stats["p99_ms"]:>8.2f} {stats["errors"]:>6}'
+            )
+        self.stdout.write(
+            f'Total: {results["total_requests"]} requests in {results["elapsed_s"]}s '
+            f'({results["throughput_rps"]} req/s)'
+        )
+
+    def compare(self, previous, current):
+        """Print per-endpoint changes against an earlier run."""
+        def change(old, new):
+            return f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+
+        self.stdout.write(f'\nCompared with run from {previous.get("started_at", "unknown")}:')
+        self.stdout.write(f'{"endpoint":<34} {"rps":>9} {"p50":>9} {"p95":>9} {"p99":>9}')
+        for route, stats in current['endpoints'].items():
+            old = previous.get('endpoints', {}).get(route)
+            if not old:
+                self.stdout.write(f'{route:<34} (new)')
+                continue
+            self.stdout.write(
+                f'{route:<34} {change(old["throughput_rps"], stats["throughput_rps"]):>9} '
+                f'{change(old["p50_ms"], stats["p50_ms"]):>9} {change(old["p95_ms"], stats["p95_ms"]):>9} '
+                f'{change(old["p99_ms"], stats["p99_ms"]):>9}'
+            )
+        self.stdout.write(
+            f'{"total":<34} {change(previous.get("throughput_rps", 0), current["throughput_rps"]):>9}'
+        )
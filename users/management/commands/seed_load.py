@@ -0,0 +1,275 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from blogs.models import Blog
+from categories.models import Category
+from comments.models import Comment, PathSegment
+from newsletter.models import NewsletterSubscriber
+from tags.models import Tag
+from users.models import User
+
+
+WORDS = (
+    'query index latency cache request response database django python server '
+    'client thread worker process memory profile benchmark throughput scale shard '
+    'replica backup deploy release feature design pattern module package import '
+    'function class method object string number list dict set tuple loop branch '
+    'error exception retry timeout queue batch stream buffer socket network packet '
+    'the a an of to in on for with and or but not is are was were be been this that '
+    'we you they it our your their here there when where why how what which who'
+).split()
+
+COMMENT_OPENERS = (
+    'Great post,', 'Thanks for writing this.', 'I disagree a little:', 'Quick question:',
+    'This matches what we saw in production.', 'Nice summary.', 'Interesting take.',
+)
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, blogs, comments and subscribers for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--admins', type=int, default=2, help='Number of Admin users')
+        parser.add_argument('--editors', type=int, default=50, help='Number of Editor users')
+        parser.add_argument('--viewers', type=int, default=5000, help='Number of Viewer users')
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--blogs', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--subscribers', type=int, default=100000)
+        parser.add_argument('--draft-ratio', type=float, default=0.1, help='Share of blogs left as drafts')
+        parser.add_argument('--pending-ratio', type=float, default=0.2, help='Share of comments left pending')
+        parser.add_argument('--spam-ratio', type=float, default=0.1, help='Share of comments marked as spam')
+        parser.add_argument('--inactive-ratio', type=float, default=0.1, help='Share of unsubscribed subscribers')
+        parser.add_argument('--days', type=int, default=365, help='Spread timestamps over this many days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed yields the same data')
+        parser.add_argument('--prefix', default='load', help='Prefix for generated emails, names and slugs')
+        parser.add_argument('--password', default='loadtest123', help='Password for every generated user')
+        parser.add_argument('--clear', action='store_true', help='Delete rows from a previous run with this prefix')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        # Anchor timestamps to the start of the day so reruns on the same day match.
+        self.now = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.window = timedelta(days=options['days'])
+
+        if options['clear']:
+            self.clear()
+        elif User.objects.filter(email__startswith=f'{self.prefix}-').exists():
+            raise CommandError(
+                f'Rows with prefix "{self.prefix}" already exist. Use --clear or a different --prefix.'
+            )
+
+        started = time.perf_counter()
+        users = self.create_users(options['admins'], options['editors'], options['viewers'], options['password'])
+        category_ids = self.create_named(Category, 'category', options['categories'])
+        tag_ids = self.create_named(Tag, 'tag', options['tags'])
+        blogs = self.create_blogs(options['blogs'], users['Editor'] + users['Admin'], category_ids, tag_ids,
+                                  options['draft_ratio'])
+        self.create_comments(options['comments'], blogs, users['Viewer'] + users['Editor'],
+                             options['pending_ratio'], options['spam_ratio'])
+        self.create_subscribers(options['subscribers'], options['inactive_ratio'])
+        # Bulk inserts bypass the comment counters, the fingerprint index and
+        # the newsletter audiences and growth rollups.
+        call_command('reconcile_comment_counts', stdout=self.stdout)
+        call_command('rebuild_comment_fingerprints', stdout=self.stdout)
+        call_command('rebuild_newsletter_audiences', stdout=self.stdout)
+        call_command('rebuild_newsletter_stats', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(f'Seeded load data in {time.perf_counter() - started:.1f}s'))
+
+    def clear(self):
+        """Remove data from a previous run with the same prefix."""
+        with transaction.atomic():
+            Blog.objects.filter(slug__startswith=f'{self.prefix}-').delete()
+            User.objects.filter(email__startswith=f'{self.prefix}-').delete()
+            Category.objects.filter(slug__startswith=f'{self.prefix}-').delete()
+            Tag.objects.filter(slug__startswith=f'{self.prefix}-').delete()
+            NewsletterSubscriber.objects.filter(email__startswith=f'{self.prefix}-').delete()
+
+    def random_time(self, after=None):
+        start = after or self.now - self.window
+        span = max((self.now - start).total_seconds(), 1)
+        return start + timedelta(seconds=self.rng.random() * span)
+
+    def text(self, word_count):
+        return ' '.join(self.rng.choices(WORDS, k=word_count))
+
+    def insert(self, model, rows, label):
+        """Insert ``rows`` lazily in batches and report the rate."""
+        started = time.perf_counter()
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch, batch_size=self.batch_size)
+                total += len(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+            total += len(batch)
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(f'  {label}: {total} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)')
+        return total
+
+    def create_users(self, admins, editors, viewers, password):
+        # Hash once; hashing per user would dominate the run.
+        password_hash = make_password(password)
+        counts = {'Admin': admins, 'Editor': editors, 'Viewer': viewers}
+
+        def rows():
+            for role, count in counts.items():
+                for index in range(count):
+                    yield User(
+                        email=f'{self.prefix}-{role.lower()}{index}@example.com',
+                        name=f'{role} {index}',
+                        role=role,
+                        password=password_hash,
+                        is_staff=role == 'Admin',
+                        created_at=self.random_time(),
+                    )
+
+        self.insert(User, rows(), 'users')
+        users = {role: [] for role in counts}
+        for user_id, role in (User.objects.filter(email__startswith=f'{self.prefix}-')
+                              .order_by('id').values_list('id', 'role')):
+            users[role].append(user_id)
+        return users
+
+    def create_named(self, model, kind, count):
+        self.insert(model, (
+            model(name=f'{self.prefix} {kind} {index}', slug=f'{self.prefix}-{kind}-{index}')
+            for index in range(count)
+        ), model._meta.verbose_name_plural.lower())
+        return list(model.objects.filter(slug__startswith=f'{self.prefix}-').order_by('id')
+                    .values_list('id', flat=True))
+
+    def create_blogs(self, count, author_ids, category_ids, tag_ids, draft_ratio):
+        if count and not (author_ids and category_ids):
+            raise CommandError('Blogs need at least one editor or admin and one category.')
+
+        def rows():
+            for index in range(count):
+                # Post length is log-normal: most posts are short, a few are very long.
+                word_count = min(max(int(self.rng.lognormvariate(6.5, 0.6)), 60), 6000)
+                paragraphs = []
+                while word_count > 0:
+                    size = min(word_count, self.rng.randint(40, 120))
+                    paragraphs.append(f'<p>{self.text(size)}</p>')
+                    word_count -= size
+                title = f'{self.text(self.rng.randint(3, 8)).capitalize()} {index}'
+                created_at = self.random_time()
+                published = self.rng.random() >= draft_ratio
+                yield Blog(
+                    title=title[:200],
+                    slug=f'{self.prefix}-blog-{index}',
+                    content='\n'.join(paragraphs),
+                    category_id=self.rng.choice(category_ids),
+                    author_id=self.rng.choice(author_ids),
+                    status='published' if published else 'draft',
+                    meta_title=title[:60],
+                    meta_description=self.text(20)[:160],
+                    created_at=created_at,
+                    published_at=self.random_time(created_at) if published else None,
+                )
+
+        self.insert(Blog, rows(), 'blogs')
+        blogs = list(Blog.objects.filter(slug__startswith=f'{self.prefix}-').order_by('id')
+                     .values_list('id', 'status', 'published_at'))
+
+        if tag_ids:
+            through = Blog.tags.through
+            # A few tags are very popular, most are rarely used.
+            tag_weights = [1 / (rank + 1) for rank in range(len(tag_ids))]
+
+            def tag_rows():
+                for blog_id, _, _ in blogs:
+                    picked = set(self.rng.choices(tag_ids, weights=tag_weights, k=self.rng.randint(1, 5)))
+                    for tag_id in picked:
+                        yield through(blog_id=blog_id, tag_id=tag_id)
+
+            self.insert(through, tag_rows(), 'blog tags')
+
+        return [(blog_id, published_at) for blog_id, status, published_at in blogs if status == 'published']
+
+    def create_comments(self, count, published_blogs, user_ids, pending_ratio, spam_ratio):
+        if not count:
+            return
+        if not (published_blogs and user_ids):
+            raise CommandError('Comments need at least one published blog and one user.')
+
+        # Popular posts attract most of the discussion.
+        cum_weights = []
+        running = 0.0
+        for rank in range(len(published_blogs)):
+            running += 1 / (rank + 1) ** 0.8
+            cum_weights.append(running)
+        shuffled = list(published_blogs)
+        self.rng.shuffle(shuffled)
+
+        # Generating text dominates at this volume, so draw bodies from a pool.
+        bodies = [
+            f'{self.rng.choice(COMMENT_OPENERS)} {self.text(self.rng.randint(5, 80))}'[:1000]
+            for _ in range(min(count, 10000))
+        ]
+
+        def rows():
+            remaining = count
+            while remaining:
+                size = min(remaining, self.batch_size)
+                remaining -= size
+                for blog_id, published_at in self.rng.choices(shuffled, cum_weights=cum_weights, k=size):
+                    roll = self.rng.random()
+                    if roll < spam_ratio:
+                        status = 'spam'
+                    elif roll < spam_ratio + pending_ratio:
+                        status = 'pending'
+                    else:
+                        status = 'approved'
+                    address = self.rng.getrandbits(24)
+                    yield Comment(
+                        blog_id=blog_id,
+                        user_id=self.rng.choice(user_ids),
+                        content=self.rng.choice(bodies),
+                        status=status,
+                        created_at=self.random_time(published_at),
+                        ip_address=f'10.{address >> 16}.{(address >> 8) & 255}.{address & 255}',
+                        user_agent='seed_load',
+                    )
+
+        self.insert(Comment, rows(), 'comments')
+        self.fill_comment_paths()
+
+    def fill_comment_paths(self):
+        """Give the generated comments their thread path; they are all roots."""
+        with transaction.atomic():
+            Comment.objects.filter(blog__slug__startswith=f'{self.prefix}-', path='').update(path=PathSegment('id'))
+
+    def create_subscribers(self, count, inactive_ratio):
+        def rows():
+            for index in range(count):
+                subscribed = self.random_time()
+                active = self.rng.random() >= inactive_ratio
+                yield NewsletterSubscriber(
+                    email=f'{self.prefix}-sub{index}@example.com',
+                    is_active=active,
+                    subscription_date=subscribed,
+                    unsubscribed_at=None if active else self.random_time(subscribed),
+                )
+
+        self.insert(NewsletterSubscriber, rows(), 'newsletter subscribers')
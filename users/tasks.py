@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import send_mail
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from jobs.queue import task
+
+
+@task
+def send_password_reset(email):
+    """Mail a password reset link to the active user with this email, if any."""
+    user = get_user_model().objects.filter(email=email, is_active=True).first()
+    if user is None:
+        return
+
+    token = default_token_generator.make_token(user)
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    reset_url = f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}/"
+
+    message = f'''
+    Hi {user.name},
+
+    You requested a password reset for your account.
+
+    Click the link below to reset your password:
+    {reset_url}
+
+    If you didn't request this, please ignore this email.
+
+    Best regards,
+    Blog System Team
+    '''
+    send_mail('Password Reset Request', message, settings.DEFAULT_FROM_EMAIL, [email], fail_silently=False)
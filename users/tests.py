@@ -1,3 +1,135 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase
+
+from blog_system.testing import EndpointPerformanceTestCase, SEED_PASSWORD, expand_cases
+from blogs.models import Blog
+from comments.models import Comment
+from newsletter.models import NewsletterSubscriber
+from .management.commands.bench import percentile
+from .models import User
+
+
+class UserEndpointPerformanceTests(EndpointPerformanceTestCase):
+    """Query-count and serializer-time regression tests for the users API"""
+
+    def get_cases(self):
+        viewer = self.data['users']['viewer']
+        expected = {
+            # name: method, path, data, {role: (status, queries)}
+            'users:users-root': ('GET', '/api/users/', None, {
+                'anonymous': (200, 0), 'viewer': (200, 0), 'editor': (200, 0), 'admin': (200, 0),
+            }),
+            'users:register': ('POST', '/api/users/register/', {
+                'name': 'New Reader', 'email': 'new.user@perf.test',
+                'password': 'Str0ng-pass-9876', 'password_confirm': 'Str0ng-pass-9876',
+            }, {
+                'anonymous': (201, 2), 'viewer': (201, 2), 'editor': (201, 2), 'admin': (201, 2),
+            }),
+            'users:login': ('POST', '/api/users/login/', {'email': viewer.email, 'password': SEED_PASSWORD}, {
+                'anonymous': (200, 2), 'viewer': (200, 2), 'editor': (200, 2), 'admin': (200, 2),
+            }),
+            'users:logout': ('POST', '/api/users/logout/', {}, {
+                'anonymous': (401, 0), 'viewer': (200, 0), 'editor': (200, 0), 'admin': (200, 0),
+            }),
+            'users:profile': ('GET', '/api/users/profile/', None, {
+                'anonymous': (401, 0), 'viewer': (200, 0), 'editor': (200, 0), 'admin': (200, 0),
+            }),
+            'users:profile (update)': ('PATCH', '/api/users/profile/', {'name': 'Renamed Reader'}, {
+                'anonymous': (401, 0), 'viewer': (200, 1), 'editor': (200, 1), 'admin': (200, 1),
+            }),
+            'users:change-password': ('POST', '/api/users/change-password/', {
+                'old_password': SEED_PASSWORD,
+                'new_password': 'An0ther-pass-5678', 'new_password_confirm': 'An0ther-pass-5678',
+            }, {
+                'anonymous': (401, 0), 'viewer': (200, 1), 'editor': (200, 1), 'admin': (200, 1),
+            }),
+            'users:password-reset': ('POST', '/api/users/password-reset/', {'email': viewer.email}, {
+                'anonymous': (200, 1), 'viewer': (200, 1), 'editor': (200, 1), 'admin': (200, 1),
+            }),
+            'users:password-reset-confirm': ('POST', '/api/users/password-reset-confirm/', {
+                'uid': 'invalid', 'token': 'invalid',
+                'new_password': 'An0ther-pass-5678', 'new_password_confirm': 'An0ther-pass-5678',
+            }, {
+                'anonymous': (400, 0), 'viewer': (400, 0), 'editor': (400, 0), 'admin': (400, 0),
+            }),
+            'users:user-list': ('GET', '/api/users/list/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 2),
+            }),
+            'users:user-detail': ('GET', f'/api/users/{viewer.pk}/', None, {
+                'anonymous': (401, 0), 'viewer': (403, 0), 'editor': (403, 0), 'admin': (200, 1),
+            }),
+        }
+        return expand_cases(expected)
+
+
+class SeedLoadCommandTests(TestCase):
+    """Tests for the seed_load management command"""
+
+    def seed(self, **options):
+        defaults = {
+            'admins': 1, 'editors': 3, 'viewers': 10, 'categories': 3, 'tags': 5,
+            'blogs': 20, 'comments': 60, 'subscribers': 25, 'batch_size': 7, 'stdout': StringIO(),
+        }
+        defaults.update(options)
+        call_command('seed_load', **defaults)
+
+    def test_creates_requested_volumes(self):
+        self.seed(prefix='vol')
+
+        self.assertEqual(User.objects.filter(email__startswith='vol-', role='Viewer').count(), 10)
+        self.assertEqual(Blog.objects.filter(slug__startswith='vol-').count(), 20)
+        self.assertEqual(Comment.objects.filter(user__email__startswith='vol-').count(), 60)
+        self.assertEqual(NewsletterSubscriber.objects.filter(email__startswith='vol-').count(), 25)
+        self.assertFalse(Comment.objects.exclude(blog__status='published').exists())
+
+    def test_same_seed_generates_same_content(self):
+        self.seed(prefix='one', seed=7)
+        self.seed(prefix='two', seed=7)
+
+        def titles(prefix):
+            return list(Blog.objects.filter(slug__startswith=f'{prefix}-').order_by('id').values_list('title', 'status'))
+
+        self.assertEqual(titles('one'), titles('two'))
+
+    def test_refuses_to_reuse_prefix_without_clear(self):
+        self.seed(prefix='dup')
+        with self.assertRaises(CommandError):
+            self.seed(prefix='dup')
+
+        self.seed(prefix='dup', clear=True)
+        self.assertEqual(Blog.objects.filter(slug__startswith='dup-').count(), 20)
+
+
+class BenchCommandTests(TransactionTestCase):
+    """Tests for the bench management command"""
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.50), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([], 0.95), 0.0)
+
+    def test_writes_results_and_cleans_up(self):
+        call_command('seed_load', admins=1, editors=2, viewers=5, categories=2, tags=3, blogs=10,
+                     comments=20, subscribers=5, stdout=StringIO())
+        pending = Comment.objects.filter(status='pending').count()
+        handle, output = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, output)
+
+        call_command('bench', scenario='mixed', threads=2, duration=0.5, warmup=2, output=output, stdout=StringIO())
+
+        with open(output) as results_file:
+            results = json.load(results_file)
+        self.assertEqual(results['scenario'], 'mixed')
+        self.assertGreater(results['total_requests'], 0)
+        for stats in results['endpoints'].values():
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertFalse(Blog.objects.filter(title__startswith='Bench run').exists())
+        self.assertEqual(Comment.objects.filter(status='pending').count(), pending)
@@ -5,10 +5,8 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.utils.encoding import force_bytes, force_str
-from django.core.mail import send_mail
-from django.conf import settings
+from django.utils.http import urlsafe_base64_decode
+from django.utils.encoding import force_str
 from django_ratelimit.decorators import ratelimit
 from django.utils.decorators import method_decorator
 from .serializers import (
@@ -21,6 +19,8 @@ from .serializers import (
     PasswordResetConfirmSerializer
 )
 from .permissions import IsAdminUser
+from .tasks import send_password_reset
+from jobs.queue import enqueue
 
 User = get_user_model()
 
@@ -132,42 +132,8 @@ class PasswordResetRequestView(APIView):
         if serializer.is_valid():
             email = serializer.validated_data['email']
             
-            try:
-                user = User.objects.get(email=email, is_active=True)
-                
-                # Generate reset token
-                token = default_token_generator.make_token(user)
-                uid = urlsafe_base64_encode(force_bytes(user.pk))
-                
-                # Create reset URL
-                reset_url = f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}/"
-                
-                # Send email
-                subject = 'Password Reset Request'
-                message = f'''
-                Hi {user.name},
-                
-                You requested a password reset for your account.
-                
-                Click the link below to reset your password:
-                {reset_url}
-                
-                If you didn't request this, please ignore this email.
-                
-                Best regards,
-                Blog System Team
-                '''
-                
-                send_mail(
-                    subject,
-                    message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [email],
-                    fail_silently=False,
-                )
-                
-            except User.DoesNotExist:
-                pass  # Don't reveal if email exists
+            # Mailed by a background worker
+            enqueue(send_password_reset, email=email)
             
             return Response({
                 'message': 'If the email exists, a password reset link has been sent.'